@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from angles import ANGLE_NAMES, NUM_ANGLES
+from reference import parse_clip_name
+'''
+評分結果的分析資料庫 (SQLite): 每次評分存一筆, 並即時更新每個打者/球季/九宮格位置的統計
+
+    sessions    每次評分一列: 打者、球季、位置、時間、grade、similarity、12 個角度差 (delta_0..11)、使用者的 12 個角度
+    aggregates  (player, season, position) 的累計統計, position 0 為所有位置、season '*' 為所有球季;
+                存 n、時間的平均/平方差和, 以及 STATS (grade, similarity, 12 個角度差) 的平均、平方差和、與時間的共變和,
+                新的一批結果用 Chan 的合併公式併進去 (Welford 的批次版), 不用重新掃過 sessions
+
+dashboard 查平均、標準差、趨勢 (每 30 天的變化, 最小平方法的斜率) 只讀 aggregates, 與評過幾次無關
+
+    python analytics.py summary [--player tsai] [--season 2026] [--position 5]
+    python analytics.py history --player tsai [--position 5]
+    python analytics.py import grades.jsonl       # 匯入 batch_grade.py 之前的輸出
+'''
+ANALYTICS_PATH = os.environ.get('SWING_ANALYTICS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics.db'))
+STATS = ['grade', 'similarity'] + ['delta ' + name for name in ANGLE_NAMES]
+ALL_SEASONS = '*'
+ALL_POSITIONS = 0
+TREND_DAYS = 30
+
+_DELTAS = ['delta_{}'.format(i) for i in range(NUM_ANGLES)]
+_SESSION_COLUMNS = ['player', 'season', 'position', 'standard', 'reference', 'file', 'graded_at', 'frame',
+                    'grade', 'similarity', 'sequence_grade'] + _DELTAS + ['angles']
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL, season TEXT NOT NULL, position INTEGER NOT NULL, standard INTEGER, reference TEXT,
+    file TEXT, graded_at REAL NOT NULL, frame INTEGER, grade REAL NOT NULL, similarity REAL NOT NULL,
+    sequence_grade REAL, {deltas}, angles BLOB
+);
+CREATE INDEX IF NOT EXISTS sessions_player ON sessions (player, position, graded_at);
+CREATE TABLE IF NOT EXISTS aggregates (
+    player TEXT NOT NULL, season TEXT NOT NULL, position INTEGER NOT NULL,
+    n INTEGER NOT NULL, first_at REAL NOT NULL, last_at REAL NOT NULL,
+    mean_t REAL NOT NULL, m2_t REAL NOT NULL, mean BLOB NOT NULL, m2 BLOB NOT NULL, comoment BLOB NOT NULL,
+    PRIMARY KEY (player, season, position)
+);
+'''.format(deltas=', '.join(name + ' REAL' for name in _DELTAS))
+
+
+def _timestamp(date):
+    """'2026-04-01' / ISO 時間 / unix 秒數 -> unix 秒數; None 為現在"""
+    if date is None:
+        return time.time()
+    if isinstance(date, (int, float)):
+        return float(date)
+    return datetime.fromisoformat(date).timestamp()
+
+
+def session_row(result):
+    """batch_grade / serve 的結果 dict -> sessions 的一列; 沒有 player 時用檔名的前綴 (tsai_5.npy -> tsai)"""
+    graded_at = _timestamp(result.get('date'))
+    player = result.get('player') or parse_clip_name(os.path.splitext(os.path.basename(result.get('file') or ''))[0])[0]
+    deltas = {comment['angle']: comment['delta_theta'] for comment in result['comments']}
+    angles = result.get('angles')
+    return [
+        player or 'unknown', str(result.get('season') or datetime.fromtimestamp(graded_at).year),
+        result.get('position') or ALL_POSITIONS, result.get('standard'), result.get('reference'), result.get('file'),
+        graded_at, result.get('frame'), result['grade'], result['similarity'], result.get('sequence_grade'),
+    ] + [deltas[name] for name in ANGLE_NAMES] + [np.asarray(angles, dtype=np.float64).tobytes() if angles else None]
+
+
+def batch_moments(t, x):
+    """一批 (n,) 時間 (天) 與 (n, len(STATS)) 數值 -> 與 aggregates 同樣欄位的 dict"""
+    mean_t, mean = t.mean(), x.mean(axis=0)
+    dt, dx = t - mean_t, x - mean
+    return {'n': len(t), 'first_at': t.min(), 'last_at': t.max(), 'mean_t': mean_t, 'm2_t': dt @ dt,
+            'mean': mean, 'm2': np.einsum('ij,ij->j', dx, dx), 'comoment': dt @ dx}
+
+
+def merge_moments(a, b):
+    """Chan et al. 的平行合併: 兩組 (n, 平均, 平方差和, 共變和) 合成一組, 結果與整批重算相同"""
+    n = a['n'] + b['n']
+    w = a['n'] * b['n'] / n
+    delta_t, delta = b['mean_t'] - a['mean_t'], b['mean'] - a['mean']
+    return {'n': n, 'first_at': min(a['first_at'], b['first_at']), 'last_at': max(a['last_at'], b['last_at']),
+            'mean_t': a['mean_t'] + delta_t * b['n'] / n, 'm2_t': a['m2_t'] + b['m2_t'] + delta_t ** 2 * w,
+            'mean': a['mean'] + delta * b['n'] / n, 'm2': a['m2'] + b['m2'] + delta ** 2 * w,
+            'comoment': a['comoment'] + b['comoment'] + delta_t * delta * w}
+
+
+def describe(moments):
+    """累計統計 -> 平均、標準差 (樣本)、趨勢 (每 TREND_DAYS 天的變化), 以 STATS 的名稱為 key; 算不出來的為 None"""
+    n = moments['n']
+    std = np.sqrt(moments['m2'] / (n - 1)) if n > 1 else np.full(len(STATS), np.nan)
+    trend = moments['comoment'] / moments['m2_t'] * TREND_DAYS if moments['m2_t'] > 0 else np.full(len(STATS), np.nan)
+    values = lambda *columns: [float(v) if np.isfinite(v) else None for v in columns]
+    return {name: dict(zip(('mean', 'std', 'trend'), values(mean, s, slope)))
+            for name, mean, s, slope in zip(STATS, moments['mean'], std, trend)}
+
+
+class AnalyticsStore:
+    def __init__(self, path=ANALYTICS_PATH):
+        self.path = path
+        # serve.py 的多個 worker 共用一個連線, 寫入用 lock 排隊
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, results):
+        """存一批評分結果 (失敗的略過) 並更新 aggregates, 同一個 transaction; 回傳存了幾筆"""
+        rows = [session_row(result) for result in results if 'error' not in result and 'grade' in result]
+        if not rows:
+            return 0
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO sessions ({}) VALUES ({})'.format(
+                ', '.join(_SESSION_COLUMNS), ', '.join('?' * len(_SESSION_COLUMNS))), rows)
+            self._aggregate(rows)
+        return len(rows)
+
+    def _aggregate(self, rows):
+        """rows 為 sessions 的列, 每列更新 4 個 key: (球季, 位置)、(球季, 全部)、(全部, 位置)、(全部, 全部)"""
+        t = np.array([row[6] for row in rows]) / 86400
+        x = np.array([row[8:10] + row[11:11 + NUM_ANGLES] for row in rows], dtype=np.float64)
+        groups = {}
+        for i, (player, season, position) in enumerate(row[:3] for row in rows):
+            keys = ((player, season, position), (player, season, ALL_POSITIONS),
+                    (player, ALL_SEASONS, position), (player, ALL_SEASONS, ALL_POSITIONS))
+            for key in dict.fromkeys(keys):   # 沒有位置 (best_match) 時 position 本來就是 0, 不要算兩次
+                groups.setdefault(key, []).append(i)
+        for key, index in groups.items():
+            moments = batch_moments(t[index], x[index])
+            stored = self._load(key)
+            if stored is not None:
+                moments = merge_moments(stored, moments)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                key + (moments['n'], moments['first_at'] * 86400, moments['last_at'] * 86400, moments['mean_t'],
+                       moments['m2_t'], moments['mean'].tobytes(), moments['m2'].tobytes(), moments['comoment'].tobytes()))
+
+    def _load(self, key):
+        row = self.connection.execute('SELECT * FROM aggregates WHERE player = ? AND season = ? AND position = ?',
+                                      key).fetchone()
+        return None if row is None else self._moments(row)
+
+    @staticmethod
+    def _moments(row):
+        return {'n': row[3], 'first_at': row[4] / 86400, 'last_at': row[5] / 86400, 'mean_t': row[6], 'm2_t': row[7],
+                'mean': np.frombuffer(row[8]), 'm2': np.frombuffer(row[9]), 'comoment': np.frombuffer(row[10])}
+
+    def summary(self, player=None, season=ALL_SEASONS, position=ALL_POSITIONS):
+        """只讀 aggregates; player/season/position 為 None 時不篩選"""
+        where, params = [], []
+        for column, value in (('player', player), ('season', season), ('position', position)):
+            if value is not None:
+                where.append(column + ' = ?')
+                params.append(value)
+        query = 'SELECT * FROM aggregates' + (' WHERE ' + ' AND '.join(where) if where else '')
+        summaries = []
+        for row in self.connection.execute(query + ' ORDER BY player, season, position', params):
+            moments = self._moments(row)
+            summaries.append({'player': row[0], 'season': row[1], 'position': row[2], 'n': row[3],
+                              'first_at': row[4], 'last_at': row[5], 'stats': describe(moments)})
+        return summaries
+
+    def history(self, player, position=None, season=None, limit=None):
+        """某個打者依時間排序的每次評分: [{graded_at, position, grade, similarity, deltas (12,)}]"""
+        query = 'SELECT graded_at, position, grade, similarity, {} FROM sessions WHERE player = ?'.format(', '.join(_DELTAS))
+        params = [player]
+        for column, value in (('position', position), ('season', season)):
+            if value is not None:
+                query += ' AND {} = ?'.format(column)
+                params.append(value)
+        query += ' ORDER BY graded_at' + (' LIMIT {:d}'.format(limit) if limit else '')
+        return [{'graded_at': row[0], 'position': row[1], 'grade': row[2], 'similarity': row[3],
+                 'deltas': np.array(row[4:])} for row in self.connection.execute(query, params)]
+
+    def rescore(self, rubric):
+        """用新的評分規則 (scoring.Rubric) 重評所有紀錄的 grade/similarity, 再重算 aggregates; 回傳 session 數"""
+        rows = self.connection.execute('SELECT id, {} FROM sessions'.format(', '.join(_DELTAS))).fetchall()
+        if not rows:
+            return 0
+        rows = np.array(rows, dtype=np.float64)
+        scores = rubric.score(rows[:, 1:])
+        with self.lock, self.connection:
+            self.connection.executemany('UPDATE sessions SET grade = ?, similarity = ? WHERE id = ?', zip(
+                scores['grade'].tolist(), scores['similarity'].tolist(), rows[:, 0].astype(int).tolist()))
+        return self.rebuild()
+
+    def rebuild(self, chunk_size=10000):
+        """由 sessions 重算 aggregates (例如手動刪過 sessions 之後), 回傳 session 數"""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM aggregates')
+            cursor = self.connection.execute('SELECT {} FROM sessions ORDER BY id'.format(', '.join(_SESSION_COLUMNS)))
+            count = 0
+            while True:
+                rows = [list(row) for row in cursor.fetchmany(chunk_size)]
+                if not rows:
+                    return count
+                self._aggregate(rows)
+                count += len(rows)
+
+
+def _format(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def print_summary(summaries, top=3):
+    print('{:<12}{:<8}{:>4}{:>7}{:>16}{:>14}   {}'.format(
+        'player', 'season', 'pos', 'n', 'grade', 'trend/{}d'.format(TREND_DAYS), 'largest mean deltas'))
+    for summary in summaries:
+        stats = summary['stats']
+        deltas = sorted(STATS[2:], key=lambda name: -abs(stats[name]['mean']))[:top]
+        print('{:<12}{:<8}{:>4}{:>7}{:>9.1f} ±{:>5}{:>14}   {}'.format(
+            summary['player'], summary['season'], summary['position'] or 'all', summary['n'],
+            stats['grade']['mean'], _format(stats['grade']['std'], '.1f'), _format(stats['grade']['trend'], '+.2f'),
+            ', '.join('{} {:+.1f}'.format(name[6:], stats[name]['mean']) for name in deltas)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Grading analytics store')
+    parser.add_argument('--db', default=ANALYTICS_PATH, type=str)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary = subparsers.add_parser('summary', help='per player / season / position mean, std and trend')
+    history = subparsers.add_parser('history', help='every graded session of one player')
+    for sub in (summary, history):
+        sub.add_argument('--player', default=None, type=str, required=sub is history)
+        sub.add_argument('--season', default=None, type=str)
+        sub.add_argument('--position', default=None, type=int)
+    summary.add_argument('--json', action='store_true')
+    history.add_argument('--limit', default=None, type=int)
+    load = subparsers.add_parser('import', help='append batch_grade.py .jsonl results')
+    load.add_argument('jsonl', nargs='+')
+    load.add_argument('--player', default=None, type=str, help='player for rows without one')
+    subparsers.add_parser('rebuild', help='recompute the aggregates from the sessions table')
+    return parser.parse_args()
+
+
+def main(args):
+    with AnalyticsStore(args.db) as store:
+        if args.command == 'summary':
+            summaries = store.summary(args.player, args.season or ALL_SEASONS,
+                                      ALL_POSITIONS if args.position is None else args.position)
+            if args.json:
+                print(json.dumps(summaries, indent=1))
+            else:
+                print_summary(summaries)
+        elif args.command == 'history':
+            for session in store.history(args.player, args.position, args.season, args.limit):
+                print('{}  position {}  grade {:6.2f}  similarity {:6.2f}'.format(
+                    datetime.fromtimestamp(session['graded_at']).isoformat(' ', 'seconds'), session['position'],
+                    session['grade'], session['similarity']))
+        elif args.command == 'import':
+            count = 0
+            for path in args.jsonl:
+                with open(path) as f:
+                    results = [json.loads(line) for line in f if line.strip()]
+                if args.player:
+                    for result in results:
+                        if not result.get('player'):   # batch_grade 沒給 --player 時寫的是 null
+                            result['player'] = args.player
+                count += store.record(results)
+            print('imported {} sessions'.format(count))
+        else:
+            print('rebuilt aggregates from {} sessions'.format(store.rebuild()))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
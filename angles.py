@@ -0,0 +1,62 @@
+import numpy as np
+
+from profiling import profiled
+'''
+整段影片一次算完 12 個角度的向量化版本, 結果與 grade.calculate_angle 相同
+
+每個角度都是 BA 與 BC 的夾角 (B 為頂點), A、B 是關節點,
+C 則由三個關節各取一個座標軸組成 (x 取自 cx, y 取自 cy, z 取自 cz),
+一般的三關節角 C 三個軸都取同一個關節, 旋轉/傾斜角則是投影出來的輔助點
+'''
+#                     name                 A   B   (cx, cy, cz)
+ANGLE_TABLE = [
+    ("right shoulder",    8, 14, (15, 15, 15)),  # thorax, right shoulder, right elbow
+    ("right elbow",      14, 15, (16, 16, 16)),  # right shoulder, right elbow, right wrist
+    ("left shoulder",     8, 11, (12, 12, 12)),  # thorax, left shoulder, left elbow
+    ("left elbow",       11, 12, (13, 13, 13)),  # left shoulder, left elbow, left wrist
+    ("right hip",        14,  1, ( 2,  2,  2)),  # right shoulder, right hip, right knee
+    ("left hip",         11,  4, ( 5,  5,  5)),  # left shoulder, left hip, left knee
+    ("right knee",        1,  2, ( 3,  3,  3)),  # right hip, right knee, right foot
+    ("left knee",         4,  5, ( 6,  6,  6)),  # left hip, left knee, left foot
+    ("hip rotation",      4,  1, ( 1,  4,  4)),  # x of right hip(1), y and z of left hip(4)
+    ("shoulder rotation",11, 14, (14, 11, 11)),  # x of right shoulder(14), y and z of left shoulder(11)
+    ("body side angle",   8,  0, ( 8,  8,  0)),  # x and y of thorax(8), z of hip(0)
+    ("body lean angle",   8,  0, ( 0,  8,  8)),  # x of hip(0), y and z of thorax(8)
+]
+
+ANGLE_NAMES = [row[0] for row in ANGLE_TABLE]
+NUM_ANGLES = len(ANGLE_TABLE)
+
+# 預先展開成 index array, 之後每次只需要做 fancy indexing
+_A = np.array([row[1] for row in ANGLE_TABLE])
+_B = np.array([row[2] for row in ANGLE_TABLE])
+_C = np.array([row[3] for row in ANGLE_TABLE])        # (12, 3)
+_AXES = np.arange(3)
+
+
+@profiled('angles')
+def calculate_angles(coordinates, dtype=np.float64):
+    """(..., 17, 3) 的關節座標 -> (..., 12) 的角度(度), 可以是單幀、整段影片或 (N, T, 17, 3)"""
+    coordinates = np.asarray(coordinates, dtype=dtype)
+    A = coordinates[..., _A, :]                          # (..., 12, 3)
+    B = coordinates[..., _B, :]
+    C = coordinates[..., _C, _AXES]                      # 每個軸各自挑關節
+    BA = A - B
+    BC = C - B
+    dot_product = np.einsum('...k,...k->...', BA, BC)
+    norm_BA = np.sqrt(np.einsum('...k,...k->...', BA, BA))
+    norm_BC = np.sqrt(np.einsum('...k,...k->...', BC, BC))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_theta = dot_product / (norm_BA * norm_BC)
+    cos_theta = np.clip(cos_theta, -1.0, 1.0)
+    return np.degrees(np.arccos(cos_theta))
+
+
+def pad_clips(clips):
+    """把長度不同的 (T, 17, 3) 影片補成 (N, T_max, 17, 3), 不足的部分重複最後一幀, 並回傳每段的長度"""
+    lengths = np.array([len(clip) for clip in clips])
+    batch = np.empty((len(clips), lengths.max()) + np.shape(clips[0])[1:], dtype=np.result_type(*clips))
+    for n, clip in enumerate(clips):
+        batch[n, :len(clip)] = clip
+        batch[n, len(clip):] = clip[-1]
+    return batch, lengths
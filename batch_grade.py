@@ -0,0 +1,248 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from analytics import ANALYTICS_PATH, AnalyticsStore
+from angles import ANGLE_NAMES, calculate_angles
+from grade import calculate_angle, grade
+from keyframe import detect_key_frame
+from nearest import INDEX_PATH, build_index, load_index, search
+from normalize import normalize_clip
+from pose_clip import load_coordinates
+from profiling import PROFILE_PATH, PROFILER, finish_profile, span
+from reference import LIBRARY_DIR, PLAYERS, load_library, get_clip
+from scoring import load_rubric
+from sequence import PHASES, grade_sequence
+from smoothing import METHODS, repair_coordinates
+'''
+不需要互動的批次評分: 一次評整個資料夾的 .npy (VideoPose3D 輸出的 (T, 17, 3)) 或 .pose
+
+manifest 為 CSV 或 JSONL, 每一列一個檔案:
+    file,position,frame,standard
+    tsai_1.npy,1,212,1
+    willy.npy,5,,2            <- frame 空白時用 .pose 裡的關鍵幀或 keyframe 自動偵測, standard 空白時用 --standard
+選填的 player、date (ISO 日期) 欄位給 --analytics 用: 誰打的、哪一天練的
+'''
+_library = None   # 每個 worker process 開一次 reference 資料庫
+_index = None     # --best-match 用的最近鄰索引
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batch swing grading')
+    parser.add_argument('input_dir', help='directory of user .npy / .pose files')
+    parser.add_argument('--manifest', default=None, type=str, help='CSV or JSONL with file, position, frame, standard[, player, date]')
+    parser.add_argument('--output', default='grades.jsonl', type=str, help='.jsonl or .csv (default: grades.jsonl)')
+    parser.add_argument('--standard', default=1, type=int, choices=sorted(PLAYERS), help='1: Ohtani, 2: Judge')
+    parser.add_argument('--position', default=None, type=int, help='position for files missing from the manifest')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--library-dir', default=LIBRARY_DIR, type=str)
+    parser.add_argument('--sequence', action='store_true', help='also score the whole swing with DTW (with --best-match: against the top 3 matches, keeping the closest swing)')
+    parser.add_argument('--best-match', action='store_true', help='grade against the closest reference frame of any player/position')
+    parser.add_argument('--index', default=INDEX_PATH, type=str, help='nearest-reference index for --best-match')
+    parser.add_argument('--smooth', default=None, choices=METHODS, help='repair dropped / broken 3D frames before grading')
+    parser.add_argument('--normalize', action='store_true',
+                        help='compare in the canonical batter frame (normalize.py) instead of camera coordinates')
+    parser.add_argument('--analytics', nargs='?', default=None, const=ANALYTICS_PATH, type=str,
+                        help='append the results to the analytics store (analytics.py, default {})'.format(ANALYTICS_PATH))
+    parser.add_argument('--rubric', default=None, type=str, help='scoring rubric JSON (scoring.py, default: built-in)')
+    parser.add_argument('--player', default=None, type=str,
+                        help='hitter for files missing from the manifest (default: file name prefix, tsai_5.npy -> tsai)')
+    parser.add_argument('--profile', nargs='?', default=None, const=PROFILE_PATH, type=str,
+                        help='time every stage in every worker (profiling.py): summary table + Chrome trace (default {})'.format(PROFILE_PATH))
+    return parser.parse_args()
+
+
+def read_manifest(path):
+    """回傳 {檔名: row}, 空白欄位視為沒有給"""
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    manifest = {}
+    for row in rows:
+        row = {key: value for key, value in row.items() if value not in (None, '')}
+        manifest[os.path.basename(row['file'])] = row
+    return manifest
+
+
+def make_jobs(args):
+    manifest = read_manifest(args.manifest) if args.manifest else {}
+    jobs = []
+    paths = glob.glob(os.path.join(args.input_dir, '*.npy')) + glob.glob(os.path.join(args.input_dir, '*.pose'))
+    for path in sorted(paths):
+        row = manifest.get(os.path.basename(path), {})
+        position = row.get('position', args.position)
+        if position is None and not args.best_match:
+            print('Skipping {}: no position in manifest'.format(path), file=sys.stderr)
+            continue
+        job = {
+            'file': path,
+            'player': row.get('player', args.player),
+            'standard': int(row.get('standard', args.standard)),
+            'position': int(position) if position is not None else None,
+            'frame': int(row['frame']) if 'frame' in row else None,   # 實際偵數, 從 1 開始
+            'sequence': args.sequence,
+            'best_match': args.best_match,
+            'smooth': args.smooth,
+            'normalize': args.normalize,
+            'rubric': args.rubric,
+        }
+        if 'date' in row:   # 補登以前的練習, analytics 依這個日期算趨勢
+            job['date'] = row['date']
+        jobs.append(job)
+    return jobs
+
+
+def init_worker(library_dir, index_path, profile=False):
+    global _library, _index
+    if profile:
+        PROFILER.enable()
+    _library = load_library(library_dir)
+    if index_path is not None:
+        _index = load_index(index_path)
+
+
+def grade_coordinates(coordinates_2, header, job, library, index=None):
+    """
+    評一段使用者骨架, job 的欄位同 make_jobs; serve.py 也用這個函式
+    回傳 (結果欄位, grade() 的原始評語), 原始評語給 report.ReportRenderer 用
+    """
+    result = {}
+    if job.get('smooth'):
+        coordinates_2, report = repair_coordinates(coordinates_2, method=job['smooth'], fps=header.get('fps') or 30.0)
+        result['repaired_frames'] = report['repaired_frames']
+    if job['frame'] is None and 'contact' in header.get('key_frames', {}):
+        frame_index_2 = header['key_frames']['contact']
+        result.update(frame=frame_index_2 + 1, frame_source='header')
+    elif job['frame'] is None:
+        frame_index_2, confidence = detect_key_frame(coordinates_2)
+        result.update(frame=frame_index_2 + 1, frame_source='detected', confidence=confidence)
+    else:
+        frame_index_2 = job['frame'] - 1
+        result.update(frame=job['frame'], frame_source='manifest')
+    if job['best_match']:
+        # 索引是用相機座標建的, 搜尋一律用原始座標
+        matches = search(index, calculate_angles(coordinates_2[frame_index_2]), coordinates_2[frame_index_2], k=3)
+        candidates = [(match['name'], match['frame']) for match in matches]
+        result['matches'] = matches
+    else:
+        candidates = [(library['index'][(PLAYERS[job['standard']], job['position'])], None)]
+    if job.get('normalize'):
+        coordinates_2 = normalize_clip(coordinates_2)[0]
+
+    rubric = load_rubric(job.get('rubric'))
+    sequence = None
+    reference, frame_index_1 = candidates[0]
+    if job['sequence']:
+        # 每個候選都比整段揮棒, 取 DTW 平均成本最小的; 目前最小的平均成本當 abandon, 比它差的候選算到一半就放棄
+        angles_2 = calculate_angles(coordinates_2)
+        for name, frame_index in candidates:
+            _, angles_1, key_frame_1 = get_clip(library, name, job.get('normalize', False))
+            frame_index = key_frame_1 if frame_index is None else frame_index
+            candidate = grade_sequence(angles_1, frame_index, angles_2, frame_index_2,
+                                       abandon=sequence['dtw_distance'] if sequence else np.inf, rubric=rubric)
+            if candidate['sequence_grade'] is not None:
+                sequence, reference, frame_index_1 = candidate, name, frame_index
+    _, angles_1, key_frame_1 = get_clip(library, reference, job.get('normalize', False))
+    if frame_index_1 is None:
+        frame_index_1 = key_frame_1
+    result['reference'] = reference
+    thetas_1 = list(angles_1[frame_index_1])
+    thetas_2 = calculate_angle(coordinates_2[frame_index_2])
+    similarity, grade_point, comments = grade(thetas_1, thetas_2, rubric)
+    result.update(
+        reference_frame=frame_index_1 + 1,
+        angles=[float(theta) for theta in thetas_2],
+        similarity=float(similarity),
+        grade=float(grade_point),
+        comments=[{'angle': name, 'comment': comment['comment'].strip(), 'delta_theta': float(comment['delta_theta'])}
+                  for name, comment in zip(ANGLE_NAMES, comments)],
+    )
+    if sequence is not None:
+        result.update(dtw_distance=float(sequence['dtw_distance']), sequence_grade=sequence['sequence_grade'],
+                      phases=sequence['phases'])
+    return result, comments
+
+
+def grade_clip(job):
+    """評一個檔案, 失敗時把錯誤記在結果裡而不是讓整批停下來; --profile 時這個 worker 的紀錄放在 result['profile']"""
+    t = time.perf_counter()
+    result = dict(job)
+    try:
+        with span('grade_clip', file=os.path.basename(job['file'])):
+            coordinates_2, header = load_coordinates(job['file'])
+            result.update(grade_coordinates(coordinates_2, header, job, _library, _index)[0])
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['latency'] = time.perf_counter() - t
+    if PROFILER.enabled:
+        result['profile'] = PROFILER.export()
+    return result
+
+
+def write_results(results, path):
+    if path.endswith('.csv'):
+        fields = ['file', 'standard', 'position', 'frame', 'frame_source', 'confidence', 'reference', 'reference_frame',
+                  'similarity', 'grade', 'dtw_distance', 'sequence_grade', 'repaired_frames', 'latency', 'error'] + \
+                 ['delta ' + name for name in ANGLE_NAMES] + ['phase ' + name for name, _, _ in PHASES]
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for result in results:
+                row = dict(result)
+                for comment in result.get('comments', []):
+                    row['delta ' + comment['angle']] = comment['delta_theta']
+                for name, similarity in result.get('phases', {}).items():
+                    row['phase ' + name] = similarity
+                writer.writerow(row)
+    else:
+        with open(path, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+def main(args):
+    jobs = make_jobs(args)
+    if not jobs:
+        print('No clips to grade')
+        return
+    # 資料庫/索引不存在或過期時先在主程序建好, 避免每個 worker 各建一次
+    load_library(args.library_dir)
+    if args.best_match:
+        build_index(index_path=args.index)
+    if args.profile:
+        PROFILER.enable()
+
+    t = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.library_dir, args.index if args.best_match else None, bool(args.profile))) as pool:
+        results = list(pool.map(grade_clip, jobs, chunksize=max(1, len(jobs) // (4 * args.workers))))
+    elapsed = time.perf_counter() - t
+    for result in results:
+        PROFILER.merge(result.pop('profile', None))
+    write_results(results, args.output)
+    if args.analytics:
+        with AnalyticsStore(args.analytics) as store:
+            print('{} sessions -> {}'.format(store.record(results), args.analytics))
+
+    latencies = np.array([result['latency'] for result in results])
+    failed = sum('error' in result for result in results)
+    print('Graded {} clips ({} failed) in {:.2f}s with {} workers -> {}'.format(
+        len(results), failed, elapsed, args.workers, args.output))
+    print('throughput : {:.1f} clips/s'.format(len(results) / elapsed))
+    print('latency per clip : p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        *(1000 * np.percentile(latencies, [50, 90, 99, 100]))))
+    finish_profile(args.profile)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,87 @@
+'''
+analytics.py 的寫入速度與查詢速度: 產生 --sessions 筆假的評分結果 (--players 個打者、九個位置、一整季),
+分批 record, 再比較 summary (只讀 aggregates) 與每次從 sessions 重新 GROUP BY 的查詢時間,
+並檢查累計的平均/標準差/趨勢與 numpy 一次算完的結果相同
+
+在專案根目錄執行:  python -m benchmarks.bench_analytics [--sessions 20000] [--players 30] [--batch 100]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from analytics import STATS, TREND_DAYS, AnalyticsStore
+from angles import ANGLE_NAMES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Analytics store benchmark')
+    parser.add_argument('--sessions', default=20000, type=int)
+    parser.add_argument('--players', default=30, type=int)
+    parser.add_argument('--batch', default=100, type=int, help='results per record() call (batch_grade passes a whole run)')
+    parser.add_argument('--queries', default=200, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def fake_results(n, players, rng):
+    """每個打者的 grade 隨時間慢慢進步, 角度差是常態分佈"""
+    start = time.mktime((2026, 3, 1, 0, 0, 0, 0, 0, -1))
+    days = rng.uniform(0, 180, n)
+    player = rng.integers(players, size=n)
+    grade = 50 + 0.05 * days + rng.normal(0, 8, n)
+    deltas = rng.normal(0, 10, (n, len(ANGLE_NAMES)))
+    return [{'player': 'player{:02d}'.format(player[i]), 'position': int(rng.integers(1, 10)), 'standard': 1,
+             'date': start + 86400 * days[i], 'grade': grade[i], 'similarity': grade[i] + 2, 'frame': 100,
+             'angles': list(rng.uniform(0, 180, len(ANGLE_NAMES))),
+             'comments': [{'angle': name, 'delta_theta': deltas[i, j]} for j, name in enumerate(ANGLE_NAMES)]}
+            for i in range(n)]
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    results = fake_results(args.sessions, args.players, rng)
+    with tempfile.TemporaryDirectory() as tmp, AnalyticsStore(os.path.join(tmp, 'analytics.db')) as store:
+        t = time.perf_counter()
+        for i in range(0, len(results), args.batch):
+            store.record(results[i:i + args.batch])
+        elapsed = time.perf_counter() - t
+        print('record : {} sessions in {:.2f}s ({:.0f} sessions/s, batches of {})'.format(
+            len(results), elapsed, len(results) / elapsed, args.batch))
+
+        players = ['player{:02d}'.format(i) for i in rng.integers(args.players, size=args.queries)]
+        t = time.perf_counter()
+        for player in players:
+            store.summary(player, position=None)
+        summary_ms = 1000 * (time.perf_counter() - t) / args.queries
+        columns = ', '.join('AVG({0}), AVG({0} * {0})'.format(c) for c in ['grade', 'similarity'] +
+                            ['delta_{}'.format(i) for i in range(len(ANGLE_NAMES))])
+        t = time.perf_counter()
+        for player in players:
+            store.connection.execute('SELECT position, COUNT(*), {} FROM sessions WHERE player = ? GROUP BY position'.format(
+                columns), (player,)).fetchall()
+        rescan_ms = 1000 * (time.perf_counter() - t) / args.queries
+        print('per-player dashboard query : aggregates {:.3f} ms, GROUP BY over sessions {:.3f} ms ({:.0f}x)'.format(
+            summary_ms, rescan_ms, rescan_ms / summary_ms))
+
+        # 與 numpy 一次算完的結果比對
+        player = players[0]
+        rows = [r for r in results if r['player'] == player]
+        x = np.array([[r['grade'], r['similarity']] + [c['delta_theta'] for c in r['comments']] for r in rows])
+        days = np.array([r['date'] for r in rows]) / 86400
+        expected_trend = np.polyfit(days, x, 1)[0] * TREND_DAYS
+        stats = store.summary(player)[0]['stats']
+        got = np.array([[stats[name]['mean'], stats[name]['std'], stats[name]['trend']] for name in STATS])
+        error = np.abs(got - np.stack([x.mean(0), x.std(0, ddof=1), expected_trend], axis=1)).max()
+        print('{}: {} sessions, grade {:.2f} ± {:.2f}, trend {:+.2f} / {} days, max error vs numpy {:.1e}'.format(
+            player, len(rows), stats['grade']['mean'], stats['grade']['std'], stats['grade']['trend'], TREND_DAYS, error))
+        t = time.perf_counter()
+        store.rebuild()
+        print('rebuild from sessions : {:.2f}s'.format(time.perf_counter() - t))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,64 @@
+'''
+逐幀 grade.calculate_angle 與向量化 angles.calculate_angles 的速度/誤差比較
+
+在專案根目錄執行:  python -m benchmarks.bench_angles [--standard-dir standard] [--repeat 3]
+'''
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from angles import calculate_angles, pad_clips
+from grade import calculate_angle
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Angle engine benchmark')
+    parser.add_argument('--standard-dir', default='standard', type=str)
+    parser.add_argument('--repeat', default=3, type=int)
+    return parser.parse_args()
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def main(args):
+    paths = sorted(glob.glob(os.path.join(args.standard_dir, '*.npy')))
+    # 兩邊都用 float64 比較, 誤差才不會被 float32 的捨入蓋過
+    clips = [np.load(path).astype(np.float64) for path in paths]
+    total_frames = sum(len(clip) for clip in clips)
+    print('{} clips, {} frames'.format(len(clips), total_frames))
+
+    t_scalar, scalar = best_of(lambda: [np.array([calculate_angle(frame) for frame in clip]) for clip in clips], args.repeat)
+    t_clip, per_clip = best_of(lambda: [calculate_angles(clip) for clip in clips], args.repeat)
+    batch, lengths = pad_clips(clips)
+    t_batch, batched = best_of(lambda: calculate_angles(batch), args.repeat)
+
+    max_error = 0.0
+    for n, expected in enumerate(scalar):
+        max_error = max(max_error,
+                        np.abs(per_clip[n] - expected).max(),
+                        np.abs(batched[n, :lengths[n]] - expected).max())
+
+    padded_frames = batch.shape[0] * batch.shape[1]
+    print('{:<28}{:>10}{:>14}{:>10}'.format('mode', 'time (s)', 'frames/s', 'speedup'))
+    for name, seconds in [('scalar calculate_angle', t_scalar),
+                          ('calculate_angles per clip', t_clip),
+                          ('calculate_angles (N, T)', t_batch)]:
+        print('{:<28}{:>10.4f}{:>14.0f}{:>9.1f}x'.format(name, seconds, total_frames / seconds, t_scalar / seconds))
+    print('batch shape {} ({} padded frames)'.format(batch.shape, padded_frames - total_frames))
+    print('max abs error vs scalar helpers: {:.3e} degree'.format(max_error))
+    assert max_error < 1e-6
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,95 @@
+'''
+多支影片的 probe + 解碼: 逐支 (probe_video + read_video) 與 asyncio 同時處理 --decoders 支的比較
+--infer-ms 模擬每幀的推論時間 (在共用的單一 thread 裡 sleep, 與 GPU 推論一樣不佔 GIL),
+看 ffprobe/ffmpeg 的啟動與解碼能不能被推論蓋掉; 不需要 detectron2
+
+在專案根目錄執行:  python -m benchmarks.bench_ingest standard/*.mp4 [--decoders 1 2 4] [--infer-ms 4] [--max-size 640]
+'''
+import argparse
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from video_io import plan_sampling, probe_video, probe_video_async, read_video, read_video_async
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Sequential vs asyncio multi-video ingestion benchmark')
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--decoders', default=[1, 2, 4], type=int, nargs='+', help='concurrent decoders to try')
+    parser.add_argument('--infer-ms', default=4.0, type=float, help='simulated inference time per frame')
+    parser.add_argument('--batch-size', default=4, type=int)
+    parser.add_argument('--max-size', default=640, type=int)
+    return parser.parse_args()
+
+
+def fake_infer(images, infer_ms):
+    time.sleep(infer_ms / 1000 * len(images))
+    return len(images)
+
+
+def sequential(videos, args):
+    """infer_video_new 原本的做法: 一支做完才 probe 下一支"""
+    frames = 0
+    for video_name in videos:
+        plan = plan_sampling(probe_video(video_name), max_size=args.max_size)
+        batch = []
+        for im in read_video(video_name, plan):
+            batch.append(im)
+            if len(batch) == args.batch_size:
+                frames += fake_infer(batch, args.infer_ms)
+                batch = []
+        if batch:
+            frames += fake_infer(batch, args.infer_ms)
+    return frames
+
+
+async def concurrent(videos, args, decoders):
+    """與 infer_video_new.ingest_videos 相同的結構: semaphore 限制解碼數, 共用一個推論 thread"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    semaphore = asyncio.Semaphore(decoders)
+
+    async def ingest(video_name):
+        frames, pending, batch = 0, [], []
+        async with semaphore:
+            plan = plan_sampling(await probe_video_async(video_name), max_size=args.max_size)
+            async with contextlib.aclosing(read_video_async(video_name, plan)) as stream:
+                async for im in stream:
+                    batch.append(im)
+                    if len(batch) == args.batch_size:
+                        pending.append(loop.run_in_executor(executor, fake_infer, batch, args.infer_ms))
+                        batch = []
+                        if len(pending) >= 2:
+                            frames += await pending.pop(0)
+            if batch:
+                pending.append(loop.run_in_executor(executor, fake_infer, batch, args.infer_ms))
+        for future in pending:
+            frames += await future
+        return frames
+
+    try:
+        return sum(await asyncio.gather(*(ingest(video_name) for video_name in videos)))
+    finally:
+        executor.shutdown()
+
+
+def main(args):
+    print('{} videos, {:.1f} ms/frame simulated inference, batch {}'.format(len(args.videos), args.infer_ms, args.batch_size))
+    print('{:<22}{:>8}{:>10}{:>10}{:>10}'.format('mode', 'frames', 'seconds', 'fps', 'speedup'))
+    t = time.perf_counter()
+    frames = sequential(args.videos, args)
+    baseline = time.perf_counter() - t
+    print('{:<22}{:>8}{:>10.2f}{:>10.1f}{:>9.2f}x'.format('sequential', frames, baseline, frames / baseline, 1.0))
+    for decoders in args.decoders:
+        t = time.perf_counter()
+        frames = asyncio.run(concurrent(args.videos, args, decoders))
+        seconds = time.perf_counter() - t
+        print('{:<22}{:>8}{:>10.2f}{:>10.1f}{:>9.2f}x'.format(
+            'asyncio, {} decoders'.format(decoders), frames, seconds, frames / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
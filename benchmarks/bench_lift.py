@@ -0,0 +1,76 @@
+'''
+lift.py 的 CPU 速度: 不同視窗大小 (chunk) 下每秒能 lift 幾幀、重複算的 context 佔多少,
+以及逐幀 push 進 StreamingLifter 時第一幀 3D 要等到第幾幀、每次 push 最久卡多久
+
+沒有 --weights 時用與 pretrained_h36m_detectron_coco 相同形狀的隨機權重 (速度與權重的值無關)
+
+在專案根目錄執行:  python -m benchmarks.bench_lift [--weights checkpoint/xxx.npz] [--frames 600] [--chunks 64 128 256 512]
+'''
+import argparse
+import time
+
+import numpy as np
+
+from lift import StreamingLifter, TemporalLifter, lift_keypoints, load_lifter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='2D -> 3D lifting benchmark')
+    parser.add_argument('--weights', default=None, type=str, help='lift.py .npz (default: random weights)')
+    parser.add_argument('--channels', default=1024, type=int, help='channels of the random model')
+    parser.add_argument('--frames', default=600, type=int)
+    parser.add_argument('--chunks', default=[64, 128, 256, 512], type=int, nargs='+')
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def random_arrays(channels, widths=(3, 3, 3, 3, 3), seed=0):
+    """與 convert_checkpoint 相同的 key 與形狀"""
+    rng = np.random.default_rng(seed)
+    arrays = {'w0': rng.normal(0, 0.1, (widths[0], 34, channels)), 'b0': np.zeros(channels)}
+    for i, width in enumerate(widths[1:]):
+        arrays['w{}'.format(2 * i + 1)] = rng.normal(0, 0.5 / np.sqrt(width * channels), (width, channels, channels))
+        arrays['b{}'.format(2 * i + 1)] = np.zeros(channels)
+        arrays['w{}'.format(2 * i + 2)] = rng.normal(0, 0.5 / np.sqrt(channels), (1, channels, channels))
+        arrays['b{}'.format(2 * i + 2)] = np.zeros(channels)
+    arrays['shrink_w'] = rng.normal(0, 0.1, (channels, 51))
+    arrays['shrink_b'] = np.zeros(51)
+    return {name: array.astype(np.float32) for name, array in arrays.items()}
+
+
+def main(args):
+    lifter = load_lifter(args.weights) if args.weights else TemporalLifter(random_arrays(args.channels, seed=args.seed))
+    rng = np.random.default_rng(args.seed)
+    keypoints = np.concatenate([rng.uniform(100, 500, (args.frames, 2, 17)), np.ones((args.frames, 2, 17))], axis=1)
+    boxes = np.tile([0, 0, 540, 592, 0.9], (args.frames, 1))
+    boxes[rng.random(args.frames) < 0.05, 4] = 0
+    print('receptive field {} frames (pad {}), {} frames'.format(lifter.receptive_field, lifter.pad, args.frames))
+
+    for flip in (False, True):
+        for chunk in args.chunks:
+            t = time.perf_counter()
+            lift_keypoints(keypoints, boxes, 540, 592, lifter, chunk=chunk, flip=flip)
+            elapsed = time.perf_counter() - t
+            windows = -(-args.frames // chunk)
+            computed = args.frames + windows * 2 * lifter.pad
+            print('flip {:<6}chunk {:>4}: {:7.1f} fps, {:.2f}x frames computed'.format(
+                str(flip), chunk, args.frames / elapsed, computed / args.frames))
+
+    for chunk in args.chunks:
+        streamer = StreamingLifter(lifter, 540, 592, chunk=chunk)
+        first, slowest = None, 0.0
+        t = time.perf_counter()
+        for i in range(args.frames):
+            t_push = time.perf_counter()
+            if len(streamer.push(keypoints[i:i + 1], boxes[i:i + 1])) and first is None:
+                first = i
+            slowest = max(slowest, time.perf_counter() - t_push)
+        t_finish = time.perf_counter()
+        streamer.finish()
+        print('stream chunk {:>4}: first 3D after frame {}, slowest push {:.0f} ms, finish {:.0f} ms, total {:.2f}s'.format(
+            chunk, first, 1000 * slowest, 1000 * (time.perf_counter() - t_finish), time.perf_counter() - t))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
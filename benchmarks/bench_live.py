@@ -0,0 +1,93 @@
+'''
+live.py 的延遲: 假的練習 (站姿 + 每 swing_every 秒一次揮棒, 2D 加上偵測的抖動) 逐幀 push 進 LiveSession,
+量每幀的時間 (p50 / p99, 不含揮完棒那一幀)、揮完棒到評分 + 報告完成要多久、抓到幾次揮棒,
+不同的練習長度下這些數字應該相同 (環狀緩衝區, 與練習多久無關)
+
+沒有 --weights 時用 bench_lift 的隨機權重 (評分沒有意義, 速度與權重的值無關); 不需要 detectron2
+
+在專案根目錄執行:  python -m benchmarks.bench_live [--weights checkpoint/xxx.npz] [--seconds 60 300] [--report none]
+'''
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_lift import random_arrays
+from lift import TemporalLifter, load_lifter
+from live import LiveSession
+from reference import load_library
+
+H36M_TO_COCO = [9, 10, 10, 10, 10, 11, 14, 12, 15, 13, 16, 4, 1, 5, 2, 6, 3]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Live mode latency benchmark')
+    parser.add_argument('--weights', default=None, type=str, help='lift.py .npz (default: random weights)')
+    parser.add_argument('--channels', default=1024, type=int, help='channels of the random model')
+    parser.add_argument('--seconds', default=[60, 300], type=float, nargs='+', help='session lengths')
+    parser.add_argument('--swing-every', dest='swing_every', default=8.0, type=float)
+    parser.add_argument('--fps', default=30.0, type=float)
+    parser.add_argument('--report', default='png', choices=['png', 'svg', 'none'])
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def make_session(seconds, fps, swing_every, rng, w=960, h=540):
+    """
+    回傳 boxes (T, 5)、keypoints (T, 4, 17) 與每次揮棒最快的那一幀;
+    站姿是 standard/judge_1.npy 的第一幀, 揮棒是兩手腕 0.3 秒內沿半圓甩出去、停 1 秒、2 秒慢慢收回
+    """
+    stance = np.load('standard/judge_1.npy')[0][H36M_TO_COCO, :2]
+    stance = np.array([w / 2, h / 2]) + stance / np.ptp(stance[:, 1]) * 0.6 * h     # (17, 2) 像素, 身高 0.6 h
+    frames = int(seconds * fps)
+    radius = 0.35 * 0.6 * h
+    offset = np.zeros((frames, 2))
+    peaks = []
+    for start in np.arange(swing_every / 2, seconds - 4, swing_every):
+        t = np.arange(int(3.3 * fps)) / fps
+        phase = np.where(t < 0.3, (1 - np.cos(np.pi * t / 0.3)) / 2,
+                         np.where(t < 1.3, 1.0, (1 + np.cos(np.pi * np.clip(t - 1.3, 0, 2) / 2)) / 2))
+        angle = np.pi * phase
+        first = int(start * fps)
+        offset[first:first + len(t)] = radius * np.column_stack([1 - np.cos(angle), -np.sin(angle)])
+        peaks.append(first + int(0.15 * fps))
+    keypoints = np.ones((frames, 4, 17))
+    points = np.repeat(stance[None], frames, axis=0)
+    points[:, [9, 10]] += offset[:, None]
+    points += rng.normal(0, 1.5, points.shape)      # 偵測的抖動 (像素)
+    keypoints[:, :2] = points.transpose(0, 2, 1)
+    keypoints[:, 3] = 0.9
+    boxes = np.column_stack([points.min(axis=1) - 10, points.max(axis=1) + 10, np.full(frames, 0.99)])
+    return boxes, keypoints, peaks
+
+
+def main(args):
+    lifter = load_lifter(args.weights) if args.weights else TemporalLifter(random_arrays(args.channels, seed=args.seed))
+    library = load_library()
+    job = {'standard': 1, 'position': 5, 'frame': None, 'sequence': False, 'best_match': False}
+    rng = np.random.default_rng(args.seed)
+    print('receptive field {} frames, {} fps, a swing every {}s'.format(lifter.receptive_field, args.fps, args.swing_every))
+    for seconds in args.seconds:
+        boxes, keypoints, peaks = make_session(seconds, args.fps, args.swing_every, rng)
+        session = LiveSession(960, 540, args.fps, job, library, lifter, report=args.report)
+        push_times, swing_times, found = [], [], []
+        for box, kps in zip(boxes, keypoints):
+            t = time.perf_counter()
+            result = session.push(box, kps)
+            elapsed = time.perf_counter() - t
+            if result is None:
+                push_times.append(elapsed)
+            else:
+                swing_times.append(elapsed)
+                found.append(result['peak_frame'])
+        push_times, swing_times = 1000 * np.array(push_times), 1000 * np.array(swing_times or [np.nan])
+        hits = sum(any(abs(peak - frame) <= args.fps / 2 for frame in found) for peak in peaks)
+        print('{:>6.0f}s: per frame p50 {:.2f} ms, p99 {:.2f} ms; swing graded in {:.0f} ms (max {:.0f}); '
+              '{}/{} swings found, {} false'.format(seconds, np.percentile(push_times, 50), np.percentile(push_times, 99),
+                                                   np.mean(swing_times), np.max(swing_times), hits, len(peaks),
+                                                   len(found) - hits))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,74 @@
+'''
+tracks.py 的多人追蹤: 假的場景裡 N 個人各自隨機走動 (偶爾被擋住幾幀、偵測順序每幀打亂),
+量 Tracker.update 每幀的時間與 ID switch 次數, 以及 batter_scores 能不能從中挑出唯一在揮棒的人
+
+在專案根目錄執行:  python -m benchmarks.bench_people [--people 2 5 10 20] [--frames 600]
+'''
+import argparse
+import time
+
+import numpy as np
+
+from tracks import Tracker, batter_scores
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Multi-person tracking benchmark')
+    parser.add_argument('--people', default=[2, 5, 10, 20], type=int, nargs='+')
+    parser.add_argument('--frames', default=600, type=int)
+    parser.add_argument('--dropout', default=0.02, type=float, help='chance a person is missed in a frame')
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def make_scene(people, frames, dropout, rng, w=1920, h=1080):
+    """回傳每一幀的 (boxes (n, 5), keypoints (n, 4, 17), 真正的人的編號 (n,)); 第 0 個人在畫面中央揮棒"""
+    centers = np.column_stack([rng.uniform(0.1, 0.9, people) * w, rng.uniform(0.4, 0.6, people) * h])
+    centers[0] = [w / 2, h / 2]
+    heights = rng.uniform(0.2, 0.4, people) * h
+    heights[0] = 0.45 * h
+    scene = []
+    for t in range(frames):
+        centers[1:] += rng.normal(0, 3, (people - 1, 2))
+        shown = np.nonzero(rng.random(people) >= dropout)[0]
+        rng.shuffle(shown)
+        boxes = np.column_stack([centers[shown, 0] - heights[shown] / 4, centers[shown, 1] - heights[shown] / 2,
+                                 centers[shown, 0] + heights[shown] / 4, centers[shown, 1] + heights[shown] / 2,
+                                 rng.uniform(0.7, 1.0, len(shown))])
+        keypoints = np.zeros((len(shown), 4, 17))
+        keypoints[:, 0] = centers[shown, :1] + rng.normal(0, 5, (len(shown), 17))
+        keypoints[:, 1] = centers[shown, 1:] + np.linspace(-0.5, 0.5, 17) * heights[shown, None]
+        keypoints[:, 3] = 0.9
+        swing = shown == 0
+        keypoints[swing, 0, 9:11] += 200 * np.sin(t / 10)
+        scene.append((boxes, keypoints, shown))
+    return scene
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    for people in args.people:
+        scene = make_scene(people, args.frames, args.dropout, rng)
+        tracker = Tracker()
+        assigned = []
+        t = time.perf_counter()
+        for boxes, keypoints, _ in scene:
+            assigned.append(tracker.update(boxes, keypoints))
+        elapsed = time.perf_counter() - t
+        switches = 0
+        last = {}
+        for ids, (_, _, truth) in zip(assigned, scene):
+            for track, person in zip(ids, truth):
+                switches += person in last and last[person] != track
+                last[person] = track
+        track_ids, boxes, keypoints = tracker.stack()
+        scores, _ = batter_scores(boxes, keypoints, 1920, 1080)
+        batter = track_ids[int(np.argmax(scores))]
+        correct = batter == assigned[0][list(scene[0][2]).index(0)] if 0 in scene[0][2] else None
+        print('{:>3} people: {:6.3f} ms/frame, {} tracks, {} id switches, batter track correct: {}'.format(
+            people, 1000 * elapsed / args.frames, len(track_ids), switches, correct))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,79 @@
+'''
+.pose 與原本的 .npy / dtype=object .npz 的讀取速度比較: 讀整段, 以及只讀擊球前後一段幀
+
+在專案根目錄執行:  python -m benchmarks.bench_pose_clip [--frames 20000] [--repeat 5]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from keypoint_store import KeypointWriter, export_npz
+from pose_clip import from_npy, from_npz, read_clip, read_frames
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pose clip loader benchmark')
+    parser.add_argument('--frames', default=20000, type=int, help='frames in the synthetic clips')
+    parser.add_argument('--window', default=90, type=int, help='frames read around the middle of the clip')
+    parser.add_argument('--repeat', default=5, type=int)
+    return parser.parse_args()
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def load_npz_arrays(path):
+    """舊格式讀成 (T, 5) / (T, 4, 17) 的 array, 後面的程式才能用"""
+    data = np.load(path, allow_pickle=True)
+    boxes = np.stack([np.asarray(cls_boxes[1]).reshape(5) for cls_boxes in data['boxes']])
+    keypoints = np.stack([np.asarray(cls_keyps[1]).reshape(4, 17) for cls_keyps in data['keypoints']])
+    return boxes, keypoints
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    start = args.frames // 2
+    stop = start + args.window
+    with tempfile.TemporaryDirectory() as tmp:
+        coordinates = rng.standard_normal((args.frames, 17, 3)).astype(np.float32)
+        np.save(os.path.join(tmp, 'clip.npy'), coordinates)
+        from_npy(os.path.join(tmp, 'clip.npy'), os.path.join(tmp, 'clip.pose'))
+
+        writer = KeypointWriter(os.path.join(tmp, 'clip.kps'), metadata={'w': 1920, 'h': 1080})
+        writer.resume()
+        for bbox, kps in zip(rng.random((args.frames, 5), dtype=np.float32), rng.random((args.frames, 4, 17), dtype=np.float32)):
+            writer.append(bbox, kps)
+        writer.close()
+        export_npz(os.path.join(tmp, 'clip.kps'), os.path.join(tmp, 'clip.npz'))
+        from_npz(os.path.join(tmp, 'clip.npz'), os.path.join(tmp, 'clip_2d.pose'))
+
+        npy, pose, npz, pose_2d = (os.path.join(tmp, name) for name in ('clip.npy', 'clip.pose', 'clip.npz', 'clip_2d.pose'))
+        cases = [
+            ('3d .npy np.load', npy, lambda: np.load(npy)),
+            ('3d .npy window (mmap_mode)', npy, lambda: np.array(np.load(npy, mmap_mode='r')[start:stop])),
+            ('3d .pose read_clip', pose, lambda: np.array(read_clip(pose)['coordinates'])),
+            ('3d .pose window (mmap)', pose, lambda: np.array(read_clip(pose)['coordinates'][start:stop])),
+            ('3d .pose window (read_frames)', pose, lambda: read_frames(pose, 'coordinates', start, stop)),
+            ('2d .npz allow_pickle', npz, lambda: load_npz_arrays(npz)),
+            ('2d .npz window', npz, lambda: [a[start:stop] for a in load_npz_arrays(npz)]),
+            ('2d .pose read_clip', pose_2d, lambda: [np.array(read_clip(pose_2d)[name]) for name in ('boxes', 'keypoints')]),
+            ('2d .pose window (mmap)', pose_2d, lambda: [np.array(read_clip(pose_2d)[name][start:stop]) for name in ('boxes', 'keypoints')]),
+        ]
+        print('{} frames, window of {} frames'.format(args.frames, args.window))
+        print('{:<32}{:>12}{:>12}'.format('loader', 'ms', 'file KB'))
+        for name, path, fn in cases:
+            print('{:<32}{:>12.3f}{:>12.0f}'.format(name, 1000 * best_of(fn, args.repeat), os.path.getsize(path) / 1024))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
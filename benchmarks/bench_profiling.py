@@ -0,0 +1,83 @@
+'''
+profiling.py 本身的開銷: 關閉/打開時每次 span、record、count、@profiled 要多少 µs,
+以及逐幀 grade.calculate_angle (最常被呼叫的 @profiled 函式) 整段 standard/ 跑一次時慢了多少
+
+在專案根目錄執行:  python -m benchmarks.bench_profiling [--calls 200000]
+'''
+import argparse
+import glob
+import time
+
+import numpy as np
+
+from grade import calculate_angle
+from profiling import PROFILER, count, profiled, record, span
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Profiling overhead benchmark')
+    parser.add_argument('--calls', default=200000, type=int)
+    parser.add_argument('--repeat', default=3, type=int)
+    return parser.parse_args()
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+@profiled('noop')
+def noop():
+    pass
+
+
+def main(args):
+    calls = range(args.calls)
+
+    def run_span():
+        for _ in calls:
+            with span('x'):
+                pass
+
+    def run_record():
+        for _ in calls:
+            record('x', 0.0, 0.0)
+
+    def run_count():
+        for _ in calls:
+            count('x')
+
+    def run_profiled():
+        for _ in calls:
+            noop()
+
+    def run_loop():
+        for _ in calls:
+            pass
+
+    frames = np.concatenate([np.load(path) for path in sorted(glob.glob('standard/*.npy'))])
+    angles = calculate_angle.__wrapped__
+
+    base = best_of(run_loop, args.repeat)
+    for enabled in (False, True):
+        PROFILER.enabled = enabled
+        for name, fn in (('span', run_span), ('record', run_record), ('count', run_count), ('@profiled', run_profiled)):
+            PROFILER.clear()
+            elapsed = best_of(fn, args.repeat) - base
+            print('{:<9}{:<10}{:8.3f} µs/call'.format('on' if enabled else 'off', name, 1e6 * elapsed / args.calls))
+        PROFILER.clear()
+        t_plain = best_of(lambda: [angles(frame) for frame in frames], args.repeat)
+        t_wrapped = best_of(lambda: [calculate_angle(frame) for frame in frames], args.repeat)
+        print('{:<9}calculate_angle on {} frames: {:.3f}s vs {:.3f}s unwrapped ({:+.1%})'.format(
+            'on' if enabled else 'off', len(frames), t_wrapped, t_plain, t_wrapped / t_plain - 1))
+    PROFILER.enabled = False
+    PROFILER.clear()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,54 @@
+'''
+評分報告的產生速度: 每份報告重建整個 figure (原本 draw_frame_double 的做法) 與重複使用同一個 ReportRenderer 比較
+
+在專案根目錄執行:  python -m benchmarks.bench_report [--reports 40]
+'''
+import argparse
+import itertools
+import time
+
+from grade import grade
+from reference import PLAYERS, load_library, get_clip
+from report import ReportRenderer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Report rendering benchmark')
+    parser.add_argument('--reports', default=40, type=int, help='reports per mode')
+    return parser.parse_args()
+
+
+def make_reports(library, count):
+    """以標準影片互相比較當作報告內容: 每段有位置的影片對上另一位球員同位置的標準"""
+    players = {name: number for number, name in PLAYERS.items()}
+    pairs = [(entry['name'], library['index'][(other, entry['position'])], players[other], entry['position'])
+             for entry in library['clips'].values() if entry['position'] is not None
+             for other in PLAYERS.values() if other != entry['player'] and (other, entry['position']) in library['index']]
+    reports = []
+    for user, reference, standard, position in itertools.islice(itertools.cycle(pairs), count):
+        coordinates_1, angles_1, key_frame_1 = get_clip(library, reference)
+        coordinates_2, angles_2, key_frame_2 = get_clip(library, user)
+        _, grade_point, comments = grade(list(angles_1[key_frame_1]), list(angles_2[key_frame_2]))
+        reports.append((coordinates_1, key_frame_1, coordinates_2, key_frame_2, grade_point, comments, standard, position))
+    return reports
+
+
+def main(args):
+    reports = make_reports(load_library(), args.reports)
+    print('{:<28}{:>10}{:>14}{:>12}'.format('mode', 'reports', 'reports/s', 'KB/report'))
+    for format in ('png', 'svg'):
+        t = time.perf_counter()
+        size = sum(len(ReportRenderer().render(*report, format=format)) for report in reports)
+        elapsed = time.perf_counter() - t
+        print('{:<28}{:>10}{:>14.2f}{:>12.1f}'.format('new figure per report/' + format, len(reports), len(reports) / elapsed, size / len(reports) / 1024))
+
+        t = time.perf_counter()
+        renderer = ReportRenderer()
+        size = sum(len(renderer.render(*report, format=format)) for report in reports)
+        elapsed = time.perf_counter() - t
+        print('{:<28}{:>10}{:>14.2f}{:>12.1f}'.format('reused renderer/' + format, len(reports), len(reports) / elapsed, size / len(reports) / 1024))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,72 @@
+'''
+scoring.py 的速度與校正: 逐筆 grade.grade 與一次評整批 Rubric.score 的比較,
+用隱藏的權重/width 產生假的人工評分, 看 calibrate 能不能找回來, 最後量 analytics 資料庫整批重評的時間
+
+在專案根目錄執行:  python -m benchmarks.bench_scoring [--sessions 100000] [--labelled 500]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from analytics import AnalyticsStore
+from angles import ANGLE_NAMES
+from grade import grade
+from reference import load_library
+from scoring import Rubric, calibrate, load_rubric
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scoring rubric benchmark')
+    parser.add_argument('--sessions', default=100000, type=int)
+    parser.add_argument('--loop', default=5000, type=int, help='sessions for the per-call grade() loop')
+    parser.add_argument('--labelled', default=500, type=int)
+    parser.add_argument('--noise', default=3.0, type=float, help='std of the fake human labels around the hidden rubric')
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    angles = np.asarray(load_library()['angles'])
+    pairs = rng.integers(len(angles), size=(args.sessions, 2))
+    deltas = angles[pairs[:, 0]] - angles[pairs[:, 1]]
+    rubric = load_rubric()
+
+    t = time.perf_counter()
+    for delta in deltas[:args.loop]:
+        grade(delta, np.zeros(len(delta)))
+    loop = (time.perf_counter() - t) / args.loop
+    t = time.perf_counter()
+    scores = rubric.score(deltas)
+    batch = (time.perf_counter() - t) / args.sessions
+    print('grade() per call {:.1f} us, Rubric.score batch {:.3f} us per session ({:.0f}x), {} sessions in {:.3f}s'.format(
+        1e6 * loop, 1e6 * batch, loop / batch, args.sessions, batch * args.sessions))
+
+    hidden_weights = rng.uniform(0, 10, len(ANGLE_NAMES))
+    hidden = Rubric({'width': 25, 'weights': hidden_weights.tolist()})
+    labelled = deltas[:args.labelled]
+    labels = hidden.score(labelled)['grade'] + rng.normal(0, args.noise, len(labelled))
+    t = time.perf_counter()
+    config, metrics = calibrate(labelled, labels, rubric, widths=[15, 20, 25, 30, 35])
+    print('calibrate {} sessions in {:.2f}s: width {} (hidden 25), rmse {:.2f} -> {:.2f} (label noise {}), r = {:.3f}'.format(
+        args.labelled, time.perf_counter() - t, config['width'], metrics['rmse_before'], metrics['rmse_after'],
+        args.noise, metrics['correlation']))
+    fitted = np.asarray(config['weights']) / np.sum(config['weights'])
+    print('weight error: max {:.3f} (weights sum to 1)'.format(np.abs(fitted - hidden.weights).max()))
+
+    with tempfile.TemporaryDirectory() as tmp, AnalyticsStore(os.path.join(tmp, 'analytics.db')) as store:
+        store.record([{'player': 'p{}'.format(i % 30), 'position': int(i % 9) + 1, 'date': 1.77e9 + 3600 * i,
+                       'grade': float(grade_point), 'similarity': float(similarity),
+                       'comments': [{'angle': name, 'delta_theta': d} for name, d in zip(ANGLE_NAMES, delta)]}
+                      for i, (delta, grade_point, similarity) in enumerate(zip(deltas, scores['grade'], scores['similarity']))])
+        t = time.perf_counter()
+        count = store.rescore(Rubric(config))
+        print('rescore analytics store: {} sessions + aggregates in {:.2f}s'.format(count, time.perf_counter() - t))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,115 @@
+'''
+smoothing.py 的速度與修復誤差: 在 standard/ 的 3D 骨架上隨機挖掉幀、加上變形的骨架與抖動,
+比較各階段 (找缺漏、補洞、savgol、one_euro) 的 fps, 以及修復前後與原始骨架的誤差; 另外量 2D 的整套流程
+最後檢查比 --max-gap 長的洞: 補不了的幀以外都要是有限值, 且與沒有洞時的結果相同, 不符時以非 0 結束
+
+在專案根目錄執行:  python -m benchmarks.bench_smoothing [--standard-dir standard] [--drop 0.1] [--noise 0.01] [--repeat 5]
+'''
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from smoothing import fill_gaps, missing_3d, one_euro, repair_coordinates, repair_keypoints_2d, savgol
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Gap filling / smoothing benchmark')
+    parser.add_argument('--standard-dir', default='standard', type=str)
+    parser.add_argument('--drop', default=0.1, type=float, help='fraction of frames to corrupt')
+    parser.add_argument('--noise', default=0.01, type=float, help='gaussian jitter added to every joint')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--max-gap', default=5, type=int, help='for the long gap check (the gap is 4x this)')
+    return parser.parse_args()
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def corrupt(clean, drop, noise, rng):
+    """一半的壞幀整幀為 0 (沒偵測到人), 另一半把一隻手臂拉長 (VideoPose3D 的變形骨架)"""
+    noisy = clean + rng.normal(0, noise, clean.shape)
+    bad = rng.random(len(clean)) < drop
+    zero = bad & (rng.random(len(clean)) < 0.5)
+    noisy[zero] = 0
+    noisy[bad & ~zero, 12:14] *= 3
+    return noisy.astype(np.float32), bad
+
+
+def fake_2d(clean, bad, rng):
+    """把 3D 投影成 Detectron1 格式的 2D, 壞幀的分數設成 0"""
+    T = len(clean)
+    keypoints = np.zeros((T, 4, 17), dtype=np.float32)
+    keypoints[:, 0] = 320 + 200 * clean[:, :, 0] + rng.normal(0, 2, (T, 17))
+    keypoints[:, 1] = 240 - 200 * clean[:, :, 2] + rng.normal(0, 2, (T, 17))
+    keypoints[:, 3] = np.where(bad[:, None], 0, 0.9)
+    boxes = np.tile(np.array([100, 50, 540, 430, 0.99], dtype=np.float32), (T, 1))
+    boxes[bad, 4] = 0
+    return boxes, keypoints
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    clips = [np.load(path).astype(np.float64) for path in sorted(glob.glob(os.path.join(args.standard_dir, '*.npy')))]
+    clean = np.concatenate(clips)
+    noisy, bad = corrupt(clean, args.drop, args.noise, rng)
+    T = len(clean)
+    print('{} clips, {} frames, {} corrupted, jitter {}'.format(len(clips), T, int(bad.sum()), args.noise))
+
+    seconds, missing = best_of(lambda: missing_3d(noisy), args.repeat)
+    detected = missing.any(axis=1)
+    print('{:<18}{:>12}{:>12}'.format('stage', 'ms', 'fps'))
+    print('{:<18}{:>12.2f}{:>12.0f}'.format('missing_3d', 1000 * seconds, T / seconds))
+    stages = [
+        ('fill_gaps', lambda: fill_gaps(noisy, missing)),
+        ('savgol', lambda: savgol(clean)),
+        ('one_euro', lambda: one_euro(clean)),
+        ('repair savgol', lambda: repair_coordinates(noisy, method='savgol')),
+        ('repair one_euro', lambda: repair_coordinates(noisy, method='one_euro')),
+    ]
+    for name, fn in stages:
+        seconds, _ = best_of(fn, args.repeat)
+        print('{:<18}{:>12.2f}{:>12.0f}'.format(name, 1000 * seconds, T / seconds))
+    boxes, keypoints = fake_2d(clean, bad, rng)
+    seconds, _ = best_of(lambda: repair_keypoints_2d(keypoints, boxes), args.repeat)
+    print('{:<18}{:>12.2f}{:>12.0f}'.format('repair 2d savgol', 1000 * seconds, T / seconds))
+
+    print('corrupted frames found : {} / {} ({} false positives)'.format(
+        int((detected & bad).sum()), int(bad.sum()), int((detected & ~bad).sum())))
+    print('{:<18}{:>16}{:>16}'.format('method', 'all frames', 'corrupted'))
+    error = lambda x: np.linalg.norm(x - clean, axis=-1)
+    print('{:<18}{:>16.4f}{:>16.4f}'.format('raw', error(noisy).mean(), error(noisy)[bad].mean()))
+    for method in ('none', 'savgol', 'one_euro'):
+        # 注意: 串接的 clip 之間不連續, 濾波會稍微抹平接縫, 誤差是上限
+        repaired = repair_coordinates(noisy, method=method)[0]
+        print('{:<18}{:>16.4f}{:>16.4f}'.format(method, error(repaired).mean(), error(repaired)[bad].mean()))
+
+    # 超過 max_gap 的洞不補, 也不能讓 NaN 或洞旁邊的值被濾波帶到其他幀
+    gap = np.zeros(T, dtype=bool)
+    gap[100:100 + 4 * args.max_gap] = True
+    gapped = clean.copy()
+    gapped[gap] = np.nan
+    failures = []
+    for method in ('savgol', 'one_euro'):
+        repaired = repair_coordinates(gapped, method=method, max_gap=args.max_gap)[0]
+        before, after = repair_coordinates(clean[:100], method=method)[0], repair_coordinates(clean[~gap][100:], method=method)[0]
+        finite = np.isfinite(repaired).all(axis=(1, 2))
+        print('{:<18} long gap ({} frames): {} non-finite frames outside the gap'.format(method, int(gap.sum()), int((~finite & ~gap).sum())))
+        if (finite == gap).any() or not np.allclose(repaired[~gap], np.concatenate([before, after])):
+            failures.append(method)
+    if failures:
+        raise SystemExit('a gap longer than --max-gap leaked into the filtered frames: ' + ', '.join(failures))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,89 @@
+'''
+追蹤模式(--track)與逐幀全圖偵測的速度/準確度比較, 以逐幀偵測的結果當作標準答案
+
+在專案根目錄執行 (需要 detectron2 與模型權重):
+    python -m benchmarks.bench_tracking --cfg COCO-Keypoints/keypoint_rcnn_R_101_FPN_3x.yaml input.mp4 videos/video.mp4
+--output 另存每一列 (fps、speedup、PCK) 的 JSON, 附在改追蹤模式的 PR 裡
+'''
+import argparse
+import json
+import platform
+import time
+from collections import defaultdict
+
+import numpy as np
+from detectron2.config import get_cfg
+from detectron2 import model_zoo
+from detectron2.engine import DefaultPredictor
+import torch
+
+from infer_video_new import infer_video, track_video
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Tracking mode accuracy vs. speed')
+    parser.add_argument('--cfg', default='COCO-Keypoints/keypoint_rcnn_R_101_FPN_3x.yaml', type=str)
+    parser.add_argument('--intervals', default='5,15,30', type=str, help='keyframe intervals to try')
+    parser.add_argument('--crop-size', default=320, type=int)
+    parser.add_argument('--output', default=None, type=str, help='also write the table as JSON')
+    parser.add_argument('videos', nargs='+')
+    return parser.parse_args()
+
+
+def collect(frames):
+    """跑完整段影片, 回傳 (keypoints (T, 4, 17), boxes (T, 5), 秒數)"""
+    t = time.perf_counter()
+    boxes, keypoints = [], []
+    for _, bbox_tensor, kps in frames:
+        boxes.append(bbox_tensor[0])
+        keypoints.append(kps[0])
+    return np.array(keypoints), np.array(boxes), time.perf_counter() - t
+
+
+def keypoint_error(keypoints, reference, reference_boxes):
+    """以參考框的對角線長度正規化的關鍵點誤差: (平均誤差, PCK@0.05, PCK@0.1), 參考沒偵測到人的幀不計"""
+    valid = reference_boxes[:, 4] > 0
+    diagonal = np.linalg.norm(reference_boxes[valid, 2:4] - reference_boxes[valid, :2], axis=1)
+    error = np.linalg.norm(keypoints[valid, :2] - reference[valid, :2], axis=1) / diagonal[:, None]
+    return error.mean(), (error < 0.05).mean(), (error < 0.1).mean()
+
+
+def main(args):
+    cfg = get_cfg()
+    cfg.merge_from_file(model_zoo.get_config_file(args.cfg))
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.7
+    cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(args.cfg)
+    cfg.MODEL.DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    predictor = DefaultPredictor(cfg)
+
+    rows = []
+    print('{:<20}{:<14}{:>8}{:>8}{:>10}{:>12}{:>9}{:>9}'.format(
+        'video', 'mode', 'fps', 'speedup', 'detects', 'mean error', 'PCK@.05', 'PCK@.1'))
+    for video_name in args.videos:
+        reference, reference_boxes, full_time = collect(infer_video(predictor, video_name))
+        frames = len(reference)
+        print('{:<20}{:<14}{:>8.2f}{:>7.1f}x{:>10}{:>12}{:>9}{:>9}'.format(
+            video_name, 'full', frames / full_time, 1.0, frames, '-', '-', '-'))
+        rows.append({'video': video_name, 'mode': 'full', 'frames': frames, 'fps': frames / full_time, 'speedup': 1.0,
+                     'detections': frames})
+        for interval in [int(i) for i in args.intervals.split(',')]:
+            timings = defaultdict(float)
+            keypoints, _, track_time = collect(track_video(predictor, video_name, interval, args.crop_size, timings=timings))
+            mean_error, pck_05, pck_10 = keypoint_error(keypoints, reference, reference_boxes)
+            print('{:<20}{:<14}{:>8.2f}{:>7.1f}x{:>10}{:>12.4f}{:>9.3f}{:>9.3f}'.format(
+                video_name, 'track/{}'.format(interval), frames / track_time, full_time / track_time,
+                int(timings['detections']), mean_error, pck_05, pck_10))
+            rows.append({'video': video_name, 'mode': 'track/{}'.format(interval), 'frames': frames,
+                         'fps': frames / track_time, 'speedup': full_time / track_time,
+                         'detections': int(timings['detections']), 'mean_error': float(mean_error),
+                         'pck_05': float(pck_05), 'pck_10': float(pck_10)})
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cfg': args.cfg, 'device': cfg.MODEL.DEVICE, 'crop_size': args.crop_size,
+                       'machine': platform.processor() or platform.machine(), 'results': rows}, f, indent=2)
+        print('-> {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,54 @@
+'''
+read_video 各種抽幀/區段/縮放設定的解碼時間, 確認解碼成本跟著實際分析的幀數走, 而不是影片長度
+
+在專案根目錄執行:  python -m benchmarks.bench_video_io input.mp4 videos/video.mp4 [--window 1.5]
+'''
+import argparse
+import time
+
+from video_io import probe_video, plan_sampling, read_video, motion_window
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Video decode benchmark')
+    parser.add_argument('--window', default=1.5, type=float, help='seconds kept around the swing')
+    parser.add_argument('--stride', default=2, type=int)
+    parser.add_argument('--max-size', default=640, type=int)
+    parser.add_argument('videos', nargs='+')
+    return parser.parse_args()
+
+
+def decode(video_name, plan):
+    t = time.perf_counter()
+    frames = sum(1 for _ in read_video(video_name, plan))
+    return frames, time.perf_counter() - t
+
+
+def main(args):
+    print('{:<20}{:<22}{:>8}{:>10}{:>12}'.format('video', 'mode', 'frames', 'seconds', 'speedup'))
+    for video_name in args.videos:
+        t = time.perf_counter()
+        info = probe_video(video_name)
+        probe_time = time.perf_counter() - t
+        t = time.perf_counter()
+        start_time, end_time = motion_window(video_name, info, args.window)
+        motion_time = time.perf_counter() - t
+        print('{:<20}{} x {}, {:.2f} fps, {} frames; probe {:.3f}s, motion window {:.2f}-{:.2f}s in {:.3f}s'.format(
+            video_name, info['w'], info['h'], info['fps'], info['frames'], probe_time, start_time, end_time, motion_time))
+
+        modes = [
+            ('full', plan_sampling(info)),
+            ('window', plan_sampling(info, 1, start_time, end_time)),
+            ('window/stride {}'.format(args.stride), plan_sampling(info, args.stride, start_time, end_time)),
+            ('window/max {}'.format(args.max_size), plan_sampling(info, 1, start_time, end_time, max_size=args.max_size)),
+        ]
+        full_time = None
+        for mode, plan in modes:
+            frames, seconds = decode(video_name, plan)
+            full_time = full_time or seconds
+            print('{:<20}{:<22}{:>8}{:>10.3f}{:>11.1f}x'.format(video_name, mode, frames, seconds, full_time / seconds))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,70 @@
+'''
+用 grade.py 裡手動標記的 frame_num 檢查 keyframe.detect_key_frame 的準確度
+命中 (誤差 <= --tolerance) 的比例低於 --min-hits 或平均誤差超過 --max-mean-error 時以非 0 結束, 改偵測器的 PR 先跑這個;
+另外分別列出信心 >= --confident 與以下的命中率, 信心分數要能分出哪些結果需要人工確認
+
+目前的偵測器在 standard/ 上是 9/18 命中、平均誤差 24.8 幀; 門檻留了一點餘裕 (--min-hits 0.4 = 少兩段還過,
+--max-mean-error 30), 只擋明顯的退步. 偵測器改善後請把門檻跟著調高, 並更新這裡的數字
+
+在專案根目錄執行:  python -m benchmarks.eval_keyframe [--standard-dir standard] [--tolerance 10]
+'''
+import argparse
+import os
+import time
+
+import numpy as np
+
+from angles import calculate_angles
+from keyframe import detect_key_frame
+from reference import STANDARD_FRAME_NUM
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Key frame detector evaluation')
+    parser.add_argument('--standard-dir', default='standard', type=str)
+    parser.add_argument('--tolerance', default=10, type=int, help='frames counted as a hit (default: 10)')
+    parser.add_argument('--min-hits', default=0.4, type=float, help='fail below this fraction of hits (default: 0.4)')
+    parser.add_argument('--max-mean-error', default=30.0, type=float, help='fail above this mean abs error in frames (default: 30)')
+    parser.add_argument('--confident', default=0.5, type=float, help='confidence split for the calibration line (default: 0.5)')
+    return parser.parse_args()
+
+
+def main(args):
+    errors, confidences = [], []
+    total_frames = 0
+    total_time = 0.0
+    print('{:<10}{:>8}{:>10}{:>10}{:>8}{:>12}'.format('clip', 'frames', 'labelled', 'detected', 'error', 'confidence'))
+    for name, frame_num in STANDARD_FRAME_NUM.items():
+        coordinates = np.load(os.path.join(args.standard_dir, name + '.npy'))
+        t = time.perf_counter()
+        key_frame, confidence = detect_key_frame(coordinates, calculate_angles(coordinates))
+        total_time += time.perf_counter() - t
+        total_frames += len(coordinates)
+
+        error = key_frame - (frame_num - 1)
+        errors.append(error)
+        confidences.append(confidence)
+        print('{:<10}{:>8}{:>10}{:>10}{:>8}{:>12.2f}'.format(name, len(coordinates), frame_num - 1, key_frame, error, confidence))
+
+    errors = np.abs(errors)
+    hits = errors <= args.tolerance
+    confident = np.array(confidences) >= args.confident
+    print('within {} frames : {}/{}'.format(args.tolerance, hits.sum(), len(errors)))
+    print('median / mean abs error : {:.1f} / {:.1f} frames'.format(np.median(errors), errors.mean()))
+    print('confidence >= {} : {}/{} hits, max error {}; below : {}/{} hits'.format(
+        args.confident, hits[confident].sum(), confident.sum(), errors[confident].max(initial=0),
+        hits[~confident].sum(), (~confident).sum()))
+    print('throughput : {:.0f} frames/s (including angle computation)'.format(total_frames / total_time))
+
+    failures = []
+    if hits.mean() < args.min_hits:
+        failures.append('{:.0%} within {} frames < {:.0%}'.format(hits.mean(), args.tolerance, args.min_hits))
+    if errors.mean() > args.max_mean_error:
+        failures.append('mean abs error {:.1f} > {:.1f} frames'.format(errors.mean(), args.max_mean_error))
+    if failures:
+        raise SystemExit('key frame accuracy regressed: ' + '; '.join(failures))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,145 @@
+'''
+評分服務 (serve.py) 的壓力測試: --clients 個 client 各自一條 keep-alive 連線, 一個做完馬上送下一個 (closed loop),
+統計吞吐量、client 端延遲與被 503 拒絕的次數, 最後印出服務的 /stats
+
+--spawn 時自己在暫存的 Unix socket 上啟動一個 serve.py, 測完關掉; 否則連到 --socket 或 --host/--port
+
+在專案根目錄執行:
+    python -m benchmarks.load_test --spawn [--clients 8] [--requests 200] [--report none] [--queue-size 4]
+    python -m benchmarks.load_test --compare-cold      # 同一個請求改用每次啟動新 process 的方式, 比較冷啟動成本
+'''
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from grade_client import DEFAULT_HOST, DEFAULT_PORT, connect, grade, stats
+from reference import STANDARD_DIR
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test for the grading service')
+    parser.add_argument('--host', default=DEFAULT_HOST, type=str)
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int)
+    parser.add_argument('--socket', default=None, type=str)
+    parser.add_argument('--spawn', action='store_true', help='start a serve.py on a temporary Unix socket')
+    parser.add_argument('--workers', default=1, type=int, help='--spawn: service workers')
+    parser.add_argument('--queue-size', default=16, type=int, help='--spawn: service queue size')
+    parser.add_argument('--clients', default=8, type=int)
+    parser.add_argument('--requests', default=200, type=int, help='total requests')
+    parser.add_argument('--file', default=os.path.join(STANDARD_DIR, 'judge_5.npy'), type=str)
+    parser.add_argument('--position', default=5, type=int)
+    parser.add_argument('--report', default='png', choices=('png', 'svg', 'none'))
+    parser.add_argument('--retry', action='store_true', help='retry 503s after Retry-After instead of counting them')
+    parser.add_argument('--compare-cold', action='store_true', help='also time a fresh grade.py-style process per request')
+    parser.add_argument('--cold-runs', default=3, type=int)
+    return parser.parse_args()
+
+
+def spawn_service(socket_path, workers, queue_size):
+    command = [sys.executable, 'serve.py', '--socket', socket_path, '--workers', str(workers),
+               '--queue-size', str(queue_size), '--quiet']
+    process = subprocess.Popen(command)
+    t = time.perf_counter()
+    while time.perf_counter() - t < 60:
+        if process.poll() is not None:
+            raise RuntimeError('serve.py exited with {}'.format(process.returncode))
+        if os.path.exists(socket_path):
+            try:
+                stats(connect(socket_path=socket_path, timeout=5))
+                return process, time.perf_counter() - t
+            except OSError:
+                pass
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('serve.py did not start within 60s')
+
+
+def run_client(args, data, count, latencies, statuses, lock):
+    connection = connect(args.host, args.port, args.socket)
+    for _ in range(count):
+        while True:
+            t = time.perf_counter()
+            try:
+                status, _ = grade(connection, data, args.position, report=args.report)
+            except OSError:
+                status = 'error'
+                connection.close()
+                connection = connect(args.host, args.port, args.socket)
+            elapsed = time.perf_counter() - t
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+            if status == 503 and args.retry:
+                time.sleep(1)
+                continue
+            break
+
+
+def cold_grade(args, runs):
+    """每次啟動新的 Python process 做一樣的事(開資料庫、import matplotlib、評分、畫報告), 原本 grade.py 的成本"""
+    code = ('import numpy as np, sys; from batch_grade import grade_coordinates; from reference import load_library, get_clip;'
+            'from report import ReportRenderer; library = load_library(); c = np.load(sys.argv[1]);'
+            'job = dict(standard=1, position=int(sys.argv[2]), frame=None, sequence=False, best_match=False);'
+            'r, comments = grade_coordinates(c, {}, job, library);'
+            'ReportRenderer().render(get_clip(library, r["reference"])[0], r["reference_frame"] - 1, c, r["frame"] - 1,'
+            ' r["grade"], comments, 1, job["position"])')
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code, args.file, str(args.position)], check=True)
+        times.append(time.perf_counter() - t)
+    return np.array(times)
+
+
+def main(args):
+    with open(args.file, 'rb') as f:
+        data = f.read()
+    process = None
+    tmp = tempfile.TemporaryDirectory()
+    if args.spawn:
+        args.socket = os.path.join(tmp.name, 'swing.sock')
+        process, startup = spawn_service(args.socket, args.workers, args.queue_size)
+        print('service ready in {:.2f}s ({} workers, queue {})'.format(startup, args.workers, args.queue_size))
+    try:
+        latencies, statuses, lock = [], {}, threading.Lock()
+        counts = [args.requests // args.clients + (i < args.requests % args.clients) for i in range(args.clients)]
+        threads = [threading.Thread(target=run_client, args=(args, data, count, latencies, statuses, lock)) for count in counts]
+        t = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - t
+
+        latencies = np.array(latencies)
+        print('{} requests from {} clients in {:.2f}s, report={}'.format(args.requests, args.clients, elapsed, args.report))
+        print('status : {}'.format(', '.join('{}: {}'.format(status, n) for status, n in sorted(statuses.items(), key=str))))
+        if len(latencies):
+            print('throughput : {:.1f} grades/s'.format(len(latencies) / elapsed))
+            print('client latency : p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+                *(1000 * np.percentile(latencies, [50, 90, 99, 100]))))
+        print('service stats : {}'.format(json.dumps(stats(connect(args.host, args.port, args.socket)))))
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGINT)   # serve.py 收到 KeyboardInterrupt 會正常關閉
+            process.wait()
+        tmp.cleanup()
+
+    if args.compare_cold:
+        times = cold_grade(args, args.cold_runs)
+        print('cold process per grade : mean {:.0f} ms, min {:.0f} ms ({} runs)'.format(
+            1000 * times.mean(), 1000 * times.min(), args.cold_runs))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,257 @@
+'''
+效能回歸測試: 用 benchmarks/synthetic.py 的假揮棒 (--count 段 x --frames 幀) 量每個熱點的吞吐量,
+與存起來的 baseline (benchmarks/baseline.json) 比較, 任何一項比 baseline 慢超過門檻 (--threshold,
+個別項目見 THRESHOLDS) 就以非 0 結束, 改效能的 PR 才不會不知不覺變慢
+
+    angles.scalar     grade.calculate_angle 逐幀              frames/s
+    angles.batched    angles.calculate_angles 整批 (N, T)     frames/s
+    score.grade       grade.grade 逐筆                         calls/s
+    score.batched     Rubric.score 整批 (N, 12)               calls/s
+    key_frame         keyframe.detect_key_frame               clips/s
+    render.png        ReportRenderer.render (重複使用)          reports/s
+    serialize.npz     keypoint_store.save_npz + lift.read_npz  frames/s
+    serialize.kps     KeypointWriter + read_keypoints          frames/s
+    serialize.pose    pose_clip.write_clip + read_clip         frames/s
+
+每一項先量一次決定要連跑幾遍 (loops), 讓每次取樣至少 --min-seconds (太短的項目受計時器與排程雜訊影響很大),
+再輪流對每一項取樣 --repeat 輪, 各取最快的一次 (整台機器慢下來的一段時間不會只落在某一項上); baseline 與目前的機器 (CPU、python、numpy) 或設定不同時只警告/拒絕比較,
+換機器後先存一份新的 baseline
+
+在專案根目錄執行:
+    python -m benchmarks.suite                      與 baseline 比較
+    python -m benchmarks.suite --save               量完存成新的 baseline
+    python -m benchmarks.suite --only score render  只跑名稱開頭符合的項目
+'''
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from angles import calculate_angles
+from benchmarks.synthetic import make_clips, project_2d
+from grade import calculate_angle, grade
+from keyframe import detect_key_frame
+from keypoint_store import KeypointWriter, read_keypoints, save_npz
+from lift import read_npz
+from pose_clip import H36M_JOINTS, read_clip, write_clip
+from report import ReportRenderer
+from scoring import load_rubric
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+THRESHOLD = 0.2                                       # 比 baseline 慢 20% 以上算回歸
+THRESHOLDS = {'render.png': 0.3, 'serialize.kps': 0.4, 'serialize.npz': 0.3, 'serialize.pose': 0.4}   # 受磁碟/字型快取影響較大
+SCALAR_FRAMES = 2000                                  # 逐幀的 calculate_angle 很慢, 只跑前面這麼多幀
+RENDERS = 4
+MIN_SECONDS = 0.2                                     # 每次取樣至少這麼久
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark suite with baseline regression checks')
+    parser.add_argument('--count', default=20, type=int, help='synthetic clips')
+    parser.add_argument('--frames', default=240, type=int, help='frames per clip')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--min-seconds', default=MIN_SECONDS, type=float, help='run each case this long per sample')
+    parser.add_argument('--only', default=None, nargs='+', help='run the cases whose name starts with one of these')
+    parser.add_argument('--baseline', default=BASELINE_PATH, type=str)
+    parser.add_argument('--threshold', default=THRESHOLD, type=float, help='allowed slowdown for cases not in THRESHOLDS')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline instead of comparing')
+    parser.add_argument('--output', default=None, type=str, help='also write this run as JSON')
+    return parser.parse_args()
+
+
+def sample(fn, loops):
+    """fn 連跑 loops 遍的秒數"""
+    t = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - t
+
+
+def calibrate(fn, min_seconds):
+    """一次取樣要連跑幾遍才有 min_seconds (同 timeit.autorange 每次加倍); 先跑一遍暖機, 不算進去"""
+    fn()
+    loops = 1
+    while sample(fn, loops) < min_seconds:
+        loops *= 2
+    return loops
+
+
+def setup_angles_scalar(clips, workdir):
+    frames = np.concatenate([clip for clip, _ in clips])[:SCALAR_FRAMES].astype(np.float64)
+    return len(frames), lambda: [calculate_angle(frame) for frame in frames]
+
+
+def setup_angles_batched(clips, workdir):
+    batch = np.stack([clip for clip, _ in clips])
+    return batch.shape[0] * batch.shape[1], lambda: calculate_angles(batch)
+
+
+def contact_angles(clips):
+    """每段擊球幀的角度 (N, 12), 與下一段兩兩評分"""
+    angles = np.stack([calculate_angles(clip[contact]) for clip, contact in clips])
+    return angles, np.roll(angles, 1, axis=0)
+
+
+def setup_score_grade(clips, workdir):
+    angles_1, angles_2 = contact_angles(clips)
+    pairs = [(list(a), list(b)) for a, b in zip(angles_1, angles_2)] * max(1, 2000 // len(clips))
+    return len(pairs), lambda: [grade(a, b) for a, b in pairs]
+
+
+def setup_score_batched(clips, workdir):
+    angles_1, angles_2 = contact_angles(clips)
+    deltas = np.tile(angles_1 - angles_2, (max(1, 100000 // len(clips)), 1))
+    rubric = load_rubric()
+    return len(deltas), lambda: rubric.score(deltas)
+
+
+def setup_key_frame(clips, workdir):
+    return len(clips), lambda: [detect_key_frame(clip) for clip, _ in clips]
+
+
+def setup_render_png(clips, workdir):
+    renderer = ReportRenderer()
+    (clip_1, contact_1), (clip_2, contact_2) = clips[0], clips[1 % len(clips)]
+    _, grade_point, comments = grade(list(calculate_angles(clip_1[contact_1])), list(calculate_angles(clip_2[contact_2])))
+    report = (clip_1, contact_1, clip_2, contact_2, grade_point, comments, 1, 5)
+    renderer.render(*report)   # 第一次要載入字型、建 figure
+    return RENDERS, lambda: [renderer.render(*report, format='png') for _ in range(RENDERS)]
+
+
+def setup_serialize_npz(clips, workdir):
+    boxes, keypoints = project_2d(np.concatenate([clip for clip, _ in clips]))
+    path = os.path.join(workdir, 'keypoints.npz')
+    metadata = {'w': 1920, 'h': 1080, 'fps': 30.0}
+
+    def run():
+        save_npz(path, boxes, keypoints, metadata)
+        read_npz(path)
+    return len(boxes), run
+
+
+def setup_serialize_kps(clips, workdir):
+    boxes, keypoints = project_2d(np.concatenate([clip for clip, _ in clips]))
+    path = os.path.join(workdir, 'keypoints.kps')
+
+    def run():
+        writer = KeypointWriter(path, metadata={'run': time.perf_counter()})
+        writer.resume()
+        for bbox, kps in zip(boxes, keypoints):
+            writer.append(bbox, kps)
+        writer.close()
+        data = read_keypoints(path)
+        np.asarray(data['keypoints']).sum()
+    return len(boxes), run
+
+
+def setup_serialize_pose(clips, workdir):
+    coordinates = np.concatenate([clip for clip, _ in clips])
+    path = os.path.join(workdir, 'clip.pose')
+
+    def run():
+        write_clip(path, {'coordinates': coordinates}, kind='3d', fps=30.0, joints=H36M_JOINTS)
+        np.asarray(read_clip(path, mmap=False)['coordinates']).sum()
+    return len(coordinates), run
+
+
+CASES = {
+    'angles.scalar': ('frames', setup_angles_scalar),
+    'angles.batched': ('frames', setup_angles_batched),
+    'score.grade': ('calls', setup_score_grade),
+    'score.batched': ('calls', setup_score_batched),
+    'key_frame': ('clips', setup_key_frame),
+    'render.png': ('reports', setup_render_png),
+    'serialize.npz': ('frames', setup_serialize_npz),
+    'serialize.kps': ('frames', setup_serialize_kps),
+    'serialize.pose': ('frames', setup_serialize_pose),
+}
+
+
+def machine():
+    return {'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def run_cases(names, clips, repeat, min_seconds=MIN_SECONDS):
+    """{名稱: {'unit', 'throughput' (unit/s), 'seconds' (最快的一次取樣), 'loops' (每次取樣跑幾遍)}}"""
+    cases = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            unit, setup = CASES[name]
+            units, run = setup(clips, workdir)
+            cases[name] = (unit, units, run, calibrate(run, min_seconds))
+        best = dict.fromkeys(names, float('inf'))
+        for _ in range(repeat):
+            for name, (_, _, run, loops) in cases.items():
+                best[name] = min(best[name], sample(run, loops))
+    return {name: {'unit': unit, 'throughput': units * loops / best[name], 'seconds': best[name], 'loops': loops}
+            for name, (unit, units, _, loops) in cases.items()}
+
+
+def compare(results, baseline, threshold):
+    """印出與 baseline 比較的表, 回傳回歸的項目"""
+    regressions = []
+    print('{:<16}{:>9}{:>14}{:>14}{:>9}  {}'.format('case', 'unit', 'throughput', 'baseline', 'change', 'status'))
+    for name, result in results.items():
+        before = baseline.get(name, {}).get('throughput')
+        if before is None:
+            print('{:<16}{:>9}{:>14.1f}{:>14}{:>9}  new'.format(name, result['unit'], result['throughput'], '-', '-'))
+            continue
+        change = result['throughput'] / before - 1
+        limit = THRESHOLDS.get(name, threshold)
+        status = 'ok'
+        if change < -limit:
+            status = 'REGRESSION (limit -{:.0%})'.format(limit)
+            regressions.append(name)
+        print('{:<16}{:>9}{:>14.1f}{:>14.1f}{:>+9.1%}  {}'.format(name, result['unit'], result['throughput'], before, change, status))
+    return regressions
+
+
+def main(args):
+    names = [name for name in CASES if args.only is None or any(name.startswith(prefix) for prefix in args.only)]
+    if not names:
+        raise SystemExit('no case matches {}'.format(args.only))
+    config = {'count': args.count, 'frames': args.frames, 'seed': args.seed}
+    clips = make_clips(args.count, args.frames, args.seed)
+    results = run_cases(names, clips, args.repeat, args.min_seconds)
+    run = {'machine': machine(), 'config': config, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.save:
+        if os.path.exists(args.baseline) and args.only:
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            if previous['config'] == config:   # 只重跑幾項時保留其他項目
+                run['results'] = dict(previous['results'], **results)
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        for name, result in results.items():
+            print('{:<16}{:>14.1f} {}/s'.format(name, result['throughput'], result['unit']))
+        print('baseline -> {}'.format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        raise SystemExit('no baseline at {}; run with --save first'.format(args.baseline))
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['config'] != config:
+        raise SystemExit('baseline was measured with {}, this run is {}; use the same options or --save'.format(
+            baseline['config'], config))
+    if baseline['machine'] != run['machine']:
+        print('warning: baseline is from a different machine {}; numbers may not be comparable'.format(baseline['machine']))
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        raise SystemExit('{} regressed: {}'.format(len(regressions), ', '.join(regressions)))
+    print('no regressions ({} cases)'.format(len(results)))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
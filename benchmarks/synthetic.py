@@ -0,0 +1,103 @@
+'''
+假的揮棒骨架 (T, 17, 3): 與 standard/*.npy 相同的 Human3.6M 順序與相機座標 (y 向下, hip(0) 為原點),
+給 benchmarks/suite.py 用, 不依賴 standard/ 裡有哪些檔案, 長度與數量都可以任意調
+
+站姿 (REST_POSE, 取自 ohtani_1 的第一幀, 隨機縮放) 之後:
+    跨步      前腳 (左腳) 在擊球前抬起再踩下
+    髖旋轉    擊球 (contact) 前後以 sigmoid 繞垂直軸轉開
+    肩旋轉    比髖晚幾幀、轉得更多, 上半身繞髖部中心
+    手臂      再多轉一段, 兩手腕在擊球時最快
+每個關節加上幾 mm 的雜訊 (VideoPose3D 的抖動); 擊球幀落在整段的 40% ~ 70%
+
+    python -m benchmarks.synthetic out_dir [--count 20] [--frames 240]      存成 .npy (batch_grade.py 可以直接讀)
+'''
+import argparse
+import os
+
+import numpy as np
+
+REST_POSE = np.array([
+    [0.00, 0.00, 0.00], [-0.11, 0.01, 0.01], [-0.28, 0.37, -0.02], [-0.54, 0.68, 0.16],
+    [0.11, -0.01, -0.01], [0.17, 0.36, -0.14], [0.26, 0.74, 0.02], [0.01, -0.22, -0.02],
+    [0.00, -0.46, -0.08], [-0.08, -0.48, -0.13], [-0.05, -0.58, -0.16], [0.13, -0.43, -0.05],
+    [0.43, -0.47, -0.09], [0.32, -0.51, -0.21], [-0.10, -0.40, -0.08], [0.01, -0.30, -0.26],
+    [0.21, -0.44, -0.24]], dtype=np.float64)
+UPPER_BODY = list(range(7, 17))
+ARMS = [12, 13, 15, 16]
+FRONT_LEG = [5, 6]
+
+
+def _yaw(points, angle, center):
+    """繞通過 center 的垂直軸 (y) 轉 angle (弧度, 每幀一個); points (T, J, 3)"""
+    cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    x, z = points[..., 0] - center[..., 0], points[..., 2] - center[..., 2]
+    rotated = points.copy()
+    rotated[..., 0] = center[..., 0] + cos * x - sin * z
+    rotated[..., 2] = center[..., 2] + sin * x + cos * z
+    return rotated
+
+
+def swing_clip(frames, rng, fps=30.0):
+    """一段 (frames, 17, 3) float32 的揮棒與擊球幀 (0-based)"""
+    contact = int(rng.uniform(0.4, 0.7) * frames)
+    t = (np.arange(frames) - contact) / fps                                  # 秒, 擊球為 0
+    speed = rng.uniform(0.06, 0.1)                                          # 旋轉的時間常數 (秒)
+
+    def ramp(delay, amplitude):
+        return amplitude / (1 + np.exp(-(t - delay) / speed))
+
+    hips = ramp(-0.08, np.radians(rng.uniform(50, 80)))
+    shoulders = ramp(-0.04, np.radians(rng.uniform(70, 100)))
+    arms = ramp(0.0, np.radians(rng.uniform(40, 70)))
+    pose = np.repeat(REST_POSE[None] * rng.uniform(0.9, 1.1), frames, axis=0)
+    stride = np.exp(-((t + 0.35) / 0.12) ** 2) * rng.uniform(0.08, 0.15)   # 擊球前約 0.35 秒抬前腳
+    pose[:, FRONT_LEG, 1] -= stride[:, None]
+    pose[:, FRONT_LEG, 0] += 0.5 * stride[:, None]
+    center = pose[:, :1]
+    pose[:, [1, 2, 4, 5]] = _yaw(pose[:, [1, 2, 4, 5]], hips, center)
+    pose[:, UPPER_BODY] = _yaw(pose[:, UPPER_BODY], shoulders, center)
+    pose[:, ARMS] = _yaw(pose[:, ARMS], arms, pose[:, 8:9])
+    pose += rng.normal(0, 0.004, pose.shape)
+    pose -= pose[:, :1]
+    return pose.astype(np.float32), contact
+
+
+def make_clips(count, frames, seed=0):
+    """count 段 (clip, 擊球幀), 同一個 seed 每次都一樣"""
+    rng = np.random.default_rng(seed)
+    return [swing_clip(frames, rng) for _ in range(count)]
+
+
+def project_2d(clip, w=1920, h=1080):
+    """(T, 17, 3) -> 假的 Detectron 輸出 boxes (T, 5)、keypoints (T, 4, 17) (正交投影, 身高約 0.6 h), 給序列化的測試用"""
+    points = clip[..., :2] / 1.6 * 0.6 * h + np.array([w / 2, h / 2])
+    keypoints = np.ones((len(clip), 4, 17), dtype=np.float32)
+    keypoints[:, :2] = points.transpose(0, 2, 1)
+    keypoints[:, 3] = 0.9
+    boxes = np.column_stack([points.min(axis=1), points.max(axis=1), np.full(len(clip), 0.99)]).astype(np.float32)
+    return boxes, keypoints
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write synthetic swing clips as .npy')
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', default=20, type=int)
+    parser.add_argument('--frames', default=240, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    return parser.parse_args()
+
+
+def main(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'manifest.csv'), 'w') as f:
+        f.write('file,position,frame\n')
+        for i, (clip, contact) in enumerate(make_clips(args.count, args.frames, args.seed)):
+            name = 'synthetic_{:04d}.npy'.format(i)
+            np.save(os.path.join(args.output_dir, name), clip)
+            f.write('{},{},{}\n'.format(name, i % 9 + 1, contact + 1))
+    print('{} clips of {} frames -> {}'.format(args.count, args.frames, args.output_dir))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,188 @@
+import argparse
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+
+from angles import calculate_angles
+from keyframe import detect_key_frame
+from normalize import normalize_clip, plot_limits
+from pose_clip import load_coordinates
+from reference import LIBRARY_DIR, PLAYERS, load_library, get_reference
+from report import PLAYER_NAMES, add_skeleton_axes, set_skeleton, blit
+from sequence import SWING_BEFORE, SWING_AFTER, banded_dtw, swing_window
+from video_io import open_writer, close_writer
+'''
+標準與使用者的揮棒並排成一段 mp4 (骨架 + 金色輔助線), 兩邊依關鍵幀/DTW 對齊時間
+
+只建立一次 figure, 背景(座標軸)畫一次存起來, 之後每一幀只更新骨架與文字再 blit,
+raw RGB 幀直接從 stdin 餵給 ffmpeg 編碼; --workers > 1 時由多個 process 分段畫,
+主程序依序把結果寫進 ffmpeg, 同時在途的段數有上限, 記憶體不會跟著影片長度增加
+
+在專案根目錄執行:
+    python export_video.py user.npy --standard 1 --position 5 [--frame 116] [--output comparison.mp4]
+'''
+FPS = 30              # standard/ 的影片都是 30 fps
+FIGSIZE = (12.8, 6.4)
+DPI = 100             # 1280 x 640, yuv420p 需要偶數的寬高
+CHUNK_SIZE = 8        # 每個 worker 一次畫幾幀
+
+_renderer = None      # 每個 worker process 建一次
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Side-by-side swing comparison video')
+    parser.add_argument('user', help='user .npy (T, 17, 3) or .pose file')
+    parser.add_argument('--standard', default=1, type=int, choices=sorted(PLAYERS), help='1: Ohtani, 2: Judge')
+    parser.add_argument('--position', required=True, type=int, choices=range(1, 10))
+    parser.add_argument('--frame', default=None, type=int, help='user key frame (1-based); detected when omitted')
+    parser.add_argument('--align', default='dtw', choices=('dtw', 'keyframe'), help='time alignment inside the swing window')
+    parser.add_argument('--swing-only', action='store_true', help='only export the swing window around the key frames')
+    parser.add_argument('--output', default='comparison.mp4', type=str)
+    parser.add_argument('--fps', default=FPS, type=float)
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--library-dir', default=LIBRARY_DIR, type=str)
+    parser.add_argument('--normalize', action='store_true', help='show both clips in the canonical batter frame (normalize.py)')
+    return parser.parse_args()
+
+
+def align_frames(length_1, key_frame_1, length_2, key_frame_2, angles_1=None, angles_2=None, band=15):
+    """
+    兩段影片以關鍵幀對齊後的時間軸, 涵蓋兩段影片的全部(較短的一邊停在第一/最後一幀)
+    有給角度時, 揮棒視窗內改用 DTW 的對齊: 標準那邊跟著使用者的動作走
+    回傳 (frames_1, frames_2, relative): 每個輸出幀兩邊各顯示第幾幀, 以及相對關鍵幀的幀數
+    """
+    relative = np.arange(-max(key_frame_1, key_frame_2), max(length_1 - key_frame_1, length_2 - key_frame_2))
+    frames_1 = np.clip(key_frame_1 + relative, 0, length_1 - 1)
+    frames_2 = np.clip(key_frame_2 + relative, 0, length_2 - 1)
+    if angles_1 is not None and angles_2 is not None:
+        window_1, key_1 = swing_window(angles_1, key_frame_1)
+        window_2, key_2 = swing_window(angles_2, key_frame_2)
+        _, path = banded_dtw(window_1, window_2, band)
+        # 使用者視窗的每一幀對到 path 上第一個與它配對的標準幀
+        _, first = np.unique(path[:, 1], return_index=True)
+        matched = path[first, 0]
+        index = key_frame_2 + relative - (key_frame_2 - key_2)
+        inside = (index >= 0) & (index < len(window_2))
+        frames_1[inside] = key_frame_1 - key_1 + matched[index[inside]]
+    return frames_1, frames_2, relative
+
+
+def swing_only(frames_1, frames_2, relative):
+    """只留揮棒視窗(sequence.PHASES 的範圍)"""
+    inside = (relative >= -SWING_BEFORE) & (relative < SWING_AFTER)
+    return frames_1[inside], frames_2[inside], relative[inside]
+
+
+class FrameRenderer:
+    def __init__(self, coordinates_1, coordinates_2, title, fps=FPS, figsize=FIGSIZE, dpi=DPI):
+        self.coordinates = (coordinates_1, coordinates_2)
+        self.fps = fps
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        gs = GridSpec(1, 2, figure=self.figure)
+        limit = plot_limits(coordinates_1, coordinates_2)   # 整段影片用同一個範圍, 骨架才不會跳動
+        self.skeletons = [add_skeleton_axes(self.figure, gs[0, column], name, limit)
+                          for column, name in enumerate(("STANDARD", "YOU"))]
+        self.frame_texts = [self.figure.text(x, 0.86, "", fontsize=12, color='black') for x in (0.38, 0.82)]
+        self.time_text = self.figure.text(0.5, 0.04, "", fontsize=14, ha='center')
+        self.figure.suptitle(title, fontsize=16)
+        self.figure.tight_layout(rect=(0, 0.06, 1, 0.95))
+        self.figure.set_layout_engine('none')
+
+        self.dynamic = [artist for skeleton in self.skeletons for artist in skeleton[::-1]] + self.frame_texts + [self.time_text]
+        for artist in self.dynamic:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def render(self, frame_1, frame_2, relative):
+        """畫一幀, 回傳 rgb24 的 bytes"""
+        for (scatter, bones), frame_text, coordinates, frame_index in zip(
+                self.skeletons, self.frame_texts, self.coordinates, (frame_1, frame_2)):
+            set_skeleton(scatter, bones, coordinates[frame_index])
+            frame_text.set_text("frame : {}".format(frame_index + 1))   # 實際偵數
+        if relative == 0:
+            self.time_text.set_text("CONTACT")
+        else:
+            self.time_text.set_text("contact {:+.2f} s".format(relative / self.fps))
+        image = blit(self.canvas, self.background, self.dynamic)
+        return image[:, :, :3].tobytes()
+
+
+def init_worker(coordinates_1, coordinates_2, title, fps):
+    global _renderer
+    _renderer = FrameRenderer(coordinates_1, coordinates_2, title, fps)
+
+
+def render_chunk(chunk):
+    """chunk = [(frame_1, frame_2, relative), ...] -> 連續的 rgb24 幀"""
+    return b''.join(_renderer.render(*frame) for frame in chunk)
+
+
+def export_video(coordinates_1, coordinates_2, frames_1, frames_2, relative, title, output, fps=FPS, workers=1):
+    """把對齊好的兩段骨架畫成 mp4, 回傳幀數"""
+    frames = list(zip(frames_1.tolist(), frames_2.tolist(), relative.tolist()))
+    chunks = [frames[i:i + CHUNK_SIZE] for i in range(0, len(frames), CHUNK_SIZE)]
+    w, h = int(FIGSIZE[0] * DPI), int(FIGSIZE[1] * DPI)
+    initargs = (np.asarray(coordinates_1), np.asarray(coordinates_2), title, fps)
+
+    writer = open_writer(output, w, h, fps)
+    try:
+        if workers <= 1:
+            init_worker(*initargs)
+            for chunk in chunks:
+                writer.stdin.write(render_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+                # 依序寫入, 同時最多 2 * workers 段在途
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(render_chunk, chunk))
+                    if len(pending) >= 2 * workers:
+                        writer.stdin.write(pending.popleft().result())
+                while pending:
+                    writer.stdin.write(pending.popleft().result())
+    finally:
+        close_writer(writer)
+    return len(frames)
+
+
+def main(args):
+    coordinates_1, angles_1, key_frame_1 = get_reference(load_library(args.library_dir), args.standard, args.position,
+                                                         args.normalize)
+    coordinates_2, header = load_coordinates(args.user)
+    if args.normalize:
+        coordinates_2 = normalize_clip(coordinates_2)[0]
+    angles_2 = calculate_angles(coordinates_2)
+    if args.frame is None and 'contact' in header.get('key_frames', {}):
+        key_frame_2 = header['key_frames']['contact']
+    elif args.frame is None:
+        key_frame_2, confidence = detect_key_frame(coordinates_2, angles_2)
+        print('Detected key frame {} (confidence {:.2f})'.format(key_frame_2 + 1, confidence))
+    else:
+        key_frame_2 = args.frame - 1
+
+    if args.align == 'dtw':
+        aligned = align_frames(len(coordinates_1), key_frame_1, len(coordinates_2), key_frame_2, angles_1, angles_2)
+    else:
+        aligned = align_frames(len(coordinates_1), key_frame_1, len(coordinates_2), key_frame_2)
+    if args.swing_only:
+        aligned = swing_only(*aligned)
+
+    title = "Your Swing vs. {} at position {}".format(PLAYER_NAMES[args.standard], args.position)
+    t = time.perf_counter()
+    frames = export_video(coordinates_1, coordinates_2, *aligned, title, args.output, args.fps, args.workers)
+    elapsed = time.perf_counter() - t
+    print('{} frames in {:.2f}s ({:.1f} fps, {} workers) -> {}'.format(
+        frames, elapsed, frames / elapsed, args.workers, os.path.abspath(args.output)))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,142 @@
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import sys
+from urllib.parse import urlencode
+'''
+serve.py 的 client: 上傳 .npy / .pose 取得評分與報告, 或把影片送到 /detect 取得 2D 關鍵點 .npz
+只用標準函式庫, 不會 import matplotlib / numpy, 啟動很快
+
+    python grade_client.py user.npy --position 5 [--standard 1] [--report grade.png] [--socket /tmp/swing.sock]
+    python grade_client.py input.mp4 --detect --output input.mp4.npz
+    python grade_client.py --stats
+'''
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """走 Unix socket 的 HTTPConnection"""
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=120):
+    if socket_path:
+        return UnixHTTPConnection(socket_path, timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def request(connection, method, path, body=None, content_type='application/octet-stream'):
+    """送出一個請求, 回傳 (status, headers, body bytes); 同一個 connection 可以重複使用 (keep-alive)"""
+    headers = {'Content-Type': content_type} if body is not None else {}
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+
+def grade(connection, data, position=None, standard=1, frame=None, report='png', sequence=False, best_match=False,
+          smooth=None, normalize=False, player=None):
+    """data 為 .npy 或 .pose 檔案的 bytes, 回傳 (status, 結果 dict)"""
+    params = {'standard': standard, 'report': report}
+    for name, value in (('position', position), ('frame', frame)):
+        if value is not None:
+            params[name] = value
+    if sequence:
+        params['sequence'] = 1
+    if best_match:
+        params['best_match'] = 1
+    if smooth:
+        params['smooth'] = smooth
+    if normalize:
+        params['normalize'] = 1
+    if player:
+        params['player'] = player
+    status, _, body = request(connection, 'POST', '/grade?' + urlencode(params), data)
+    return status, json.loads(body)
+
+
+def detect(connection, data, **params):
+    """data 為影片檔的 bytes, 成功時回傳 (200, .npz bytes), 失敗時 (status, 錯誤 dict)"""
+    status, _, body = request(connection, 'POST', '/detect?' + urlencode(params), data)
+    return status, body if status == 200 else json.loads(body)
+
+
+def stats(connection):
+    return json.loads(request(connection, 'GET', '/stats')[2])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Client for the swing grading service (serve.py)')
+    parser.add_argument('input', nargs='?', help='user .npy / .pose, or a video with --detect')
+    parser.add_argument('--host', default=DEFAULT_HOST, type=str)
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int)
+    parser.add_argument('--socket', default=None, type=str, help='Unix socket path instead of host/port')
+    parser.add_argument('--standard', default=1, type=int, help='1: Ohtani, 2: Judge')
+    parser.add_argument('--position', default=None, type=int)
+    parser.add_argument('--frame', default=None, type=int, help='user key frame (1-based); detected when omitted')
+    parser.add_argument('--sequence', action='store_true')
+    parser.add_argument('--best-match', action='store_true')
+    parser.add_argument('--smooth', default=None, choices=('savgol', 'one_euro', 'none'),
+                        help='repair dropped / broken frames on the server before grading')
+    parser.add_argument('--normalize', action='store_true', help='grade in the canonical batter frame')
+    parser.add_argument('--player', default=None, type=str, help='hitter name for the service analytics store')
+    parser.add_argument('--report', default='grade.png', type=str, help='report path (.png / .svg), "none" to skip')
+    parser.add_argument('--detect', action='store_true', help='send a video to /detect instead of grading')
+    parser.add_argument('--stride', default=1, type=int, help='--detect: keep every n-th frame')
+    parser.add_argument('--output', default=None, type=str, help='--detect: output .npz (default: <input>.npz)')
+    parser.add_argument('--stats', action='store_true', help='print the service stats and exit')
+    return parser.parse_args()
+
+
+def main(args):
+    connection = connect(args.host, args.port, args.socket)
+    if args.stats:
+        print(json.dumps(stats(connection), indent=1))
+        return
+    with open(args.input, 'rb') as f:
+        data = f.read()
+
+    if args.detect:
+        status, result = detect(connection, data, stride=args.stride)
+        if status != 200:
+            print('{}: {}'.format(status, result.get('error')), file=sys.stderr)
+            sys.exit(1)
+        output = args.output or args.input + '.npz'
+        with open(output, 'wb') as f:
+            f.write(result)
+        print('keypoints -> {}'.format(output))
+        return
+
+    report = 'none' if args.report == 'none' else os.path.splitext(args.report)[1][1:] or 'png'
+    status, result = grade(connection, data, args.position, args.standard, args.frame, report, args.sequence, args.best_match,
+                           args.smooth, args.normalize, args.player)
+    if status != 200:
+        print('{}: {}'.format(status, result.get('error')), file=sys.stderr)
+        sys.exit(1)
+    print('reference : {} frame {}, your frame {} ({})'.format(
+        result['reference'], result['reference_frame'], result['frame'], result['frame_source']))
+    print('similar point : {:.3f}'.format(result['similarity']))
+    print('grade point : {:.3f}'.format(result['grade']))
+    for comment in result['comments']:
+        print('  {:<18}{:<12}{:+.1f}'.format(comment['angle'], comment['comment'], comment['delta_theta']))
+    if 'report' in result:
+        with open(args.report, 'wb') as f:
+            f.write(base64.b64decode(result['report']))
+        print('report : {}'.format(args.report))
+    print('latency : {:.1f} ms ({:.1f} ms queued)'.format(result['latency_ms'], result['wait_ms']))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
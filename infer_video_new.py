@@ -3,17 +3,38 @@ from detectron2.utils.logger import setup_logger
 from detectron2.config import get_cfg
 from detectron2 import model_zoo
 from detectron2.engine import DefaultPredictor
+from detectron2.structures import Boxes, Instances
+import detectron2.data.transforms as T
 
-import subprocess as sp
 import numpy as np
 import time
 import argparse
 import sys
 import os
 import glob
+import queue
+import threading
+import asyncio
+import contextlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import torch
 
-def parse_args():
+from batch_grade import grade_coordinates
+from keypoint_store import KeypointWriter, read_keypoints, save_npz
+from lift import LIFTER_PATH, StreamingLifter, lift_keypoints, load_lifter
+from pose_cache import CACHE_DIR, MAX_BYTES, PoseCache, key_3d, print_stats
+from pose_clip import COCO_JOINTS, H36M_JOINTS, write_clip
+from profiling import PROFILE_PATH, PROFILER, count, finish_profile, profiled, record
+from reference import PLAYERS, load_library
+from smoothing import METHODS as SMOOTHING_METHODS, repair_keypoints_2d
+from tracks import Tracker, batter_scores, track_path
+from video_io import (probe_video, plan_sampling, read_video, skip_samples, to_source, motion_window,
+                      probe_video_async, read_video_async, motion_window_async)
+
+MIN_TRACK_IOU = 0.3   # 與前一幀的框 IoU 超過這個值才視為同一個人
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='End-to-end inference')
     parser.add_argument(
         '--cfg',
@@ -22,6 +43,13 @@ def parse_args():
         default=None,
         type=str
     )
+    parser.add_argument(
+        '--score-thresh',
+        dest='score_thresh',
+        help='detection score threshold (default: 0.7)',
+        default=0.7,
+        type=float
+    )
     parser.add_argument(
         '--output-dir',
         dest='output_dir',
@@ -36,50 +64,240 @@ def parse_args():
         default='mp4',
         type=str
     )
+    parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        help='frames per model call; decoding runs on a background thread (default: 1)',
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        '--track',
+        dest='track',
+        help='run full detection only every --keyframe-interval frames and track the batter in between',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--keyframe-interval',
+        dest='keyframe_interval',
+        help='frames between full detections in --track mode (default: 15)',
+        default=15,
+        type=int
+    )
+    parser.add_argument(
+        '--crop-size',
+        dest='crop_size',
+        help='short side of the tracking crop fed to the model (default: 320)',
+        default=320,
+        type=int
+    )
+    parser.add_argument(
+        '--redetect-ratio',
+        dest='redetect_ratio',
+        help='re-detect when tracked keypoint confidence drops below this ratio of the last detection (default: 0.5)',
+        default=0.5,
+        type=float
+    )
+    parser.add_argument(
+        '--stream',
+        dest='stream',
+        help='write keypoints in chunks to <output>.kps and resume from the last completed chunk',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        dest='chunk_size',
+        help='frames per chunk in --stream mode (default: 64)',
+        default=64,
+        type=int
+    )
+    parser.add_argument(
+        '--stride',
+        dest='stride',
+        help='analyse every n-th frame (default: 1)',
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        '--start',
+        dest='start_time',
+        help='start time in seconds',
+        default=None,
+        type=float
+    )
+    parser.add_argument(
+        '--end',
+        dest='end_time',
+        help='end time in seconds',
+        default=None,
+        type=float
+    )
+    parser.add_argument(
+        '--motion-window',
+        dest='motion_window',
+        help='only analyse the N seconds with the most motion (the swing), found on a low-res pre-pass (default: off)',
+        default=None,
+        type=float
+    )
+    parser.add_argument(
+        '--crop',
+        dest='crop',
+        help='crop x,y,w,h in source pixels before inference',
+        default=None,
+        type=lambda value: tuple(int(v) for v in value.split(','))
+    )
+    parser.add_argument(
+        '--max-size',
+        dest='max_size',
+        help='downscale so the long side is at most this many pixels (default: off)',
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        '--cache',
+        dest='cache',
+        help='reuse detections of videos already processed with the same settings (content-addressed)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        help='cache directory (default: ./cache or $SWING_CACHE_DIR)',
+        default=CACHE_DIR,
+        type=str
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        help='cache size limit in MB, least recently used results are evicted (default: 2048)',
+        default=MAX_BYTES >> 20,
+        type=int
+    )
+    parser.add_argument(
+        '--smooth',
+        dest='smooth',
+        help='fill gaps (frames without a person, low-score joints) and smooth the .npz keypoints: savgol, one_euro or none (default: none)',
+        default='none',
+        choices=SMOOTHING_METHODS
+    )
+    parser.add_argument(
+        '--decoders',
+        dest='decoders',
+        help='asyncio ingestion: probe/decode up to N videos at once, feeding one shared inference worker (default: off)',
+        default=0,
+        type=int
+    )
+    parser.add_argument(
+        '--people',
+        dest='people',
+        help='keep every detected person: link them into tracks, write <video>.track<id>.npz per track and '
+             'the batter track (heuristic, see tracks.py) as <video>.npz',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--lift',
+        dest='lift',
+        help='lift the 2D keypoints to 3D in-process while inference runs and write <video>.pose '
+             '(lift.py weights, default: {})'.format(LIFTER_PATH),
+        nargs='?',
+        default=None,
+        const=LIFTER_PATH,
+        type=str
+    )
+    parser.add_argument(
+        '--position',
+        dest='position',
+        help='with --lift: grade the 3D pose in memory against this position (1~9) of --standard',
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        '--standard',
+        dest='standard',
+        help='with --position: 1: Ohtani, 2: Judge (default: 1)',
+        default=1,
+        type=int,
+        choices=sorted(PLAYERS)
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='time every stage (profiling.py): print a summary table and write a Chrome trace '
+             '(default: {})'.format(PROFILE_PATH),
+        nargs='?',
+        default=None,
+        const=PROFILE_PATH,
+        type=str
+    )
     parser.add_argument(
         'im_or_folder', help='image or folder of images', default=None
     )
-    if len(sys.argv) == 1:
+    if argv is None and len(sys.argv) == 1:
         parser.print_help()
         sys.exit(1)
-    return parser.parse_args()
-
-def get_resolution(filename):
-    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
-               '-show_entries', 'stream=width,height', '-of', 'csv=p=0', filename]
-    pipe = sp.Popen(command, stdout=sp.PIPE, bufsize=-1)
-    for line in pipe.stdout:
-        w, h = line.decode().strip().split(',')
-        return int(w), int(h)
-
-def read_video(filename):
-    w, h = get_resolution(filename)
-
-    command = ['ffmpeg',
-            '-i', filename,
-            '-f', 'image2pipe',
-            '-pix_fmt', 'bgr24',
-            '-vsync', '0',
-            '-vcodec', 'rawvideo', '-']
-
-    pipe = sp.Popen(command, stdout=sp.PIPE, bufsize=-1)
-    while True:
-        data = pipe.stdout.read(w*h*3)
-        if not data:
-            break
-        yield np.frombuffer(data, dtype='uint8').reshape((h, w, 3))
+    args = parser.parse_args(argv)
+    if args.decoders and args.track:
+        parser.error('--decoders does not support --track (tracking runs frame by frame per video)')
+    if args.people and (args.track or args.stream):
+        parser.error('--people does not support --track or --stream (tracks are linked over the whole clip)')
+    if args.position is not None and args.lift is None:
+        parser.error('--position grades the lifted 3D pose, it needs --lift')
+    return args
+
+def make_plan(video_name, args):
+    """一次 ffprobe, 依參數決定時間區段/抽幀/裁切/縮放, 回傳 (info, plan)"""
+    info = probe_video(video_name)
+    start_time, end_time = args.start_time, args.end_time
+    if args.motion_window:
+        start_time, end_time = motion_window(video_name, info, args.motion_window)
+        print('Motion window {:.2f}s-{:.2f}s'.format(start_time, end_time))
+    plan = plan_sampling(info, args.stride, start_time, end_time, args.crop, args.max_size)
+    return info, plan
 
-def get_best_person(bbox_tensor, kps, scores):
-    """選擇最佳的人物檢測結果"""
+def detection_config(args, plan):
+    """會影響 2D 結果的設定, 當作快取 key 的一部分"""
+    config = {'cfg': args.cfg, 'score_thresh': args.score_thresh, 'start_frame': plan['start_frame'],
+              'end_frame': plan['end_frame'], 'stride': plan['stride'], 'crop': list(plan['crop']), 'scale': plan['scale']}
+    if args.track:
+        config.update(track=True, keyframe_interval=args.keyframe_interval, crop_size=args.crop_size,
+                      redetect_ratio=args.redetect_ratio)
+    if args.people:
+        config['people'] = True
+    return config
+
+def sampling_metadata(info, plan):
+    """存進輸出的 metadata: 第 i 幀是原始影片的第 start_frame + i * stride 幀"""
+    return {'w': info['w'], 'h': info['h'], 'fps': plan['fps'] / plan['stride'],
+            'start_frame': plan['start_frame'], 'end_frame': plan['end_frame'], 'stride': plan['stride'],
+            'crop': list(plan['crop']), 'scale': plan['scale']}
+
+def box_iou(boxes, box):
+    """boxes (N, 4+) 與單一個 box (4,) 的 IoU"""
+    x1 = np.maximum(boxes[:, 0], box[0])
+    y1 = np.maximum(boxes[:, 1], box[1])
+    x2 = np.minimum(boxes[:, 2], box[2])
+    y2 = np.minimum(boxes[:, 3], box[3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    area_box = (box[2] - box[0]) * (box[3] - box[1])
+    return inter / np.maximum(area + area_box - inter, 1e-6)
+
+@profiled('best_person')
+def get_best_person(bbox_tensor, kps, scores, prev_box=None):
+    """選擇最佳的人物檢測結果; 有前一幀的框時選 IoU 最大的, 避免換成捕手或裁判"""
     if len(scores) == 0:
-        return None, None
+        return None, None, None
     
     # 使用分數選擇最佳檢測結果
     best_idx = np.argmax(scores)
+    if prev_box is not None:
+        ious = box_iou(bbox_tensor, prev_box)
+        if ious.max() >= MIN_TRACK_IOU:
+            best_idx = np.argmax(ious)
     best_bbox = bbox_tensor[best_idx:best_idx+1]  # 保持2D形狀
     best_kps = kps[best_idx:best_idx+1]  # 保持3D形狀
     
-    return best_bbox, best_kps
+    return best_bbox, best_kps, scores[best_idx]
 
 def create_empty_detection():
     """創建空的檢測結果，保持與真實檢測相同的形狀"""
@@ -87,10 +305,398 @@ def create_empty_detection():
     empty_kps = np.zeros((1, 17, 3))  # 17個關鍵點，每個點有x, y, score
     return empty_bbox, empty_kps
 
-def main(args):
+def process_outputs(outputs, prev_box=None):
+    """把 predictor 的輸出轉成 Detectron1 格式: bbox (1, 5), keypoints (1, 4, 17)"""
+    bbox_tensor, kps = None, None
+    # 獲取檢測結果
+    if outputs.has('pred_boxes') and len(outputs.pred_boxes) > 0:
+        bbox_tensor = outputs.pred_boxes.tensor.numpy()
+        scores = outputs.scores.numpy()
+        kps = outputs.pred_keypoints.numpy()
+
+        # 選擇最佳檢測結果
+        bbox_tensor, kps, score = get_best_person(bbox_tensor, kps, scores, prev_box)
+
+        if bbox_tensor is not None:
+            # 添加分數到bbox
+            bbox_tensor = np.concatenate((bbox_tensor, np.reshape(score, (1, 1))), axis=1)
+    if bbox_tensor is None:
+        bbox_tensor, kps = create_empty_detection()
+    return bbox_tensor, format_keypoints(kps)
+
+def process_people(outputs):
+    """--people: 所有偵測到的人, bbox (N, 5)、keypoints (N, 4, 17); 沒有人時 N = 0"""
+    if not outputs.has('pred_boxes') or len(outputs.pred_boxes) == 0:
+        return np.zeros((0, 5)), np.zeros((0, 4, 17))
+    bbox_tensor = np.concatenate((outputs.pred_boxes.tensor.numpy(), outputs.scores.numpy()[:, None]), axis=1)
+    return bbox_tensor, format_keypoints(outputs.pred_keypoints.numpy())
+
+def format_keypoints(kps):
+    """(1, 17, 3) 的 x, y, prob -> Detectron1 的 (1, 4, 17): x, y, logit, prob"""
+    # 處理關鍵點格式
+    kps_xy = kps[:, :, :2]
+    kps_prob = kps[:, :, 2:3]
+    kps_logit = np.zeros_like(kps_prob)  # Dummy
+    kps = np.concatenate((kps_xy, kps_logit, kps_prob), axis=2)
+    kps = kps.transpose(0, 2, 1)
+    return kps
+
+_END = object()
+
+def prefetch(iterable, maxsize):
+    """在背景 thread 讀取 iterable(ffmpeg 解碼), 讓解碼與推論重疊; queue 有上限, 記憶體不會無限增加"""
+    q = queue.Queue(maxsize)
+
+    def worker():
+        try:
+            for item in iterable:
+                q.put(item)
+            q.put(_END)
+        except Exception as e:
+            q.put(e)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def iter_batches(frames, batch_size, start=0):
+    """把幀分成 (第一幀的 index, [幀...]) 的 batch, frames 的第一幀編號為 start"""
+    batch = []
+    for frame_i, im in enumerate(frames, start):
+        batch.append(im)
+        if len(batch) == batch_size:
+            yield frame_i - len(batch) + 1, batch
+            batch = []
+    if batch:
+        yield frame_i - len(batch) + 1, batch
+
+def preprocess(predictor, images):
+    """與 DefaultPredictor.__call__ 相同的前處理, 但一次處理整個 batch"""
+    inputs = []
+    for im in images:
+        if predictor.input_format == "RGB":
+            im = im[:, :, ::-1]
+        height, width = im.shape[:2]
+        image = predictor.aug.get_transform(im).apply_image(im)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+        inputs.append({"image": image, "height": height, "width": width})
+    return inputs
+
+def infer_batch(predictor, images, timings=None, people=False):
+    """
+    一個 batch 的前處理 + 推論 + 後處理, 回傳 [(bbox (1, 5), keypoints (1, 4, 17))], 座標是輸入幀的像素
+    people 時每一幀是所有人的 (bbox (N, 5), keypoints (N, 4, 17))
+    """
+    timings = timings if timings is not None else defaultdict(float)
+    t = time.perf_counter()
+    inputs = preprocess(predictor, images)
+    t_preprocessed = time.perf_counter()
+    with torch.no_grad():
+        outputs = predictor.model(inputs)
+    t_inferred = time.perf_counter()
+    process = process_people if people else process_outputs
+    results = [process(output['instances'].to('cpu')) for output in outputs]
+    t_done = time.perf_counter()
+
+    timings['preprocess'] += t_preprocessed - t
+    timings['inference'] += t_inferred - t_preprocessed
+    timings['postprocess'] += t_done - t_inferred
+    timings['frames'] += len(images)
+    record('detect.preprocess', t, t_preprocessed, frames=len(images))
+    record('detect.inference', t_preprocessed, t_inferred, frames=len(images))
+    record('detect.postprocess', t_inferred, t_done, frames=len(images))
+    count('frames', len(images))
+    return results
+
+def infer_video(predictor, video_name, batch_size=1, start=0, timings=None, plan=None, people=False):
+    """
+    逐幀產生 (frame_i, bbox (1, 5), keypoints (1, 4, 17)), 一次推論 batch_size 幀, 各階段耗時累加到 timings
+    plan 為 video_io.plan_sampling 的結果(None 時讀整段影片), 座標是 plan 輸出幀上的像素; people 同 infer_batch
+    """
+    timings = timings if timings is not None else defaultdict(float)
+    frames = read_video(video_name, skip_samples(plan, start) if plan is not None else None)
+    batches = iter_batches(prefetch(frames, 2 * batch_size), batch_size, start)
+    while True:
+        t = time.perf_counter()
+        batch = next(batches, None)
+        if batch is None:
+            return
+        first_i, images = batch
+        t_decoded = time.perf_counter()
+        timings['decode'] += t_decoded - t   # 等待背景解碼的時間, 與推論重疊時接近 0
+        record('decode.wait', t, t_decoded)
+        results = infer_batch(predictor, images, timings, people)
+        for offset, (bbox_tensor, kps) in enumerate(results):
+            yield first_i + offset, bbox_tensor, kps
+
+def expand_box(box, ratio, w, h):
+    """把框的四邊各往外擴 ratio 倍的寬/高, 並限制在畫面內"""
+    bw, bh = box[2] - box[0], box[3] - box[1]
+    return np.array([max(0, box[0] - ratio * bw), max(0, box[1] - ratio * bh),
+                     min(w, box[2] + ratio * bw), min(h, box[3] + ratio * bh)])
+
+def track_keypoints(predictor, resize, im, box, pad=0.25, margin=0.1):
+    """只在 box 附近裁切的小圖上, 以 box 當作 ROI 跑關鍵點 head (跳過 RPN 與 box head)"""
+    h, w = im.shape[:2]
+    x0, y0, x1, y1 = expand_box(box, pad, w, h).astype(int)
+    crop = im[y0:y1, x0:x1]
+    if predictor.input_format == "RGB":
+        crop = crop[:, :, ::-1]
+    transform = resize.get_transform(crop)
+    image = transform.apply_image(crop)
+    roi = expand_box(box, margin, w, h) - [x0, y0, x0, y0]   # 人可能稍微移動, ROI 比前一個框大一點
+    roi = transform.apply_box(roi[None])
+    instances = Instances(image.shape[:2],
+                          pred_boxes=Boxes(torch.as_tensor(roi, dtype=torch.float32, device=predictor.model.device)),
+                          pred_classes=torch.zeros(1, dtype=torch.int64, device=predictor.model.device))
+    inputs = {"image": torch.as_tensor(image.astype("float32").transpose(2, 0, 1)), "height": crop.shape[0], "width": crop.shape[1]}
+    with torch.no_grad():
+        outputs = predictor.model.inference([inputs], detected_instances=[instances])
+    kps = outputs[0]['instances'].to('cpu').pred_keypoints.numpy()
+    kps[:, :, 0] += x0
+    kps[:, :, 1] += y0
+    return kps
+
+def keypoint_box(kps, margin=0.1):
+    """以 17 個關鍵點的範圍當作下一幀的框"""
+    x1, y1 = kps[0, :, 0].min(), kps[0, :, 1].min()
+    x2, y2 = kps[0, :, 0].max(), kps[0, :, 1].max()
+    bw, bh = x2 - x1, y2 - y1
+    return np.array([x1 - margin * bw, y1 - margin * bh, x2 + margin * bw, y2 + margin * bh])
+
+def track_video(predictor, video_name, interval=15, crop_size=320, redetect_ratio=0.5, start=0, timings=None, plan=None):
+    """
+    追蹤模式, 產生與 infer_video 相同的 (frame_i, bbox (1, 5), keypoints (1, 4, 17))
+    每 interval 幀做一次全圖偵測(以 IoU 延續同一個人), 中間的幀只跑裁切後的關鍵點 head;
+    追蹤的關鍵點信心低於上次偵測的 redetect_ratio 倍時, 該幀立刻改做全圖偵測
+    """
+    timings = timings if timings is not None else defaultdict(float)
+    resize = T.ResizeShortestEdge([crop_size, crop_size], predictor.cfg.INPUT.MAX_SIZE_TEST)
+    frames = read_video(video_name, skip_samples(plan, start) if plan is not None else None)
+    frames = iter_batches(prefetch(frames, 8), 1, start)
+    prev_box, det_score, ref_conf, since_detect = None, 0.0, 0.0, 0
+    while True:
+        t = time.perf_counter()
+        batch = next(frames, None)
+        if batch is None:
+            return
+        frame_i, (im,) = batch
+        t_decoded = time.perf_counter()
+        timings['decode'] += t_decoded - t
+        record('decode.wait', t, t_decoded)
+
+        bbox_tensor = None
+        if prev_box is not None and since_detect < interval:
+            kps = format_keypoints(track_keypoints(predictor, resize, im, prev_box))
+            conf = kps[0, 3].mean()
+            if conf >= redetect_ratio * ref_conf:
+                prev_box = keypoint_box(kps[:, :2].transpose(0, 2, 1))
+                bbox_tensor = np.concatenate((prev_box, [det_score]))[None]
+                since_detect += 1
+                timings['tracked'] += 1
+            t_tracked = time.perf_counter()
+            timings['track'] += t_tracked - t_decoded
+            record('track', t_decoded, t_tracked)
+            t_decoded = t_tracked
+        if bbox_tensor is None:
+            with torch.no_grad():
+                outputs = predictor.model(preprocess(predictor, [im]))
+            bbox_tensor, kps = process_outputs(outputs[0]['instances'].to('cpu'), prev_box)
+            if bbox_tensor[0, 4] > 0:
+                prev_box, det_score, ref_conf, since_detect = bbox_tensor[0, :4], bbox_tensor[0, 4], kps[0, 3].mean(), 1
+            else:
+                prev_box = None
+            t_detected = time.perf_counter()
+            timings['detect'] += t_detected - t_decoded
+            timings['detections'] += 1
+            record('detect', t_decoded, t_detected)
+            count('detections')
+        timings['frames'] += 1
+        count('frames')
+        yield frame_i, bbox_tensor, kps
+
+def to_source_detection(bbox_tensor, kps, plan):
+    """plan 輸出幀上的偵測結果換回原始影片的像素; 沒偵測到人(分數 0 或 --people 的 0 個人)的不動"""
+    if plan is None or len(bbox_tensor) == 0 or bbox_tensor[0, 4] <= 0:
+        return bbox_tensor, kps
+    bbox_tensor = bbox_tensor.copy()
+    bbox_tensor[:, :4] = to_source(bbox_tensor[:, :4].reshape(-1, 2, 2), plan).reshape(-1, 4)
+    kps = kps.copy()
+    kps[:, :2] = to_source(kps[:, :2].transpose(0, 2, 1), plan).transpose(0, 2, 1)
+    return bbox_tensor, kps
+
+def run_inference(predictor, video_name, args, start=0, timings=None, plan=None):
+    """依參數選擇一般(batch)推論或追蹤模式, 座標換回原始影片的像素"""
+    if args.track:
+        results = track_video(predictor, video_name, args.keyframe_interval, args.crop_size, args.redetect_ratio, start, timings, plan)
+    else:
+        results = infer_video(predictor, video_name, args.batch_size, start, timings, plan, args.people)
+    for frame_i, bbox_tensor, kps in results:
+        yield (frame_i,) + to_source_detection(bbox_tensor, kps, plan)
+
+STAGES = ('decode', 'preprocess', 'inference', 'postprocess', 'detect', 'track')
+
+def print_timings(timings):
+    frames = timings['frames']
+    total = sum(timings.get(stage, 0.0) for stage in STAGES)
+    if frames == 0 or total == 0:
+        return
+    for stage in STAGES:
+        if stage in timings:
+            print('{:<12}{:>9.2f}s {:>9.1f} ms/frame'.format(stage, timings[stage], 1000 * timings[stage] / frames))
+    if 'detections' in timings:
+        print('full detections on {} frames, tracked {} frames'.format(int(timings['detections']), int(timings['tracked'])))
+    print('{} frames in {:.2f}s, {:.2f} fps'.format(int(frames), total, frames / total))
+
+def open_store(video_name, out_name, args, plan, metadata):
+    """--stream 的 .kps; 影片、抽幀或偵測設定 (--cfg、--score-thresh、--track...) 不同時 resume 會從頭開始"""
+    metadata = dict(metadata, video=os.path.abspath(video_name), size=os.path.getsize(video_name),
+                    detection=detection_config(args, plan))
+    return KeypointWriter(out_name + '.kps', args.chunk_size, metadata)
+
+def process_video_stream(predictor, video_name, out_name, args, plan, metadata, lifter=None):
+    """
+    邊推論邊分塊寫入 out_name.kps, 記憶體固定; 中斷後重跑會從最後完成的 chunk 繼續, 回傳 (boxes, keypoints) mmap
+    lifter 為 --lift 的 (StreamingLifter, 已完成的 3D list), 從頭跑時邊推論邊算 3D
+    """
+    writer = open_store(video_name, out_name, args, plan, metadata)
+    start = writer.resume()
+    if start > 0:
+        print('Resuming from frame {}'.format(start))
+        lifter = None   # 前面的 2D 在檔案裡, 之後整段一起算
+
+    timings = defaultdict(float)
+    for frame_i, bbox_tensor, kps in run_inference(predictor, video_name, args, start, timings, plan):
+        writer.append(bbox_tensor[0], kps[0])
+        if lifter is not None:
+            lifter[1].append(lifter[0].push(kps, bbox_tensor))
+    writer.close()
+    print_timings(timings)
+    data = read_keypoints(out_name + '.kps')
+    return data['boxes'], data['keypoints']
+
+def save_output(out_name, boxes, keypoints, metadata, args):
+    """存成 .npz; --smooth 時先補洞/平滑, 快取裡存的仍是原始結果"""
+    if args.smooth != 'none' and len(keypoints):
+        keypoints, report = repair_keypoints_2d(keypoints, boxes, method=args.smooth, fps=metadata['fps'])
+        metadata = dict(metadata, smoothing=report)
+        print('{}: {} / {} frames repaired ({})'.format(out_name, report['repaired_frames'], report['frames'], args.smooth))
+    save_npz(out_name, boxes, keypoints, metadata)
+
+def cache_put(cache, metadata, boxes, keypoints, track_ids=None):
+    if track_ids is not None:   # --people: 所有 track, 存成 (T, K, 5)、(T, K, 4, 17)
+        cache.put(metadata['cache_key'], {'boxes': np.ascontiguousarray(boxes.transpose(1, 0, 2)),
+                                          'keypoints': np.ascontiguousarray(keypoints.transpose(1, 0, 2, 3))},
+                  kind='2d', joints=COCO_JOINTS, track_ids=[int(track) for track in track_ids], **metadata)
+        return
+    cache.put(metadata['cache_key'], {'boxes': np.asarray(boxes, dtype=np.float32).reshape(-1, 5),
+                                      'keypoints': np.asarray(keypoints, dtype=np.float32).reshape(-1, 4, 17)},
+              kind='2d', joints=COCO_JOINTS, **metadata)
+
+def save_tracks(out_name, track_ids, boxes, keypoints, metadata, args):
+    """
+    --people: 每個 track 存成 <video>.track<id>.npz, 打者的 track 另外存成 <video>.npz, 之後的流程 (--lift, 評分) 不用改
+    boxes (K, T, 5)、keypoints (K, T, 4, 17); 回傳打者的 (boxes (T, 5), keypoints (T, 4, 17)), 沒有任何 track 時全為 0
+    """
+    if len(track_ids) == 0:
+        print('{}: no person tracked'.format(out_name))
+        boxes, keypoints = np.zeros((boxes.shape[1], 5), np.float32), np.zeros((boxes.shape[1], 4, 17), np.float32)
+        save_output(out_name, boxes, keypoints, dict(metadata, tracks=[], batter=None), args)
+        return boxes, keypoints
+    scores, _ = batter_scores(boxes, keypoints, metadata['w'], metadata['h'])
+    batter = int(np.argmax(scores))
+    tracks = [{'id': int(track), 'frames': int((track_boxes[:, 4] > 0).sum()), 'score': round(float(score), 4)}
+              for track, track_boxes, score in zip(track_ids, boxes, scores)]
+    metadata = dict(metadata, tracks=tracks, batter=int(track_ids[batter]))
+    for track, track_boxes, track_keypoints in zip(track_ids, boxes, keypoints):
+        save_output(track_path(out_name + '.npz', track), track_boxes, track_keypoints, dict(metadata, track=int(track)), args)
+    save_output(out_name, boxes[batter], keypoints[batter], metadata, args)
+    print('{}: {} tracks, batter is track {} ({} frames)'.format(
+        out_name, len(tracks), metadata['batter'], tracks[batter]['frames']))
+    return boxes[batter], keypoints[batter]
+
+def finish_tracks(out_name, tracker, metadata, args, cache=None):
+    """--people 的影片結束: 存每個 track 與打者, 放進快取, 回傳打者的 (boxes, keypoints)"""
+    track_ids, boxes, keypoints = tracker.stack()
+    if cache is not None:
+        cache_put(cache, metadata, boxes, keypoints, track_ids)
+    return save_tracks(out_name, track_ids, boxes, keypoints, metadata, args)
+
+def open_lifter(args, metadata):
+    """--lift 時回傳 (StreamingLifter, 已完成的 3D list), 推論迴圈每一幀 push 進去"""
+    if args.lift is None or args.people:   # --people 要整段跑完才知道誰是打者
+        return None
+    return StreamingLifter(load_lifter(args.lift), metadata['w'], metadata['h']), []
+
+def lift_output(out_name, boxes, keypoints, metadata, args, cache=None, lifter=None):
+    """
+    --lift: 2D -> 3D 存成 out_name.pose (batch_grade.py 可以直接讀), 取代 VideoPose3D notebook
+    lifter 為 open_lifter 的結果時只算剩下的幀, 否則整段算 (或從快取拿); --position 時直接在記憶體評分
+    """
+    if args.lift is None:
+        return None
+    model = load_lifter(args.lift)
+    key = key_3d(cache, metadata, 'lift ' + model.digest) if cache is not None else None
+    cached = cache.get(key) if key is not None and lifter is None else None
+    try:
+        if cached is not None:
+            coordinates = np.asarray(cached['coordinates'])
+        elif lifter is not None:
+            coordinates = np.concatenate(lifter[1] + [lifter[0].finish()])
+        else:
+            coordinates = lift_keypoints(np.asarray(keypoints, dtype=np.float32).reshape(-1, 4, 17),
+                                         np.asarray(boxes, dtype=np.float32).reshape(-1, 5),
+                                         metadata['w'], metadata['h'], model)
+    except ValueError as e:
+        print('{}: {}'.format(out_name, e))
+        return None
+    if key is not None and cached is None:
+        cache.put(key, {'coordinates': coordinates}, kind='3d', fps=metadata['fps'],
+                  video_sha256=metadata['video_sha256'], checkpoint='lift ' + model.digest)
+    header = {'kind': '3d', 'fps': metadata['fps'], 'joints': H36M_JOINTS, 'w': metadata['w'], 'h': metadata['h']}
+    write_clip(out_name + '.pose', {'coordinates': coordinates}, **header)
+    print('{}: {} frames lifted -> {}'.format(out_name, len(coordinates), out_name + '.pose'))
+    if args.position is not None:
+        grade_lifted(out_name, coordinates, header, args)
+    return coordinates
+
+def grade_lifted(out_name, coordinates, header, args):
+    """--position: 與 batch_grade.py 相同的評分, 3D 不經過檔案"""
+    job = {'standard': args.standard, 'position': args.position, 'frame': None, 'sequence': False,
+           'best_match': False}
+    result, _ = grade_coordinates(coordinates, header, job, load_library())
+    print('{}: frame {} ({}) vs {} frame {}: grade {:.2f}, similarity {:.2f}'.format(
+        out_name, result['frame'], result['frame_source'], result['reference'], result['reference_frame'],
+        result['grade'], result['similarity']))
+    for comment in result['comments']:
+        print('    {:<24}{:>8.1f}  {}'.format(comment['angle'], comment['delta_theta'], comment['comment']))
+    return result
+
+def write_cached(video_name, out_name, args, plan, metadata, cached):
+    """快取命中時直接寫出與推論相同的輸出(.npz、--stream 的 .kps 或 --people 的每個 track), 回傳(打者的) (boxes, keypoints)"""
+    boxes, keypoints = cached['boxes'], cached['keypoints']
+    if args.people:
+        return save_tracks(out_name, cached['header']['track_ids'], np.asarray(boxes).transpose(1, 0, 2),
+                           np.asarray(keypoints).transpose(1, 0, 2, 3), metadata, args)
+    if not args.stream:
+        save_output(out_name, boxes, keypoints, metadata, args)
+        return boxes, keypoints
+    writer = open_store(video_name, out_name, args, plan, metadata)
+    start = writer.resume()
+    for bbox, kps in zip(boxes[start:], keypoints[start:]):
+        writer.append(bbox, kps)
+    writer.close()
+    return boxes, keypoints
+
+def make_predictor(args):
     cfg = get_cfg()
     cfg.merge_from_file(model_zoo.get_config_file(args.cfg))
-    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.7
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = args.score_thresh
     cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(args.cfg)
     # 動態設定設備
     if torch.cuda.is_available():
@@ -100,74 +706,195 @@ def main(args):
         cfg.MODEL.DEVICE = "cpu"
         print("Using CPU")
     
-    predictor = DefaultPredictor(cfg)
-    predictor = DefaultPredictor(cfg)
+    return DefaultPredictor(cfg)
+
+async def ingest_video(video_name, args, infer, decoders, cache=None):
+    """
+    asyncio 模式的一支影片: probe -> (motion window) -> 解碼, 每個 batch 交給共用的推論 thread
+    同一支影片最多 2 個 batch 在途, 結果依序收集, 輸出檔案與逐支處理時相同
+    decoders 是限制同時解碼幾支影片的 semaphore, 解碼完就讓出名額, 不用等最後的 batch 推論完
+    """
+    loop = asyncio.get_running_loop()
+    out_name = os.path.join(args.output_dir, os.path.basename(video_name))
+    t = time.perf_counter()
+    pending = deque()
+    boxes, keypoints = [], []
+    writer, plan = None, None
+    tracker = Tracker() if args.people else None
+
+    def collect(results):
+        for bbox_tensor, kps in results:
+            bbox_tensor, kps = to_source_detection(bbox_tensor, kps, plan)
+            if tracker is not None:
+                tracker.update(bbox_tensor, kps)
+            elif writer is not None:
+                writer.append(bbox_tensor[0], kps[0])
+            else:
+                boxes.append(bbox_tensor[0])
+                keypoints.append(kps[0])
+
+    async with decoders:
+        info = await probe_video_async(video_name)
+        start_time, end_time = args.start_time, args.end_time
+        if args.motion_window:
+            start_time, end_time = await motion_window_async(video_name, info, args.motion_window)
+        plan = plan_sampling(info, args.stride, start_time, end_time, args.crop, args.max_size)
+        metadata = sampling_metadata(info, plan)
+
+        if cache is not None:
+            # 算大檔案的 sha256 不能卡住 event loop
+            metadata['video_sha256'] = await loop.run_in_executor(None, cache.video_hash, video_name)
+            metadata['cache_key'] = cache.key(metadata['video_sha256'], '2d', **detection_config(args, plan))
+            cached = cache.get(metadata['cache_key'])
+            if cached is not None:
+                boxes, keypoints = write_cached(video_name, out_name, args, plan, metadata, cached)
+                print('{}: cache hit {}'.format(video_name, metadata['cache_key'][:12]))
+                if args.lift is not None:
+                    await loop.run_in_executor(None, lift_output, out_name, boxes, keypoints, metadata, args, cache)
+                return 0
+
+        start = 0
+        if args.stream:
+            writer = open_store(video_name, out_name, args, plan, metadata)
+            start = writer.resume()
+        batch = []
+        async with contextlib.aclosing(read_video_async(video_name, skip_samples(plan, start))) as frames:
+            async for im in frames:
+                batch.append(im)
+                if len(batch) == args.batch_size:
+                    pending.append(infer(batch))
+                    batch = []
+                    if len(pending) >= 2:
+                        collect(await pending.popleft())
+        if batch:
+            pending.append(infer(batch))
+    while pending:
+        collect(await pending.popleft())
+
+    if writer is not None:
+        writer.close()
+        data = read_keypoints(out_name + '.kps')
+        boxes, keypoints = data['boxes'], data['keypoints']
+    elif tracker is not None:
+        boxes, keypoints = finish_tracks(out_name, tracker, metadata, args, cache)
+    else:
+        save_output(out_name, boxes, keypoints, metadata, args)
+    if cache is not None and tracker is None:
+        cache_put(cache, metadata, boxes, keypoints)
+    if args.lift is not None:
+        await loop.run_in_executor(None, lift_output, out_name, boxes, keypoints, metadata, args, cache)
+    print('{}: {} frames in {:.2f}s'.format(video_name, len(boxes) - start, time.perf_counter() - t))
+    return len(boxes) - start
+
+async def ingest_videos(video_names, args, cache=None):
+    """
+    同時 probe/解碼多支影片 (最多 args.decoders 支), 所有 batch 交給同一個推論 thread,
+    ffprobe/ffmpeg 啟動與讀取 pipe 的等待時間與推論重疊; 回傳 {影片: 幀數或 Exception}
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)   # predictor 只在這個 thread 建立與使用
+    timings = defaultdict(float)
+    predictor = []
+
+    def run_batch(images):
+        if not predictor:   # 全部命中快取時不用載入模型
+            predictor.append(make_predictor(args))
+        return infer_batch(predictor[0], images, timings, args.people)
+
+    def infer(images):
+        return loop.run_in_executor(executor, run_batch, images)
+
+    decoders = asyncio.Semaphore(args.decoders)
+    t = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(ingest_video(video_name, args, infer, decoders, cache) for video_name in video_names),
+                                       return_exceptions=True)
+    finally:
+        executor.shutdown()
+    elapsed = time.perf_counter() - t
+
+    for video_name, result in zip(video_names, results):
+        if isinstance(result, Exception):
+            print('{}: failed ({}: {})'.format(video_name, type(result).__name__, result))
+    print_timings(timings)
+    frames = sum(result for result in results if not isinstance(result, Exception))
+    print('{} videos, {} frames in {:.2f}s wall clock ({:.2f} fps), inference busy {:.0%} of the time'.format(
+        len(video_names), frames, elapsed, frames / elapsed,
+        sum(timings[stage] for stage in ('preprocess', 'inference', 'postprocess')) / elapsed))
+    return dict(zip(video_names, results))
+
+def main(args):
+    cache = PoseCache(args.cache_dir, args.cache_size << 20) if args.cache else None
+    predictor = None   # 全部命中快取時不用載入模型
+    if args.profile:
+        PROFILER.enable()
 
     if os.path.isdir(args.im_or_folder):
         im_list = glob.iglob(args.im_or_folder + '/*.' + args.image_ext)
     else:
         im_list = [args.im_or_folder]
 
+    if args.decoders:
+        asyncio.run(ingest_videos(sorted(im_list), args, cache))
+        if cache is not None:
+            print_stats(cache.stats())
+        finish_profile(args.profile)
+        return
+
     for video_name in im_list:
         out_name = os.path.join(args.output_dir, os.path.basename(video_name))
         print('Processing {}'.format(video_name))
+        t_video = time.perf_counter()
+        info, plan = make_plan(video_name, args)
+        # Video resolution (原始影片) 與抽幀資訊
+        metadata = sampling_metadata(info, plan)
 
-        boxes = []
-        segments = []
-        keypoints = []
-
-        for frame_i, im in enumerate(read_video(video_name)):
-            t = time.time()
-            outputs = predictor(im)['instances'].to('cpu')
-            print('Frame {} processed in {:.3f}s'.format(frame_i, time.time() - t))
-
-            # 獲取檢測結果
-            if outputs.has('pred_boxes') and len(outputs.pred_boxes) > 0:
-                bbox_tensor = outputs.pred_boxes.tensor.numpy()
-                scores = outputs.scores.numpy()
-                kps = outputs.pred_keypoints.numpy()
-                
-                # 選擇最佳檢測結果
-                bbox_tensor, kps = get_best_person(bbox_tensor, kps, scores)
-                
-                if bbox_tensor is not None:
-                    # 添加分數到bbox
-                    score = scores[np.argmax(scores)].reshape(1, 1)
-                    bbox_tensor = np.concatenate((bbox_tensor, score), axis=1)
-                    
-                    # 處理關鍵點格式
-                    kps_xy = kps[:, :, :2]
-                    kps_prob = kps[:, :, 2:3]
-                    kps_logit = np.zeros_like(kps_prob)  # Dummy
-                    kps = np.concatenate((kps_xy, kps_logit, kps_prob), axis=2)
-                    kps = kps.transpose(0, 2, 1)
-                else:
-                    bbox_tensor, kps = create_empty_detection()
-                    kps = kps.transpose(0, 2, 1)
+        if cache is not None:
+            metadata['video_sha256'] = cache.video_hash(video_name)
+            metadata['cache_key'] = cache.key(metadata['video_sha256'], '2d', **detection_config(args, plan))
+            cached = cache.get(metadata['cache_key'])
+            if cached is not None:
+                print('Cache hit {}, skipping inference'.format(metadata['cache_key'][:12]))
+                boxes, keypoints = write_cached(video_name, out_name, args, plan, metadata, cached)
+                lift_output(out_name, boxes, keypoints, metadata, args, cache)
+                record('video', t_video, time.perf_counter(), file=video_name, cached=True)
+                continue
+
+        if predictor is None:
+            predictor = make_predictor(args)
+        # --lift: 2D 一邊出來一邊算 3D, 影片解碼/偵測完時只剩最後 pad 幀
+        lifter = open_lifter(args, metadata)
+        tracker = Tracker() if args.people else None
+        if args.stream:
+            boxes, keypoints = process_video_stream(predictor, video_name, out_name, args, plan, metadata, lifter)
+            if lifter is not None and lifter[0].frames != len(boxes):   # 從中斷處繼續的, 整段重算
+                lifter = None
+        else:
+            boxes = []
+            keypoints = []
+            timings = defaultdict(float)
+            for frame_i, bbox_tensor, kps in run_inference(predictor, video_name, args, timings=timings, plan=plan):
+                if tracker is not None:
+                    tracker.update(bbox_tensor, kps)
+                    continue
+                boxes.append(bbox_tensor[0])
+                keypoints.append(kps[0])
+                if lifter is not None:
+                    lifter[1].append(lifter[0].push(kps, bbox_tensor))
+            print_timings(timings)
+            if tracker is not None:
+                boxes, keypoints = finish_tracks(out_name, tracker, metadata, args, cache)
             else:
-                bbox_tensor, kps = create_empty_detection()
-                kps = kps.transpose(0, 2, 1)
-
-            # Mimic Detectron1 format
-            cls_boxes = [[], bbox_tensor]
-            cls_keyps = [[], kps]
-            
-            boxes.append(cls_boxes)
-            segments.append(None)
-            keypoints.append(cls_keyps)
-
-        # Video resolution
-        metadata = {
-            'w': im.shape[1],
-            'h': im.shape[0],
-        }
-        
-        # 確保所有array具有一致的形狀
-        boxes = np.array(boxes, dtype=object)
-        keypoints = np.array(keypoints, dtype=object)
-        segments = np.array(segments, dtype=object)
-        
-        np.savez_compressed(out_name, boxes=boxes, segments=segments, keypoints=keypoints, metadata=metadata)
+                save_output(out_name, boxes, keypoints, metadata, args)
+
+        if cache is not None and tracker is None:
+            cache_put(cache, metadata, boxes, keypoints)
+        lift_output(out_name, boxes, keypoints, metadata, args, cache, lifter)
+        record('video', t_video, time.perf_counter(), file=video_name, cached=False)
+
+    if cache is not None:
+        print_stats(cache.stats())
+    finish_profile(args.profile)
 
 if __name__ == '__main__':
     setup_logger()
@@ -0,0 +1,103 @@
+import numpy as np
+
+from angles import calculate_angles
+from profiling import profiled
+'''
+從 3D 關節軌跡自動找出擊球(contact)的關鍵幀, 取代 grade.py 裡手動挑的 frame_num
+
+1. 髖旋轉(8)、肩旋轉(9) 角度先做中值濾波, 去掉 VideoPose3D 偶爾翻轉造成的跳動
+2. 以 window 幀為單位計算旋轉的淨變化量 = 平均角速度, 揮棒時髖與肩會在短時間內大幅轉開
+3. 影片裡常有慢動作重播, 所以取「第一段」超過最大值 burst_ratio 的爆發
+4. 爆發期間手腕(13, 16)速度的峰值是出棒, 關鍵幀是之後 window 幀內髖+肩轉得最開(角度最小)的一幀
+5. 信心分數 = 關鍵幀轉開的程度(相對整段的範圍) x 旋轉爆發的段數是否正常: 一次揮棒是轉開+轉回兩段
+   (超過最大值 ambiguity_ratio), 超過兩段(重播、空揮、姿勢估計翻轉)時按比例降低; 低信心的結果最好人工確認
+
+沒有人的幀 (全為 0 或含 NaN) 先沿用前一個有效幀 (開頭沿用第一個有效幀), 不會讓濾波與速度變成 NaN,
+關鍵幀也只會落在有效幀上; 整段都無效時回傳 (T // 2, 0.0)
+
+與 standard/ 手動標記的比較見 benchmarks/eval_keyframe.py
+
+所有步驟都是固定寬度的視窗運算, 整體是 O(T)
+'''
+HIP_ROTATION = 8
+SHOULDER_ROTATION = 9
+WRISTS = [13, 16]   # left wrist, right wrist
+
+
+def hold_valid(coordinates, angles):
+    """
+    把無效幀 (座標全為 0、座標或角度有 NaN) 換成前一個有效幀
+    回傳 (coordinates, angles, source), source[i] 為第 i 幀實際用的幀; 沒有有效幀時回傳 None
+    """
+    valid = (np.isfinite(coordinates).all(axis=(1, 2)) & np.isfinite(angles).all(axis=1)
+             & (np.abs(coordinates).sum(axis=(1, 2)) > 0))
+    if not valid.any():
+        return None
+    source = np.maximum.accumulate(np.where(valid, np.arange(len(valid)), -1))
+    source[source < 0] = np.argmax(valid)
+    return coordinates[source], angles[source], source
+
+
+def median_filter(x, width):
+    """沿著時間軸(axis 0)做中值濾波, 邊界重複第一/最後一幀"""
+    if width <= 1:
+        return x
+    pad = [(width // 2, width // 2)] + [(0, 0)] * (x.ndim - 1)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(x, pad, mode='edge'), width, axis=0)
+    return np.median(windows, axis=-1)
+
+
+def moving_average(x, width):
+    """沿著時間軸做移動平均, 長度不變"""
+    if width <= 1:
+        return x
+    kernel = np.ones(width) / width
+    return np.convolve(np.pad(x, (width // 2, width - 1 - width // 2), mode='edge'), kernel, mode='valid')
+
+
+def rotation_energy(angles, window=30, median_width=5):
+    """每一幀往後 window 幀內髖+肩旋轉的淨變化量(度), 長度 T - window"""
+    rotation = median_filter(angles[:, [HIP_ROTATION, SHOULDER_ROTATION]], median_width)
+    return np.abs(rotation[window:] - rotation[:-window]).sum(axis=1)
+
+
+def wrist_speed(coordinates, median_width=5, smooth_width=5):
+    """左右手腕每幀移動距離的總和, 長度 T - 1"""
+    wrists = median_filter(coordinates[:, WRISTS], median_width)
+    speed = np.linalg.norm(np.diff(wrists, axis=0), axis=-1).sum(axis=1)
+    return moving_average(speed, smooth_width)
+
+
+@profiled('key_frame')
+def detect_key_frame(coordinates, angles=None, window=30, burst_ratio=0.7, ambiguity_ratio=0.3, median_width=9):
+    """回傳 (關鍵幀的 index, 信心分數 0~1), coordinates 為 (T, 17, 3); 已經算好的角度可以從 angles 傳入"""
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    T = len(coordinates)
+    if angles is None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            angles = calculate_angles(coordinates)
+    held = hold_valid(coordinates, np.asarray(angles, dtype=np.float64))
+    window = min(window, max(1, T // 4))
+    if held is None or T < 2 * window:
+        return T // 2, 0.0
+    coordinates, angles, source = held
+
+    energy = rotation_energy(angles, window, median_width)
+    threshold = burst_ratio * energy.max()
+    if threshold <= 0:
+        return T // 2, 0.0
+    # 第一段超過門檻的爆發: energy[start:end), 涵蓋 [start, end + window) 幀
+    start = np.argmax(energy >= threshold)
+    below = np.flatnonzero(energy[start:] < threshold)
+    end = start + below[0] if len(below) else len(energy)
+    speed = wrist_speed(coordinates, median_width)
+    swing = start + np.argmax(speed[start:min(len(speed), end + window)])
+    rotation = median_filter(angles[:, [HIP_ROTATION, SHOULDER_ROTATION]], median_width).sum(axis=1)
+    key_frame = swing + np.argmin(rotation[swing:swing + window + 1])
+
+    extent = np.ptp(rotation)
+    turned = 1.0 - (rotation[key_frame] - rotation.min()) / extent if extent > 0 else 0.0
+    above = energy >= ambiguity_ratio * energy.max()
+    bursts = max(1, np.count_nonzero(above[1:] & ~above[:-1]) + above[0])
+    confidence = float(np.clip(np.nan_to_num(turned * min(1.0, 2.0 / bursts)), 0.0, 1.0))
+    return int(source[key_frame]), confidence
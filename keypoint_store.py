@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from profiling import profiled
+from smoothing import METHODS, repair_keypoints_2d
+'''
+可續寫的 2D 關鍵點檔案, 取代最後才一次存成 dtype=object 的 .npz
+
+path/ (資料夾)
+    boxes.f32        每幀一列 (5,) float32: x1, y1, x2, y2, score (沒有偵測到人時全為 0)
+    keypoints.f32    每幀一塊 (4, 17) float32: x, y, logit, prob (Detectron1 格式)
+    progress.json    已經完整寫入的幀數與 metadata (影片、解析度...)
+
+每 chunk_size 幀寫一次並 fsync, 之後才更新 progress.json, 所以中斷時最多損失一個 chunk,
+記憶體用量固定為一個 chunk, 與影片長度無關
+'''
+BOX_SHAPE = (5,)
+KEYPOINT_SHAPE = (4, 17)
+
+
+def _row_bytes(shape):
+    return int(np.prod(shape)) * 4
+
+
+def read_progress(path):
+    try:
+        with open(os.path.join(path, 'progress.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class KeypointWriter:
+    def __init__(self, path, chunk_size=64, metadata=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.metadata = metadata or {}
+        self.frames = 0        # 已經寫到硬碟的幀數
+        self.pending = 0       # buffer 裡還沒寫出的幀數
+        self.boxes = np.zeros((chunk_size,) + BOX_SHAPE, dtype=np.float32)
+        self.keypoints = np.zeros((chunk_size,) + KEYPOINT_SHAPE, dtype=np.float32)
+        os.makedirs(path, exist_ok=True)
+
+    def resume(self):
+        """回傳可以從第幾幀繼續; metadata 不同(換了影片)或沒有進度時從 0 開始"""
+        progress = read_progress(self.path)
+        if progress is not None and progress['metadata'] == self.metadata:
+            self.frames = progress['frames']
+        else:
+            self.frames = 0
+        # 把最後一個沒寫完的 chunk 截掉
+        for name, shape in (('boxes.f32', BOX_SHAPE), ('keypoints.f32', KEYPOINT_SHAPE)):
+            with open(os.path.join(self.path, name), 'ab') as f:
+                f.truncate(self.frames * _row_bytes(shape))
+        self._write_progress(complete=False)
+        return self.frames
+
+    def append(self, bbox, keypoints):
+        """bbox (5,), keypoints (4, 17)"""
+        self.boxes[self.pending] = bbox
+        self.keypoints[self.pending] = keypoints
+        self.pending += 1
+        if self.pending == self.chunk_size:
+            self.flush()
+
+    @profiled('serialize.kps')
+    def flush(self):
+        if self.pending == 0:
+            return
+        for name, buffer in (('boxes.f32', self.boxes), ('keypoints.f32', self.keypoints)):
+            with open(os.path.join(self.path, name), 'ab') as f:
+                f.write(buffer[:self.pending].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.frames += self.pending
+        self.pending = 0
+        self._write_progress(complete=False)
+
+    def close(self):
+        self.flush()
+        self._write_progress(complete=True)
+
+    def _write_progress(self, complete):
+        tmp = os.path.join(self.path, 'progress.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'frames': self.frames, 'complete': complete, 'metadata': self.metadata}, f)
+        os.replace(tmp, os.path.join(self.path, 'progress.json'))
+
+
+def read_keypoints(path):
+    """以 mmap 讀取已完成的幀: 回傳 {'boxes': (T, 5), 'keypoints': (T, 4, 17), 'metadata', 'complete'}"""
+    progress = read_progress(path)
+    if progress is None:
+        raise FileNotFoundError(os.path.join(path, 'progress.json'))
+    frames = progress['frames']
+    data = {'metadata': progress['metadata'], 'complete': progress['complete']}
+    for key, name, shape in (('boxes', 'boxes.f32', BOX_SHAPE), ('keypoints', 'keypoints.f32', KEYPOINT_SHAPE)):
+        if frames == 0:
+            data[key] = np.zeros((0,) + shape, dtype=np.float32)
+        else:
+            data[key] = np.memmap(os.path.join(path, name), dtype=np.float32, mode='r', shape=(frames,) + shape)
+    return data
+
+
+@profiled('serialize.npz')
+def save_npz(out_name, boxes, keypoints, metadata):
+    """(T, 5) boxes 與 (T, 4, 17) keypoints 存成 infer_video_new 原本的 .npz 格式, 給 VideoPose3D 的 prepare_data_2d_custom.py 使用"""
+    cls_boxes = []
+    segments = []
+    cls_keyps = []
+    for bbox, kps in zip(boxes, keypoints):
+        # Mimic Detectron1 format
+        cls_boxes.append([[], np.array(bbox[None])])
+        segments.append(None)
+        cls_keyps.append([[], np.array(kps[None])])
+    cls_boxes = np.array(cls_boxes, dtype=object)
+    cls_keyps = np.array(cls_keyps, dtype=object)
+    segments = np.array(segments, dtype=object)
+    np.savez_compressed(out_name, boxes=cls_boxes, segments=segments, keypoints=cls_keyps, metadata=metadata)
+
+
+def export_npz(path, out_name, smooth='none'):
+    """轉成 infer_video_new 原本的 .npz 格式, smooth 同 infer_video_new --smooth"""
+    data = read_keypoints(path)
+    metadata = {key: value for key, value in data['metadata'].items() if key not in ('video', 'size')}
+    boxes, keypoints = data['boxes'], data['keypoints']
+    if smooth != 'none' and len(keypoints):
+        keypoints, metadata['smoothing'] = repair_keypoints_2d(keypoints, boxes, method=smooth, fps=metadata['fps'])
+    save_npz(out_name, boxes, keypoints, metadata)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a streamed keypoint store to the VideoPose3D .npz format')
+    parser.add_argument('store', help='keypoint store directory (written by infer_video_new.py --stream)')
+    parser.add_argument('out_name', help='output .npz path')
+    parser.add_argument('--smooth', default='none', choices=METHODS, help='fill gaps and smooth the keypoints')
+    args = parser.parse_args()
+    export_npz(args.store, args.out_name, args.smooth)
@@ -0,0 +1,308 @@
+import argparse
+import functools
+import hashlib
+import os
+
+import numpy as np
+
+from profiling import profiled
+from smoothing import fill_gaps
+'''
+2D -> 3D lifting, 取代手動跑 VideoPose3D notebook: infer_video_new 的 2D 關鍵點直接在記憶體裡變成 (T, 17, 3)
+
+VideoPose3D 的 TemporalModel (pretrained_h36m_detectron_coco.bin: filter_widths 3,3,3,3,3, 1024 channels,
+receptive field 243 幀) 在 CPU 上用 numpy 推論: BatchNorm 併進 conv 的權重, 每個 dilated conv 是 k 個矩陣乘法;
+torch 只有轉換 checkpoint 時才需要 (python lift.py convert xxx.bin -> .npz)
+
+輸入與 VideoPose3D 的 custom dataset 相同:
+    COCO 順序的 17 個 2D 關鍵點 (x, y), 以影片寬高正規化到 [-1, 1]; 沒偵測到人的幀用前後幀線性內插
+    開頭/結尾各補 (receptive field - 1) / 2 幀 (複製第一/最後一幀), 並做左右翻轉的 test-time augmentation
+輸出為 Human3.6M 順序的相機座標, hip(0) 設為 0, 與 standard/*.npy 相同
+
+StreamingLifter 以重疊的視窗處理: 第 t 幀需要 t ± 121 幀的 2D, 只要後面的 2D 到了就先算,
+影片還在解碼/偵測時 3D 就陸續出來, 每個視窗多算左右各 121 幀的 context
+IncrementalLifter 給 live.py 逐幀用: 每層 conv 留最近 (k - 1) * dilation 幀的輸入,
+新的 n 幀進來每層只算 n 列, 不重算 context; 輸出一樣晚 121 幀
+'''
+LIFTER_PATH = os.environ.get('SWING_LIFTER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoint',
+                                                          'pretrained_h36m_detectron_coco.npz'))
+CHUNK = 256   # 每個視窗輸出幾幀; 越大重複算的 context 比例越小, 但第一批 3D 出來得越晚
+
+COCO_LEFT, COCO_RIGHT = [1, 3, 5, 7, 9, 11, 13, 15], [2, 4, 6, 8, 10, 12, 14, 16]
+H36M_LEFT, H36M_RIGHT = [4, 5, 6, 11, 12, 13], [1, 2, 3, 14, 15, 16]
+
+
+def _fold_bn(weight, state, prefix, eps=1e-5):
+    """conv (out, in, k) + BatchNorm -> numpy 的 (k, in, out) 權重與 bias"""
+    scale = state[prefix + '.weight'] / np.sqrt(state[prefix + '.running_var'] + eps)
+    bias = state[prefix + '.bias'] - state[prefix + '.running_mean'] * scale
+    return (weight * scale[:, None, None]).transpose(2, 1, 0), bias
+
+
+def convert_checkpoint(path):
+    """VideoPose3D 的 .bin (torch) -> TemporalLifter 用的 array dict; 只有這裡需要 torch"""
+    import torch
+    checkpoint = torch.load(path, map_location='cpu')
+    state = {key: value.numpy().astype(np.float64) for key, value in checkpoint['model_pos'].items()}
+    arrays = {}
+    arrays['w0'], arrays['b0'] = _fold_bn(state['expand_conv.weight'], state, 'expand_bn')
+    i = 0
+    while 'layers_conv.{}.weight'.format(2 * i) in state:
+        for j in (2 * i, 2 * i + 1):
+            arrays['w{}'.format(j + 1)], arrays['b{}'.format(j + 1)] = _fold_bn(
+                state['layers_conv.{}.weight'.format(j)], state, 'layers_bn.{}'.format(j))
+        i += 1
+    arrays['shrink_w'] = state['shrink.weight'][:, :, 0].T
+    arrays['shrink_b'] = state['shrink.bias']
+    return {name: array.astype(np.float32) for name, array in arrays.items()}
+
+
+class TemporalLifter:
+    def __init__(self, arrays):
+        """arrays 為 convert_checkpoint 的結果 (或存成的 .npz); filter width 與 dilation 由權重的形狀推出"""
+        self.expand = (arrays['w0'], arrays['b0'])
+        self.blocks = []   # (dilated conv 權重 (k, in, out), bias, dilation, 1x1 conv 權重, bias)
+        dilation = len(arrays['w0'])
+        n = 1
+        while 'w{}'.format(n) in arrays:
+            weight = arrays['w{}'.format(n)]
+            self.blocks.append((weight, arrays['b{}'.format(n)], dilation,
+                                arrays['w{}'.format(n + 1)][0], arrays['b{}'.format(n + 1)]))
+            dilation *= len(weight)
+            n += 2
+        self.shrink = (arrays['shrink_w'], arrays['shrink_b'])
+        self.receptive_field = len(arrays['w0']) + sum((len(weight) - 1) * d for weight, _, d, _, _ in self.blocks)
+        self.pad = (self.receptive_field - 1) // 2
+        self.digest = hashlib.sha256(b''.join(np.ascontiguousarray(arrays[name]).tobytes()
+                                              for name in sorted(arrays))).hexdigest()[:16]
+
+    @staticmethod
+    def _conv(x, weight, bias, dilation=1):
+        """(B, T, in) 的 valid dilated conv1d + ReLU: 每個 tap 一個矩陣乘法"""
+        out = x.shape[1] - (len(weight) - 1) * dilation
+        y = x[:, :out] @ weight[0] + bias
+        for k in range(1, len(weight)):
+            y += x[:, k * dilation:k * dilation + out] @ weight[k]
+        return np.maximum(y, 0, out=y)
+
+    def forward(self, x):
+        """(B, T + 2 pad, 17, 2) 正規化的 2D -> (B, T, 17, 3), 與 TemporalModel.forward (eval) 相同"""
+        x = np.ascontiguousarray(x, dtype=np.float32).reshape(x.shape[0], x.shape[1], -1)
+        x = self._conv(x, *self.expand)
+        for weight, bias, dilation, weight_1x1, bias_1x1 in self.blocks:
+            shift = (len(weight) - 1) * dilation // 2
+            residual = x[:, shift:x.shape[1] - shift]
+            x = residual + np.maximum(self._conv(x, weight, bias, dilation) @ weight_1x1 + bias_1x1, 0)
+        return (x @ self.shrink[0] + self.shrink[1]).reshape(x.shape[0], x.shape[1], -1, 3)
+
+    @profiled('lift')
+    def predict(self, x, flip=True):
+        """(T + 2 pad, 17, 2) -> (T, 17, 3); flip 時再算一次左右翻轉的輸入並平均"""
+        batch = x[None]
+        if flip:
+            flipped = x.copy()
+            flipped[..., 0] *= -1
+            flipped[:, COCO_LEFT + COCO_RIGHT] = flipped[:, COCO_RIGHT + COCO_LEFT]
+            batch = np.stack([x, flipped])
+        y = self.forward(batch)
+        if flip:
+            y[1, ..., 0] *= -1
+            y[1, :, H36M_LEFT + H36M_RIGHT] = y[1, :, H36M_RIGHT + H36M_LEFT]
+            y = y.mean(axis=0, keepdims=True)
+        y = y[0]
+        y[:, 0] = 0
+        return y
+
+
+@functools.lru_cache(maxsize=2)
+def load_lifter(path=LIFTER_PATH):
+    """.npz (lift.py convert 的輸出) 或 VideoPose3D 的 .bin (需要 torch)"""
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return TemporalLifter(dict(data))
+    return TemporalLifter(convert_checkpoint(path))
+
+
+def normalize_screen(keypoints, w, h):
+    """像素 (..., 2) -> [-1, 1], 與 VideoPose3D 的 normalize_screen_coordinates 相同"""
+    return keypoints / w * 2 - np.array([1, h / w], dtype=np.float32)
+
+
+class StreamingLifter:
+    def __init__(self, lifter, w, h, chunk=CHUNK, flip=True):
+        self.lifter = lifter
+        self.w, self.h = w, h
+        self.chunk = chunk
+        self.flip = flip
+        self.inputs = np.empty((0, 17, 2), dtype=np.float32)   # 還會用到的 2D, 第 offset 幀開始
+        self.valid = np.empty(0, dtype=bool)
+        self.offset = 0
+        self.frames = 0       # 已經收到幾幀
+        self.emitted = 0      # 已經輸出幾幀 3D
+        self.last_valid = -1  # 最後一個有偵測到人的幀
+
+    def push(self, keypoints, boxes):
+        """
+        keypoints (n, 4, 17) / boxes (n, 5) 為 infer_video_new 的 Detectron 格式 (原始影片的像素, 沒偵測到人時分數 0)
+        回傳這次完成的 (m, 17, 3), m 可能是 0
+        """
+        keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, 4, 17)
+        valid = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)[:, 4] > 0
+        self.inputs = np.concatenate([self.inputs, normalize_screen(keypoints[:, :2].transpose(0, 2, 1), self.w, self.h)])
+        self.valid = np.concatenate([self.valid, valid])
+        if valid.any():
+            self.last_valid = self.frames + int(np.nonzero(valid)[0][-1])
+        self.frames += len(keypoints)
+        # 最後一個有人的幀之前的洞都能內插了, 右邊還要 pad 幀的 context
+        ready = self.last_valid + 1 - self.lifter.pad
+        outputs = []
+        while ready - self.emitted >= self.chunk:
+            outputs.append(self._lift(self.emitted + self.chunk, final=False))
+        return np.concatenate(outputs) if outputs else np.empty((0, 17, 3), dtype=np.float32)
+
+    def finish(self):
+        """影片結束: 結尾沒偵測到人的幀沿用最後一個有人的幀, 補 pad 後輸出剩下的全部"""
+        if self.last_valid < 0:
+            raise ValueError('no person detected in any frame, nothing to lift')
+        outputs = []
+        while self.emitted < self.frames:
+            outputs.append(self._lift(min(self.emitted + self.chunk, self.frames), final=True))
+        return np.concatenate(outputs) if outputs else np.empty((0, 17, 3), dtype=np.float32)
+
+    def _lift(self, end, final):
+        """輸出 [emitted, end) 幀: 取 [emitted - pad, end + pad) 的 2D, 超出影片的部分複製第一/最後一幀"""
+        pad = self.lifter.pad
+        start = self.emitted
+        stop = self.frames if final else self.last_valid + 1
+        missing = np.repeat(~self.valid[:stop - self.offset, None], 17, axis=1)
+        filled, _ = fill_gaps(self.inputs[:stop - self.offset], missing)
+        assert self.offset == 0 or start - pad >= self.offset
+        index = np.clip(np.arange(start - pad, end + pad), 0, stop - 1) - self.offset
+        coordinates = self.lifter.predict(filled[index].astype(np.float32), self.flip)
+        self.emitted = end
+        # 之後的視窗最早用到 emitted - pad; 還要保留前一個有人的幀給內插用
+        keep = min(self.emitted - pad, self._previous_valid(self.emitted - pad))
+        if keep > self.offset:
+            self.inputs, self.valid = self.inputs[keep - self.offset:], self.valid[keep - self.offset:]
+            self.offset = keep
+        return coordinates.astype(np.float32)
+
+    def _previous_valid(self, frame):
+        """frame 之前 (含) 最後一個有人的幀, 沒有時為 offset (不裁切)"""
+        valid = np.nonzero(self.valid[:max(0, frame - self.offset + 1)])[0]
+        return self.offset + int(valid[-1]) if len(valid) else self.offset
+
+
+class IncrementalLifter:
+    def __init__(self, lifter, flip=True):
+        """每層留最近 (k - 1) * dilation 幀的輸入 (tail); 新的 n 幀接在後面做 valid conv, 剛好得到 n 列"""
+        self.lifter = lifter
+        self.flip = flip
+        self.tails = None
+
+    def _layer(self, i, x, weight, bias, dilation):
+        """第 i 層: tail + 新的列 x (B, n, C) -> valid dilated conv + ReLU (B, n', C)"""
+        x = np.concatenate([self.tails[i], x], axis=1)
+        self.tails[i] = x[:, max(0, x.shape[1] - (len(weight) - 1) * dilation):]
+        if x.shape[1] <= (len(weight) - 1) * dilation:
+            return None, x
+        return TemporalLifter._conv(x, weight, bias, dilation), x
+
+    def _steps(self, x):
+        """x (B, n, 34) 新的 n 幀 -> (B, n', 51), 還沒累積滿 receptive field 的部分沒有輸出"""
+        if self.tails is None:
+            self.tails = [x[:, :0]] + [np.zeros((len(x), 0, len(bias)), dtype=np.float32)
+                                       for _, bias, _, _, _ in self.lifter.blocks]
+        empty = np.zeros((len(x), 0, len(self.lifter.shrink[1])), dtype=np.float32)
+        y, _ = self._layer(0, x, *self.lifter.expand, 1)
+        for i, (weight, bias, dilation, weight_1x1, bias_1x1) in enumerate(self.lifter.blocks, 1):
+            if y is None:
+                return empty
+            h, full = self._layer(i, y, weight, bias, dilation)
+            if h is None:
+                return empty
+            shift = (len(weight) - 1) * dilation // 2
+            y = full[:, shift:shift + h.shape[1]] + np.maximum(h @ weight_1x1 + bias_1x1, 0)
+        return y @ self.lifter.shrink[0] + self.lifter.shrink[1]
+
+    @profiled('lift.incremental')
+    def push(self, keypoints):
+        """
+        正規化的 2D (n, 17, 2) -> 完成的 (m, 17, 3), 每一列是 pad 幀之前的幀; 一次 push 多幀時權重只讀一次
+        第一幀先重複 pad 次 (同 TemporalLifter.predict 的邊界), 結果與整段一起算相同
+        """
+        x = np.asarray(keypoints, dtype=np.float32).reshape(-1, 17, 2)
+        if self.tails is None and len(x):
+            x = np.concatenate([np.repeat(x[:1], self.lifter.pad, axis=0), x])
+        batch = x[None]
+        if self.flip:
+            flipped = x.copy()
+            flipped[..., 0] *= -1
+            flipped[:, COCO_LEFT + COCO_RIGHT] = flipped[:, COCO_RIGHT + COCO_LEFT]
+            batch = np.stack([x, flipped])
+        y = self._steps(batch.reshape(len(batch), len(x), -1))
+        y = y.reshape(len(y), -1, 17, 3)
+        if self.flip:
+            y[1, ..., 0] *= -1
+            y[1, :, H36M_LEFT + H36M_RIGHT] = y[1, :, H36M_RIGHT + H36M_LEFT]
+            y = y.mean(axis=0, keepdims=True)
+        y = y[0]
+        y[:, 0] = 0
+        return y.astype(np.float32)
+
+
+def lift_keypoints(keypoints, boxes, w, h, lifter=None, chunk=CHUNK, flip=True):
+    """整段的 Detectron 格式 2D (T, 4, 17) / (T, 5) -> (T, 17, 3); 與逐幀餵 StreamingLifter 的結果相同"""
+    streamer = StreamingLifter(lifter or load_lifter(), w, h, chunk, flip)
+    return np.concatenate([streamer.push(keypoints, boxes), streamer.finish()])
+
+
+def read_npz(npz_path):
+    """infer_video_new 輸出的 Detectron1 格式 .npz -> (boxes (T, 5), keypoints (T, 4, 17), metadata), 同 pose_clip.from_npz"""
+    data = np.load(npz_path, allow_pickle=True)
+    boxes = np.zeros((len(data['boxes']), 5), dtype=np.float32)
+    keypoints = np.zeros((len(data['keypoints']), 4, 17), dtype=np.float32)
+    for i, (cls_boxes, cls_keyps) in enumerate(zip(data['boxes'], data['keypoints'])):
+        bbox, kps = np.asarray(cls_boxes[1]), np.asarray(cls_keyps[1])
+        if bbox.size == 5 and kps.size == 4 * 17:
+            boxes[i], keypoints[i] = bbox.reshape(5), kps.reshape(4, 17)
+    return boxes, keypoints, data['metadata'].item()
+
+
+def lift_npz(npz_path, lifter=None, **options):
+    """infer_video_new 輸出的 .npz -> ((T, 17, 3), metadata)"""
+    boxes, keypoints, metadata = read_npz(npz_path)
+    return lift_keypoints(keypoints, boxes, metadata['w'], metadata['h'], lifter, **options), metadata
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='VideoPose3D lifting on CPU, without the notebook')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='convert a VideoPose3D .bin checkpoint to .npz (needs torch)')
+    convert.add_argument('checkpoint')
+    convert.add_argument('--output', default=LIFTER_PATH, type=str)
+    run = subparsers.add_parser('run', help='lift an infer_video_new.py .npz to a (T, 17, 3) .npy')
+    run.add_argument('npz')
+    run.add_argument('--output', default=None, type=str, help='output .npy (default: <npz without .npz>.npy)')
+    run.add_argument('--weights', default=LIFTER_PATH, type=str)
+    run.add_argument('--chunk', default=CHUNK, type=int)
+    run.add_argument('--no-flip', dest='flip', action='store_false', help='skip the flip test-time augmentation')
+    return parser.parse_args()
+
+
+def main(args):
+    if args.command == 'convert':
+        arrays = convert_checkpoint(args.checkpoint)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        np.savez(args.output, **arrays)
+        print('receptive field {} -> {}'.format(TemporalLifter(arrays).receptive_field, args.output))
+    else:
+        coordinates, _ = lift_npz(args.npz, load_lifter(args.weights), chunk=args.chunk, flip=args.flip)
+        output = args.output or os.path.splitext(args.npz)[0] + '.npy'
+        np.save(output, coordinates)
+        print('{} frames -> {}'.format(len(coordinates), output))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
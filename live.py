@@ -0,0 +1,334 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from analytics import ANALYTICS_PATH, AnalyticsStore
+from angles import NUM_ANGLES, calculate_angles
+from batch_grade import grade_coordinates
+from lift import LIFTER_PATH, IncrementalLifter, load_lifter, normalize_screen, read_npz
+from profiling import PROFILE_PATH, PROFILER, finish_profile, record, span
+from reference import PLAYERS, get_clip, load_library
+from report import ReportRenderer
+from smoothing import OneEuroFilter
+from video_io import probe_video, read_live
+'''
+即時模式 (打擊練習場): 攝影機或還在錄的檔案一幀一幀進來, 揮完棒一秒內出評分與報告
+
+    PoseRing        固定大小的環狀緩衝區, 存最近 BUFFER_SECONDS 的 2D、3D 與 12 個角度; 記憶體與每幀的工作量與練習多久無關
+    3D / 角度       IncrementalLifter 每 LIFT_EVERY 幀更新一次 (每層只算新的幾列), 角度只算新 lift 出來的幀;
+                    VideoPose3D 要看到後面 121 幀, 所以滾動的 3D 晚 121 幀
+    SwingDetector   2D 手腕 (相對髖部中點, 除以框高) 經過 One-Euro filter 的速度:
+                    超過 START_SPEED 開始, 降到 END_SPEED 以下持續 SETTLE_SECONDS 就是揮完了
+    評分            只處理揮棒視窗 (速度峰值前 PRE_SECONDS 到現在): 已經 lift 的幀直接用,
+                    還沒有的 (最後 121 幀左右) 以現在這一幀當作結尾補邊界算一次; 之後與 batch_grade.py 相同, 再畫報告
+
+    python live.py /dev/video0 --position 5 --size 960x540 --fps 30      # 攝影機, 需要 detectron2
+    python live.py recording.ts --position 5                             # 還在寫入的檔案
+    python live.py --replay out/input.mp4.npz --position 5               # 用 infer_video_new.py 的 2D 重播, 不用偵測
+'''
+BUFFER_SECONDS = 10.0
+PRE_SECONDS = 1.5
+START_SPEED = 3.0          # 手腕速度, 框高 / 秒
+END_SPEED = 1.0
+SETTLE_SECONDS = 0.3
+MIN_SWING_SECONDS = 0.1    # 超過 START_SPEED 到峰值之後降下來至少要這麼久, 濾掉單幀的跳動
+MAX_SWING_SECONDS = 3.0    # 一直在動 (走動、撿球) 不算揮棒
+COOLDOWN_SECONDS = 1.0
+LIFT_EVERY = 4             # 每幾幀 push 一次 IncrementalLifter, 權重只讀一次
+PUSH_WINDOW = 3000         # 每幀時間的 p50/p99 只看最近這麼多幀; 幀數與最大值另外累計, 練習多久記憶體都一樣
+PROFILE_EVENTS = 50000     # --profile 時只留最近這麼多個 span (每幀 2~4 個, 30 fps 約 5 分鐘)
+
+WRISTS, HIPS = [9, 10], [11, 12]   # COCO
+STANDARDS = {player: standard for standard, player in PLAYERS.items()}
+
+
+class PoseRing:
+    def __init__(self, capacity):
+        """最近 capacity 幀; 幀的編號從 0 開始一直增加, 存在編號 % capacity 的位置"""
+        self.capacity = capacity
+        self.count = 0      # 收過幾幀
+        self.lifted = 0     # 編號 < lifted 的幀已經有 3D (lift_start 之前的幀沒有人, 不會有)
+        self.boxes = np.zeros((capacity, 5), dtype=np.float32)
+        self.keypoints = np.zeros((capacity, 4, 17), dtype=np.float32)
+        self.inputs = np.zeros((capacity, 17, 2), dtype=np.float32)    # 給 lifter 的正規化 2D, 沒有人的幀沿用上一幀
+        self.coordinates = np.full((capacity, 17, 3), np.nan, dtype=np.float32)
+        self.angles = np.full((capacity, NUM_ANGLES), np.nan, dtype=np.float32)
+
+    @property
+    def oldest(self):
+        return max(0, self.count - self.capacity)
+
+    def append(self, box, keypoints, inputs):
+        slot = self.count % self.capacity
+        self.boxes[slot], self.keypoints[slot], self.inputs[slot] = box, keypoints, inputs
+        self.coordinates[slot] = np.nan
+        self.angles[slot] = np.nan
+        self.count += 1
+
+    def add_3d(self, coordinates):
+        """IncrementalLifter 的新結果, 接在 lifted 之後; 只算這幾幀的角度"""
+        frames = np.arange(self.lifted, self.lifted + len(coordinates))
+        keep = frames >= self.oldest
+        slots = frames[keep] % self.capacity
+        self.coordinates[slots] = coordinates[keep]
+        self.angles[slots] = calculate_angles(coordinates[keep])
+        self.lifted += len(coordinates)
+
+    def get(self, name, start, stop):
+        """第 start ~ stop - 1 幀 (要在緩衝區裡) 的複本"""
+        if start < self.oldest or stop > self.count:
+            raise IndexError('frames {}-{} not in the buffer ({}-{})'.format(start, stop, self.oldest, self.count))
+        return getattr(self, name)[np.arange(start, stop) % self.capacity]
+
+
+class SwingDetector:
+    def __init__(self, fps, start_speed=START_SPEED, end_speed=END_SPEED, settle=SETTLE_SECONDS,
+                 min_swing=MIN_SWING_SECONDS, max_swing=MAX_SWING_SECONDS, cooldown=COOLDOWN_SECONDS):
+        self.fps = fps
+        self.start_speed, self.end_speed = start_speed, end_speed
+        self.settle, self.min_swing = int(round(settle * fps)), int(round(min_swing * fps))
+        self.max_swing, self.cooldown = int(round(max_swing * fps)), int(round(cooldown * fps))
+        self.filter = OneEuroFilter(fps, min_cutoff=3.0, beta=0.1)
+        self.previous = None
+        self.frame = -1
+        self.swing = None       # 揮棒中: {'start', 'peak', 'peak_speed', 'quiet'}
+        self.ready_at = 0       # cooldown 結束的幀
+
+    def update(self, box, keypoints):
+        """一幀 -> 這一幀的手腕速度與揮完時的 {'start', 'peak', 'end', 'peak_speed'} (其他時候為 None)"""
+        self.frame += 1
+        speed = 0.0
+        if box[4] > 0:
+            height = max(box[3] - box[1], 1.0)
+            hips = keypoints[:2, HIPS].mean(axis=1)
+            wrists = self.filter((keypoints[:2, WRISTS].T - hips) / height)
+            if self.previous is not None:
+                speed = float(np.linalg.norm(wrists - self.previous, axis=1).max() * self.fps)
+            self.previous = wrists
+        return speed, self._step(speed)
+
+    def _step(self, speed):
+        frame = self.frame
+        if self.swing is None:
+            if speed >= self.start_speed and frame >= self.ready_at:
+                self.swing = {'start': frame, 'peak': frame, 'peak_speed': speed, 'quiet': 0}
+            return None
+        swing = self.swing
+        if speed > swing['peak_speed']:
+            swing.update(peak=frame, peak_speed=speed)
+        swing['quiet'] = swing['quiet'] + 1 if speed < self.end_speed else 0
+        if frame - swing['start'] > self.max_swing:
+            self.swing = None
+            return None
+        if swing['quiet'] < self.settle:
+            return None
+        self.swing = None
+        self.ready_at = frame + self.cooldown
+        if frame - swing['quiet'] - swing['start'] < self.min_swing:
+            return None
+        return {'start': swing['start'], 'peak': swing['peak'], 'end': frame, 'peak_speed': swing['peak_speed']}
+
+
+class LiveSession:
+    def __init__(self, w, h, fps, job, library=None, lifter=None, buffer_seconds=BUFFER_SECONDS, pre_seconds=PRE_SECONDS,
+                 lift_every=LIFT_EVERY, renderer=None, report='png', output_dir=None, analytics=None, detector=None):
+        self.w, self.h, self.fps = w, h, fps
+        self.job = job
+        self.library = library or load_library()
+        self.lifter = lifter or load_lifter()
+        self.incremental = IncrementalLifter(self.lifter)
+        self.lift_every = lift_every
+        # 補最後一段 3D 時要往回看 2 pad 幀
+        capacity = max(int(buffer_seconds * fps), 2 * self.lifter.pad + lift_every + 1)
+        self.ring = PoseRing(capacity)
+        self.pre = int(round(pre_seconds * fps))
+        self.detector = detector or SwingDetector(fps)
+        self.renderer = renderer if renderer is not None or report == 'none' else ReportRenderer()
+        self.report = report
+        self.output_dir = output_dir
+        self.analytics = analytics
+        self.last_input = None
+        self.pending = 0            # 還沒 push 給 IncrementalLifter 的幀數
+        self.lift_start = None      # 第一個有人的幀, 之前的幀沒有 3D
+        self.swings = 0
+
+    def push(self, box, keypoints):
+        """
+        一幀的偵測 (bbox (5,)、keypoints (4, 17), 這一幀的像素) -> 揮完棒時的評分結果 dict, 其他時候 None
+        每幀的工作量固定: 一次 ring 寫入、每 lift_every 幀一次 incremental lift、一次 One-Euro
+        """
+        box = np.asarray(box, dtype=np.float32).reshape(5)
+        keypoints = np.asarray(keypoints, dtype=np.float32).reshape(4, 17)
+        frame = self.ring.count
+        if box[4] > 0:
+            self.last_input = normalize_screen(keypoints[:2].T, self.w, self.h)
+            if self.lift_start is None:
+                self.lift_start = self.ring.lifted = frame
+        self.ring.append(box, keypoints, self.last_input if self.last_input is not None else 0)
+        if self.lift_start is not None:
+            self.pending += 1
+            if self.pending >= self.lift_every:
+                self.ring.add_3d(self.incremental.push(self.ring.get('inputs', frame + 1 - self.pending, frame + 1)))
+                self.pending = 0
+        _, swing = self.detector.update(box, keypoints)
+        if swing is None or self.lift_start is None:
+            return None
+        return self.grade_swing(swing)
+
+    def swing_coordinates(self, start):
+        """
+        第 start 幀到現在的 (T, 17, 3): 已經 lift 的幀直接用; 後面的以現在這一幀當作結尾
+        (右邊複製最後一幀, 同影片結束時) 算一次, 最多 pad + lift_every 幀
+        """
+        stop = self.ring.count
+        tail = max(start, self.ring.lifted)
+        parts = [self.ring.get('coordinates', start, tail)]
+        if tail < stop:
+            pad = self.lifter.pad
+            first = max(tail - pad, self.lift_start, self.ring.oldest)
+            inputs = self.ring.get('inputs', first, stop)
+            inputs = np.concatenate([np.repeat(inputs[:1], pad - (tail - first), axis=0), inputs,
+                                     np.repeat(inputs[-1:], pad, axis=0)])
+            parts.append(self.lifter.predict(inputs))
+        return np.concatenate(parts)
+
+    def grade_swing(self, swing):
+        t = time.perf_counter()
+        start = max(swing['peak'] - self.pre, self.lift_start, self.ring.oldest)
+        coordinates = self.swing_coordinates(start)
+        t_lifted = time.perf_counter()
+        result, comments = grade_coordinates(coordinates, {'fps': self.fps}, self.job, self.library)
+        t_graded = time.perf_counter()
+        self.swings += 1
+        result.update(swing=self.swings, window=[start, self.ring.count], session_frame=start + result['frame'] - 1,
+                      peak_frame=swing['peak'], peak_speed=round(swing['peak_speed'], 3))
+        if self.renderer is not None:
+            coordinates_1 = get_clip(self.library, result['reference'], self.job.get('normalize', False))[0]
+            entry = self.library['clips'][result['reference']]
+            image = self.renderer.render(coordinates_1, result['reference_frame'] - 1, coordinates, result['frame'] - 1,
+                                         result['grade'], comments, STANDARDS.get(entry['player'], entry['player']),
+                                         entry['position'], format=self.report)
+            if self.output_dir is not None:
+                result['report'] = os.path.join(self.output_dir, 'swing_{:03d}.{}'.format(self.swings, self.report))
+                with open(result['report'], 'wb') as f:
+                    f.write(image)
+        if self.analytics is not None:
+            self.analytics.record([dict(self.job, **result)])
+        t_done = time.perf_counter()
+        record('live.swing', t, t_done, swing=self.swings)
+        result['timings'] = {'lift': t_lifted - t, 'grade': t_graded - t_lifted, 'render': t_done - t_graded,
+                             'total': t_done - t}
+        return result
+
+
+def parse_size(value):
+    w, _, h = value.lower().partition('x')
+    return int(w), int(h)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Live swing grading from a camera or a growing recording')
+    parser.add_argument('source', nargs='?', default=None, help='/dev/videoN or a file that is still being written')
+    parser.add_argument('--replay', default=None, type=str, help='replay the 2D of an infer_video_new.py .npz instead of detecting')
+    parser.add_argument('--realtime', action='store_true', help='with --replay: pace frames at the recorded fps')
+    parser.add_argument('--size', default=None, type=parse_size, help='WxH to decode at (default: probed, camera 960x540)')
+    parser.add_argument('--fps', default=None, type=float, help='frame rate (default: probed, camera 30)')
+    parser.add_argument('--timeout', default=5.0, type=float, help='seconds without new data before a growing file ends')
+    parser.add_argument('--cfg', default='COCO-Keypoints/keypoint_rcnn_R_101_FPN_3x.yaml', type=str)
+    parser.add_argument('--score-thresh', dest='score_thresh', default=0.7, type=float)
+    parser.add_argument('--position', required=True, type=int)
+    parser.add_argument('--standard', default=1, type=int, choices=sorted(PLAYERS), help='1: Ohtani, 2: Judge')
+    parser.add_argument('--rubric', default=None, type=str, help='scoring rubric JSON (scoring.py)')
+    parser.add_argument('--player', default=None, type=str)
+    parser.add_argument('--lift', default=LIFTER_PATH, type=str, help='lift.py weights')
+    parser.add_argument('--buffer-seconds', default=BUFFER_SECONDS, type=float)
+    parser.add_argument('--report', default='png', choices=['png', 'svg', 'none'])
+    parser.add_argument('--output-dir', default='live', type=str, help='swing_NNN.png reports and swings.jsonl')
+    parser.add_argument('--analytics', nargs='?', default=None, const=ANALYTICS_PATH, type=str)
+    parser.add_argument('--profile', nargs='?', default=None, const=PROFILE_PATH, type=str,
+                        help='time every stage (profiling.py): summary table + Chrome trace of the last PROFILE_EVENTS spans')
+    args = parser.parse_args()
+    if (args.source is None) == (args.replay is None):
+        parser.error('give either a source or --replay')
+    return args
+
+
+def replay_frames(npz_path, realtime=False):
+    """--replay: (w, h, fps, 逐幀 (box, keypoints) 的 iterator)"""
+    boxes, keypoints, metadata = read_npz(npz_path)
+
+    def frames():
+        t = time.perf_counter()
+        for i, (box, kps) in enumerate(zip(boxes, keypoints)):
+            if realtime:
+                time.sleep(max(0.0, t + i / metadata['fps'] - time.perf_counter()))
+            yield box, kps
+    return metadata['w'], metadata['h'], metadata['fps'], frames()
+
+
+def camera_frames(args):
+    """攝影機 / 還在寫入的檔案: (w, h, fps, 逐幀 (box, keypoints) 的 iterator), 每幀跑一次 detectron2"""
+    from infer_video_new import infer_batch, make_predictor
+    if args.size is None or args.fps is None:
+        if args.source.startswith('/dev/video'):
+            info = {'w': 960, 'h': 540, 'fps': 30.0}
+        else:
+            info = probe_video(args.source)
+    w, h = args.size or (info['w'], info['h'])
+    fps = args.fps or info['fps'] or 30.0
+    predictor = make_predictor(argparse.Namespace(cfg=args.cfg, score_thresh=args.score_thresh))
+
+    def frames():
+        for im in read_live(args.source, w, h, fps, args.timeout):
+            with span('detect'):
+                (bbox_tensor, kps), = infer_batch(predictor, [im])
+            yield bbox_tensor[0], kps[0]
+    return w, h, fps, frames()
+
+
+def main(args):
+    if args.profile:
+        PROFILER.enable(max_events=PROFILE_EVENTS)
+    w, h, fps, frames = replay_frames(args.replay, args.realtime) if args.replay else camera_frames(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    job = {'standard': args.standard, 'position': args.position, 'frame': None, 'sequence': False, 'best_match': False,
+           'rubric': args.rubric, 'player': args.player, 'file': args.replay or args.source}
+    analytics = AnalyticsStore(args.analytics) if args.analytics else None
+    session = LiveSession(w, h, fps, job, lifter=load_lifter(args.lift), buffer_seconds=args.buffer_seconds,
+                          report=args.report, output_dir=args.output_dir, analytics=analytics)
+    print('{}x{} @ {:.2f} fps, buffer {} frames, rolling 3D lags {} frames'.format(
+        w, h, fps, session.ring.capacity, session.lifter.pad))
+    push_times = deque(maxlen=PUSH_WINDOW)
+    pushed, slowest = 0, 0.0
+    with open(os.path.join(args.output_dir, 'swings.jsonl'), 'a') as log:
+        for box, kps in frames:
+            t = time.perf_counter()
+            result = session.push(box, kps)
+            t_pushed = time.perf_counter()
+            push_times.append(t_pushed - t)
+            pushed, slowest = pushed + 1, max(slowest, t_pushed - t)
+            record('live.push', t, t_pushed)
+            if result is None:
+                continue
+            log.write(json.dumps(result, ensure_ascii=False) + '\n')
+            log.flush()
+            print('swing {} at frame {}: grade {:.2f} ({:.0f} ms: lift {:.0f}, grade {:.0f}, report {:.0f}) {}'.format(
+                result['swing'], result['session_frame'], result['grade'], *(1000 * result['timings'][name] for name in
+                                                                            ('total', 'lift', 'grade', 'render')),
+                result.get('report', '')))
+    if analytics is not None:
+        analytics.close()
+    if pushed:
+        recent = 1000 * np.array(push_times)
+        print('{} frames, {} swings; per frame p50 {:.2f} ms, p99 {:.2f} ms (last {} frames), max {:.0f} ms (includes grading)'.format(
+            pushed, session.swings, np.percentile(recent, 50), np.percentile(recent, 99), len(recent), 1000 * slowest))
+    finish_profile(args.profile)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,162 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from angles import calculate_angles
+from grade import ANGLE_WEIGHTS
+from profiling import profiled
+from reference import STANDARD_DIR, LIBRARY_DIR, clip_signature, parse_clip_name
+'''
+找出最像的標準骨架: 把所有 standard/ 影片的每一幀嵌入成向量, 用暴力搜尋(向量化)找 top-k
+
+向量 = 12 個角度 x sqrt(權重), 平方距離就等於 grade 權重下的加權差距;
+joints=True 時再接上以骨盆(0)為原點、軀幹長度(0 -> 8)正規化的 17 個關節座標
+
+索引存成 library_dir/nearest_index.npz, 記錄每段影片的大小與修改時間,
+standard/ 新增或修改影片時只重算那幾段; 都沒變時不寫檔, 有變時寫到同一層的暫存檔再 os.replace,
+其他 process (pool worker 的 load_index、另一個服務) 不會讀到寫一半的索引
+'''
+INDEX_PATH = os.path.join(LIBRARY_DIR, 'nearest_index.npz')
+JOINT_WEIGHT = 50.0   # 正規化關節座標的比例, 讓 0.1 個軀幹長的差距約等於 5 度
+
+_ANGLE_SCALE = np.sqrt(np.asarray(ANGLE_WEIGHTS, dtype=np.float64) / np.mean(ANGLE_WEIGHTS))
+
+
+def embed_frames(angles, coordinates=None):
+    """(T, 12) 角度 [+ (T, 17, 3) 座標] -> (T, D) float32 向量"""
+    vectors = [np.asarray(angles, dtype=np.float64) * _ANGLE_SCALE]
+    if coordinates is not None:
+        coordinates = np.asarray(coordinates, dtype=np.float64)
+        root_relative = coordinates - coordinates[:, :1]
+        torso = np.linalg.norm(root_relative[:, 8], axis=-1)
+        torso[torso == 0] = 1.0
+        vectors.append(JOINT_WEIGHT * (root_relative / torso[:, None, None]).reshape(len(coordinates), -1))
+    return np.concatenate(vectors, axis=1).astype(np.float32)
+
+
+def build_index(standard_dir=STANDARD_DIR, index_path=INDEX_PATH, joints=None):
+    """
+    建立或增量更新索引: 沒變的影片沿用舊向量, 新增/修改的才重新計算, 刪除的拿掉
+    joints 為 None 時沿用既有索引的設定 (batch_grade.py、serve.py 不會把 --joints 建的索引蓋掉), 新索引只用角度
+    """
+    paths = sorted(glob.glob(os.path.join(standard_dir, '*.npy')))
+    old = load_index(index_path) if os.path.exists(index_path) else None
+    if joints is None:
+        joints = old['joints'] if old is not None else False
+    if old is not None and old['joints'] != joints:
+        old = None
+
+    names, sizes, mtimes, vector_blocks, frame_blocks = [], [], [], [], []
+    recomputed = 0
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        size, mtime = clip_signature(path)
+        if old is not None and old['signatures'].get(name) == (size, mtime):
+            vectors = old['vectors'][old['clip_ids'] == old['names'].index(name)].astype(np.float32)
+        else:
+            coordinates = np.load(path)
+            vectors = embed_frames(calculate_angles(coordinates), coordinates if joints else None)
+            recomputed += 1
+        names.append(name)
+        sizes.append(size)
+        mtimes.append(mtime)
+        vector_blocks.append(vectors)
+        frame_blocks.append(np.arange(len(vectors)))
+
+    if old is not None and recomputed == 0 and names == old['names']:
+        return old, 0
+    clip_ids = np.concatenate([np.full(len(block), n) for n, block in enumerate(vector_blocks)])
+    directory = os.path.dirname(index_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, staging = tempfile.mkstemp(prefix='.nearest-', suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, vectors=np.concatenate(vector_blocks), clip_ids=clip_ids, frames=np.concatenate(frame_blocks),
+                     names=np.array(names), sizes=np.array(sizes), mtimes=np.array(mtimes), joints=joints)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging, 0o644 & ~umask)   # mkstemp 是 0600
+        os.replace(staging, index_path)
+    except BaseException:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    return load_index(index_path), recomputed
+
+
+def load_index(index_path=INDEX_PATH):
+    data = np.load(index_path)
+    vectors = data['vectors'].astype(np.float64)   # 查詢時不用每次轉型
+    names = [str(name) for name in data['names']]
+    return {
+        'vectors': vectors,
+        'squared_norms': np.einsum('ij,ij->i', vectors, vectors),
+        'clip_ids': data['clip_ids'],
+        'frames': data['frames'],
+        'names': names,
+        'signatures': {name: (int(size), int(mtime)) for name, size, mtime in zip(names, data['sizes'], data['mtimes'])},
+        'joints': bool(data['joints']),
+    }
+
+
+@profiled('search')
+def search(index, angles, coordinates=None, k=5, player=None):
+    """
+    angles 為單幀 (12,) 或一段視窗 (W, 12); 視窗時找同一段影片裡連續 W 幀距離總和最小的位置
+    index 含關節時要一併給 coordinates; player 可以限定只找某位標準球員
+    回傳距離由小到大的 [{'name', 'player', 'position', 'frame', 'distance'}], frame 為視窗第一幀
+    """
+    angles = np.atleast_2d(angles)
+    if coordinates is not None:
+        coordinates = np.asarray(coordinates).reshape(len(angles), 17, 3)
+    query = embed_frames(angles, coordinates if index['joints'] else None).astype(np.float64)
+    vectors, clip_ids = index['vectors'], index['clip_ids']
+    window = len(query)
+    N = len(vectors) - window + 1
+    if N <= 0:
+        return []
+
+    # |x - q|^2 = |x|^2 - 2 x.q + |q|^2, 視窗時把每個位移的距離加總
+    distances = np.zeros(N)
+    for offset, q in enumerate(query):
+        distances += index['squared_norms'][offset:offset + N] - 2.0 * (vectors[offset:offset + N] @ q) + q @ q
+    valid = clip_ids[:N] == clip_ids[window - 1:]   # 視窗不能跨兩段影片
+    if player is not None:
+        allowed = np.array([parse_clip_name(name)[0] == player for name in index['names']])
+        valid &= allowed[clip_ids[:N]]
+    distances[~valid] = np.inf
+
+    k = min(k, int(valid.sum()))
+    if k == 0:
+        return []
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top])]
+    matches = []
+    for i in top:
+        name = index['names'][clip_ids[i]]
+        player_name, position = parse_clip_name(name)
+        matches.append({'name': name, 'player': player_name, 'position': position,
+                        'frame': int(index['frames'][i]), 'distance': float(np.sqrt(max(distances[i], 0.0) / window))})
+    return matches
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build/update the nearest-reference index')
+    parser.add_argument('--standard-dir', default=STANDARD_DIR, type=str)
+    parser.add_argument('--index', default=INDEX_PATH, type=str)
+    parser.add_argument('--joints', action='store_true', default=None,
+                        help='also embed normalized joint positions (default: keep the existing index setting)')
+    parser.add_argument('--no-joints', dest='joints', action='store_false', help='angles only')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    t = time.perf_counter()
+    index, recomputed = build_index(args.standard_dir, args.index, args.joints)
+    print('{} clips ({} recomputed), {} frames, {} dims in {:.2f}s -> {}'.format(
+        len(index['names']), recomputed, *index['vectors'].shape, time.perf_counter() - t, args.index))
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import warnings
+
+import numpy as np
+'''
+骨架正規化: 讓不同身材、不同拍攝角度的影片可以直接比較角度
+
+VideoPose3D 輸出的是相機座標 (x 右, y 下, z 往前), 鏡頭稍微歪一點、打者站的方向不同,
+grade.calculate_angle 的輔助點 (例如側傾角取 thorax 的 x/y 與 hip 的 z) 就會算出不同的角度
+
+    1. root-center: 每一幀減掉 hip(0)
+    2. 縮放: 整段影片四肢 (大腿、小腿、上臂、前臂) 長度的中位數縮放成 LIMB_LENGTH
+    3. 旋轉: 由預備動作 (前 STANCE_FRAMES 幀) 的髖與肩算出打者座標系, 整段影片用同一個旋轉
+       -y 軸 = hip 中點往肩膀中點的方向, x 軸 = 右髖往左髖 (扣掉與 -y 平行的分量), z = x × y
+       這跟側拍時打者的相機座標一樣, 所以角度的範圍與原本差不多; 因為整段只用一個旋轉,
+       揮棒時的髖旋轉、肩旋轉、身體傾斜都還在, 只是以預備動作為基準
+
+所有函式都吃 (..., T, 17, 3), 整段 (或整批) 一次算完, 沒有逐幀迴圈
+
+沒偵測到人的幀 (全為 0 或 NaN) 不算進中位數; 整段都沒有可用的四肢長度時不縮放 (scale = limb_length),
+預備動作的髖、肩都不能用 (或兩個軸平行) 時不旋轉 (單位矩陣), 不會讓整段變成 NaN
+'''
+STANCE_FRAMES = 15
+LIMB_LENGTH = 0.34   # standard/ 裡四肢長度的中位數, 正規化後的單位跟原本的座標差不多
+LIMBS = [(1, 2), (2, 3), (4, 5), (5, 6), (11, 12), (12, 13), (14, 15), (15, 16)]
+
+_LIMBS = np.array(LIMBS)
+
+
+def _unit(v):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def _nanmedian(x, axis):
+    """np.nanmedian, 整列都是 NaN 時安靜地回傳 NaN"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmedian(x, axis=axis)
+
+
+def root_center(coordinates):
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    return coordinates - coordinates[..., :1, :]
+
+
+def limb_scale(coordinates):
+    """(..., T, 17, 3) -> (...,) 四肢平均長度在整段影片的中位數; 長度為 0 或 NaN 的幀不算, 都不能用時為 NaN"""
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    lengths = np.linalg.norm(coordinates[..., _LIMBS[:, 0], :] - coordinates[..., _LIMBS[:, 1], :], axis=-1).mean(axis=-1)
+    return _nanmedian(np.where(lengths > 0, lengths, np.nan), axis=-1)
+
+
+def canonical_rotation(coordinates, stance_frames=STANCE_FRAMES):
+    """(..., T, 17, 3) -> (..., 3, 3), 每一列是打者座標系的一個軸 (以相機座標表示); 算不出來時為單位矩陣"""
+    stance = np.asarray(coordinates, dtype=np.float64)[..., :stance_frames, :, :]
+    hips = stance[..., 0, :]
+    shoulders = (stance[..., 11, :] + stance[..., 14, :]) / 2
+    up = _unit(_nanmedian(_unit(shoulders - hips), axis=-2))
+    across = _nanmedian(_unit(stance[..., 4, :] - stance[..., 1, :]), axis=-2)
+    x = _unit(across - np.sum(across * up, axis=-1, keepdims=True) * up)
+    y = -up
+    rotation = np.stack([x, y, np.cross(x, y)], axis=-2)
+    degenerate = ~np.isfinite(rotation).all(axis=(-2, -1))
+    rotation[degenerate] = np.eye(3)
+    return rotation
+
+
+def normalize_clip(coordinates, stance_frames=STANCE_FRAMES, limb_length=LIMB_LENGTH):
+    """
+    (..., T, 17, 3) -> (正規化後的 float32 座標, transform)
+    transform 為 {'scale': (...,), 'rotation': (..., 3, 3)}; 原座標 = (normalized * scale / limb_length) @ rotation + hip
+    """
+    centered = root_center(coordinates)
+    scale = limb_scale(centered)
+    scale = np.where(np.isfinite(scale), scale, limb_length)
+    rotation = canonical_rotation(centered, stance_frames)
+    ratio = (limb_length / scale)[..., None, None, None]
+    normalized = np.einsum('...ij,...tkj->...tki', rotation, centered) * ratio
+    return normalized.astype(np.float32), {'scale': scale, 'rotation': rotation}
+
+
+def plot_limits(*frames, margin=0.05, step=0.1):
+    """
+    report/grade 畫骨架用的座標軸範圍 (正方體的半邊長), 取代寫死的 ±0.5
+    frames 為任意多個 (..., 17, 3), 取所有關節離 hip 最遠的距離, 往上取到 step 的倍數
+    """
+    extent = max(np.nanmax(np.abs(root_center(frame))) for frame in frames)
+    if not np.isfinite(extent):
+        return 0.5
+    return float(np.ceil((extent + margin) / step) * step)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Root-center, scale and rotate a 3D pose clip into the batter frame')
+    parser.add_argument('input', help='(T, 17, 3) .npy')
+    parser.add_argument('--output', default=None, type=str, help='output .npy (default: <input>_normalized.npy)')
+    parser.add_argument('--stance-frames', default=STANCE_FRAMES, type=int)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    normalized, transform = normalize_clip(np.load(args.input), args.stance_frames)
+    output = args.output or os.path.splitext(args.input)[0] + '_normalized.npy'
+    np.save(output, normalized)
+    print(json.dumps({'scale': float(transform['scale']), 'rotation': transform['rotation'].round(4).tolist()}))
+    print('-> {}'.format(output))
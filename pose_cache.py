@@ -0,0 +1,206 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from pose_clip import read_clip, sha256_file, write_clip
+from profiling import profiled
+'''
+影片 -> 2D 關鍵點 -> 3D 骨架的快取, 以內容定址: 同一支影片(不論檔名/路徑)配同樣的設定就直接讀結果
+
+    key = sha256(影片內容的 sha256 + 階段 + 設定)
+      2d: Detectron2 的 --cfg、分數門檻、抽幀/裁切/追蹤參數
+      3d: 2d 的 key + VideoPose3D 的 checkpoint, 存在 .npz 的 metadata['cache_key'] 裡串起兩個階段
+
+cache_dir/
+    <key>.pose     每個結果一個 pose_clip 檔 (2d: boxes/keypoints, 3d: coordinates)
+    hashes.json    影片路徑 -> (大小, 修改時間, sha256), 沒改過的影片不用重新算 hash
+    stats.json     累計的 hit / miss
+
+LRU: 讀到時更新檔案的修改時間, 超過 max_bytes 時從最舊的刪起
+'''
+CACHE_DIR = os.environ.get('SWING_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+MAX_BYTES = 2 << 30   # 2 GB
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+class PoseCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def video_hash(self, video):
+        """影片內容的 sha256, 以 (大小, 修改時間) 判斷要不要重算"""
+        path = os.path.abspath(video)
+        stat = os.stat(path)
+        hashes_path = os.path.join(self.cache_dir, 'hashes.json')
+        hashes = _read_json(hashes_path, {})
+        size, mtime, digest = hashes.get(path, (None, None, None))
+        if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+            digest = sha256_file(path)
+            hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            _write_json(hashes_path, hashes)
+        return digest
+
+    def key(self, video_hash, stage, **config):
+        encoded = json.dumps({'video': video_hash, 'stage': stage, 'config': config}, sort_keys=True)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.pose')
+
+    @profiled('cache.get')
+    def get(self, key):
+        """回傳 pose_clip.read_clip 的結果, 沒有時回傳 None; 同時記錄 hit / miss"""
+        path = self.path(key)
+        try:
+            clip = read_clip(path)
+            os.utime(path)   # LRU: 最近用過
+        except (FileNotFoundError, ValueError):
+            clip = None
+        self._count('hits' if clip is not None else 'misses')
+        return clip
+
+    @profiled('cache.put')
+    def put(self, key, arrays, **header):
+        write_clip(self.path(key), arrays, **dict(header, cache_key=key))
+        self.evict()
+        return self.path(key)
+
+    def entries(self):
+        """[(路徑, 大小, 最後使用時間)], 由舊到新"""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pose')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:   # 其他 process 剛好刪掉
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, max_bytes=None):
+        """從最久沒用的開始刪, 直到總大小不超過 max_bytes; 回傳刪掉幾個"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count('evictions', evicted)
+        return evicted
+
+    def stats(self):
+        stats = _read_json(os.path.join(self.cache_dir, 'stats.json'), {})
+        entries = self.entries()
+        hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': stats.get('evictions', 0),
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+        _write_json(os.path.join(self.cache_dir, 'stats.json'), {})
+
+    def _count(self, name, n=1):
+        # 多個 process 同時寫時可能少算幾次, 統計用途可以接受
+        stats_path = os.path.join(self.cache_dir, 'stats.json')
+        stats = _read_json(stats_path, {})
+        stats[name] = stats.get(name, 0) + n
+        _write_json(stats_path, stats)
+
+
+def key_3d(cache, npz_metadata, checkpoint):
+    """3D 的 key 由 2D 的 key(infer_video_new 寫在 .npz metadata 裡)與 VideoPose3D 的 checkpoint 組成"""
+    if 'cache_key' not in npz_metadata or 'video_sha256' not in npz_metadata:
+        raise KeyError('the .npz was not written with --cache, no cache_key in its metadata')
+    params = {'detections': npz_metadata['cache_key'], 'checkpoint': checkpoint}
+    if 'smoothing' in npz_metadata:   # --smooth 過的 2D 會得到不同的 3D
+        params['smoothing'] = npz_metadata['smoothing']['method']
+    return cache.key(npz_metadata['video_sha256'], '3d', **params)
+
+
+def print_stats(stats):
+    print('{entries} entries, {mb:.1f} / {max_mb:.0f} MB, {hits} hits, {misses} misses ({rate:.1%} hit rate), {evictions} evicted'.format(
+        mb=stats['bytes'] / 2**20, max_mb=stats['max_bytes'] / 2**20, rate=stats['hit_rate'], **stats))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pose pipeline cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, type=str)
+    parser.add_argument('--max-size', default=MAX_BYTES >> 20, type=int, help='cache size limit in MB')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help='entries, size and hit/miss counts')
+    subparsers.add_parser('clear', help='remove all cached results')
+    subparsers.add_parser('evict', help='evict least recently used entries down to --max-size')
+    put_3d = subparsers.add_parser('put-3d', help='store VideoPose3D output for a .npz written with --cache')
+    put_3d.add_argument('npz')
+    put_3d.add_argument('npy', help='VideoPose3D output (T, 17, 3)')
+    put_3d.add_argument('--checkpoint', required=True, type=str)
+    get_3d = subparsers.add_parser('get-3d', help='write cached 3D coordinates to an .npy; exits 1 on a miss')
+    get_3d.add_argument('npz')
+    get_3d.add_argument('--checkpoint', required=True, type=str)
+    get_3d.add_argument('--output', required=True, type=str)
+    return parser.parse_args()
+
+
+def main(args):
+    cache = PoseCache(args.cache_dir, args.max_size << 20)
+    if args.command == 'stats':
+        print_stats(cache.stats())
+    elif args.command == 'clear':
+        cache.clear()
+    elif args.command == 'evict':
+        print('evicted {} entries'.format(cache.evict()))
+    else:
+        metadata = np.load(args.npz, allow_pickle=True)['metadata'].item()
+        key = key_3d(cache, metadata, args.checkpoint)
+        if args.command == 'put-3d':
+            coordinates = np.load(args.npy).astype(np.float32)
+            print(cache.put(key, {'coordinates': coordinates}, kind='3d', fps=metadata.get('fps'),
+                            video_sha256=metadata['video_sha256'], checkpoint=args.checkpoint))
+        else:
+            clip = cache.get(key)
+            if clip is None:
+                print('miss')
+                sys.exit(1)
+            np.save(args.output, np.asarray(clip['coordinates']))
+            print('hit -> {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from profiling import profiled
+'''
+單一檔案的骨架影片格式 (.pose), 取代沒有 metadata 的 .npy 與需要 allow_pickle 的 dtype=object .npz
+
+    0    b'POSECLIP'            magic
+    8    uint32 version, uint32 header 長度 (little endian)
+    16   header (JSON, utf-8): fps、解析度、關節順序、原始影片的 sha256、關鍵幀、每個 array 的 dtype/shape/offset
+    ...  各 array 依序存放, 每個都對齊 64 bytes, 固定 shape 的 float32 / float16
+
+3D: coordinates (T, 17, 3), joints 為 h36m 順序
+2D: boxes (T, 5) x1, y1, x2, y2, score 與 keypoints (T, 4, 17) x, y, logit, prob (Detectron1 格式), joints 為 coco 順序
+
+讀取用 np.memmap, 只切需要的幀不會讀整個檔案, 也不經過 pickle
+'''
+MAGIC = b'POSECLIP'
+VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct('<8sII')
+
+H36M_JOINTS = [
+    'hip', 'right hip', 'right knee', 'right foot', 'left hip', 'left knee', 'left foot', 'spine', 'thorax',
+    'neck', 'head', 'left shoulder', 'left elbow', 'left wrist', 'right shoulder', 'right elbow', 'right wrist',
+]
+COCO_JOINTS = [
+    'nose', 'left eye', 'right eye', 'left ear', 'right ear', 'left shoulder', 'right shoulder', 'left elbow',
+    'right elbow', 'left wrist', 'right wrist', 'left hip', 'right hip', 'left knee', 'right knee', 'left ankle', 'right ankle',
+]
+DTYPES = ('float32', 'float16')
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def sha256_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@profiled('serialize.pose')
+def write_clip(path, arrays, **header):
+    """
+    arrays: {名稱: (T, ...) array}, 第一維都是幀數; header 的其他欄位(fps, w, h, joints, key_frames...)原樣存進 JSON
+    先寫到暫存檔再 rename, 中斷時不會留下寫一半的檔案
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    lengths = {len(array) for array in arrays.values()}
+    if len(lengths) > 1:
+        raise ValueError('arrays have different frame counts: {}'.format(sorted(lengths)))
+    specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        if array.dtype.name not in DTYPES:
+            raise ValueError('{}: dtype must be one of {}, got {}'.format(name, DTYPES, array.dtype))
+        specs[name] = {'dtype': array.dtype.name, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = dict(header, version=VERSION, frames=lengths.pop() if lengths else 0, arrays=specs)
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = _align(_PREFIX.size + len(encoded))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + specs[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def _unpack_prefix(prefix, name):
+    """回傳 header 長度"""
+    if len(prefix) < _PREFIX.size:
+        raise ValueError('{} is not a pose clip'.format(name))
+    magic, version, header_length = _PREFIX.unpack(prefix[:_PREFIX.size])
+    if magic != MAGIC:
+        raise ValueError('{} is not a pose clip'.format(name))
+    if version > VERSION:
+        raise ValueError('{}: unsupported version {}'.format(name, version))
+    return header_length
+
+
+def read_header(path):
+    """回傳 (header, 資料區的起點)"""
+    with open(path, 'rb') as f:
+        header_length = _unpack_prefix(f.read(_PREFIX.size), path)
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    return header, _align(_PREFIX.size + header_length)
+
+
+def read_clip(path, mmap=True):
+    """回傳 {'header': dict, 名稱: array}; mmap=True 時 array 是唯讀的 np.memmap, 切片才會真的讀檔"""
+    header, data_start = read_header(path)
+    clip = {'header': header}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        if mmap and np.prod(shape) > 0:
+            clip[name] = np.memmap(path, dtype=spec['dtype'], mode='r', offset=data_start + spec['offset'], shape=shape)
+        else:
+            clip[name] = np.fromfile(path, dtype=spec['dtype'], count=int(np.prod(shape)),
+                                     offset=data_start + spec['offset']).reshape(shape)
+    return clip
+
+
+def parse_clip(buffer):
+    """記憶體裡的 .pose 內容(例如 HTTP 上傳的 bytes) -> 同 read_clip 的 dict, array 是 buffer 的唯讀 view"""
+    header_length = _unpack_prefix(bytes(buffer[:_PREFIX.size]), '<buffer>')
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_length]).decode('utf-8'))
+    data_start = _align(_PREFIX.size + header_length)
+    clip = {'header': header}
+    for name, spec in header['arrays'].items():
+        shape = tuple(spec['shape'])
+        clip[name] = np.frombuffer(buffer, dtype=spec['dtype'], count=int(np.prod(shape)),
+                                   offset=data_start + spec['offset']).reshape(shape)
+    return clip
+
+
+def read_frames(path, name, start, stop):
+    """只讀 [start, stop) 這幾幀, 不建立 mmap"""
+    header, data_start = read_header(path)
+    spec = header['arrays'][name]
+    shape = spec['shape']
+    start, stop, _ = slice(start, stop).indices(shape[0])
+    frame_size = int(np.prod(shape[1:]))
+    itemsize = np.dtype(spec['dtype']).itemsize
+    return np.fromfile(path, dtype=spec['dtype'], count=max(0, stop - start) * frame_size,
+                       offset=data_start + spec['offset'] + start * frame_size * itemsize).reshape([-1] + shape[1:])
+
+
+@profiled('load_3d')
+def load_coordinates(path):
+    """使用者的 3D 骨架: .pose 回傳 (coordinates mmap, header), .npy 回傳 (array, {})"""
+    if path.endswith('.pose'):
+        clip = read_clip(path)
+        return clip['coordinates'], clip['header']
+    return np.load(path), {}
+
+
+def from_npy(npy_path, out_path, fps=30, dtype='float32', video=None, key_frames=None):
+    """VideoPose3D 輸出的 (T, 17, 3) .npy -> .pose; key_frames 為 {名稱: 0-based 幀}"""
+    coordinates = np.load(npy_path).astype(dtype)
+    header = {'kind': '3d', 'fps': fps, 'joints': H36M_JOINTS, 'key_frames': key_frames or {}}
+    if video is not None:
+        header['source_video_sha256'] = sha256_file(video)
+    write_clip(out_path, {'coordinates': coordinates}, **header)
+
+
+def from_npz(npz_path, out_path, dtype='float32', video=None):
+    """infer_video_new 輸出的 dtype=object .npz -> .pose (boxes, keypoints); 沒偵測到人的幀全為 0"""
+    data = np.load(npz_path, allow_pickle=True)   # 舊格式只能這樣讀
+    frames = len(data['keypoints'])
+    boxes = np.zeros((frames, 5), dtype=dtype)
+    keypoints = np.zeros((frames, 4, 17), dtype=dtype)
+    for i, (cls_boxes, cls_keyps) in enumerate(zip(data['boxes'], data['keypoints'])):
+        bbox, kps = np.asarray(cls_boxes[1]), np.asarray(cls_keyps[1])
+        if bbox.size == 5 and kps.size == 4 * 17 and kps.shape[-2:] == (4, 17):
+            boxes[i] = bbox.reshape(5)
+            keypoints[i] = kps.reshape(4, 17)
+    metadata = data['metadata'].item()
+    header = dict(metadata, kind='2d', joints=COCO_JOINTS)
+    if video is not None:
+        header['source_video_sha256'] = sha256_file(video)
+    write_clip(out_path, {'boxes': boxes, 'keypoints': keypoints}, **header)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert .npy / object .npz pose files to .pose clips')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='.npy (3D) or .npz (2D detections) -> .pose')
+    convert.add_argument('inputs', nargs='+')
+    convert.add_argument('--output-dir', default=None, type=str, help='default: next to each input')
+    convert.add_argument('--fps', default=30, type=float, help='fps for .npy input (default: 30)')
+    convert.add_argument('--float16', action='store_true', help='store arrays as float16')
+    convert.add_argument('--video', default=None, type=str, help='source video, hashed into the header')
+    convert.add_argument('--key-frame', default=None, type=int, help='contact frame (1-based) for .npy input')
+    info = subparsers.add_parser('info', help='print the header of .pose files')
+    info.add_argument('inputs', nargs='+')
+    return parser.parse_args()
+
+
+def main(args):
+    if args.command == 'info':
+        for path in args.inputs:
+            header, _ = read_header(path)
+            print(path, json.dumps(header, indent=1))
+        return
+
+    from reference import STANDARD_FRAME_NUM
+    dtype = 'float16' if args.float16 else 'float32'
+    for path in args.inputs:
+        name, ext = os.path.splitext(os.path.basename(path))
+        out_path = os.path.join(args.output_dir or os.path.dirname(path), name + '.pose')
+        if ext == '.npz':
+            from_npz(path, out_path, dtype, args.video)
+        else:
+            # 標準影片沿用 reference 裡手動標記的關鍵幀
+            frame_num = args.key_frame if args.key_frame is not None else STANDARD_FRAME_NUM.get(name)
+            key_frames = {'contact': frame_num - 1} if frame_num is not None else {}
+            from_npy(path, out_path, args.fps, dtype, args.video, key_frames)
+        print('{} -> {} ({} bytes)'.format(path, out_path, os.path.getsize(out_path)))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
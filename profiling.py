@@ -0,0 +1,233 @@
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+'''
+各階段的計時 (span) 與計數 (counter), 不用每次加 print 就能看出一整批的時間花在哪裡
+
+    with span('decode'): ...               一段時間; 同一個 thread 裡可以巢狀, Chrome trace 裡會疊在一起
+    record('detect.inference', t0, t1)      已經有 perf_counter 的地方直接記, 不用多量一次
+    @profiled('angles')                     整個函式
+    count('frames', n)                      累加的計數, trace 裡是隨時間變化的曲線
+
+平常是關閉的: span() 回傳同一個什麼都不做的 context manager, record()/count() 第一行就 return,
+一次不到 0.5 µs (python -m benchmarks.bench_profiling); 以 PROFILER.enable() 或各程式的 --profile 打開
+一直跑下去的程式 (live.py) 以 PROFILER.enable(max_events=N) 只留最近 N 個 span 與 N 個 counter 事件, 記憶體固定,
+表與 trace 只涵蓋最後這一段
+
+結束時 (finish_profile) write_trace 存成 Chrome trace JSON (chrome://tracing 或 https://ui.perfetto.dev 開啟, 每個 process/thread 一列),
+print_summary 印出每個 span 的次數、總時間、平均、最大值與佔整段 wall time 的比例 (巢狀的 span 會重複計算)
+ProcessPoolExecutor 的 worker 各自記錄, 以 export() 隨結果傳回主程序再 merge() (batch_grade.py)
+
+    python profiling.py profile.json        之後再看某次的表
+'''
+PROFILE_PATH = 'profile.json'   # --profile 沒給路徑時
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'start')
+
+    def __init__(self, profiler, name, args):
+        self.profiler, self.name, self.args = profiler, name, args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter(), **self.args)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        """時間都是 time.perf_counter() (Linux 上是 CLOCK_MONOTONIC, 不同 process 之間可以比較)"""
+        self.enabled = False
+        self.max_events = None           # None 為全部保留
+        self.events = deque()            # (名稱, 開始, 結束, pid, tid, args)
+        self.counters = deque()          # (名稱, 時間, 這個 process 的累計值, pid)
+        self.threads = {}                # (pid, tid) -> thread 名稱
+        self.totals = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def enable(self, max_events=None):
+        """max_events: 只留最近這麼多個 span 與 counter 事件 (舊的自動丟掉), None 為全部"""
+        self.max_events = max_events
+        self.events = deque(self.events, maxlen=max_events)
+        self.counters = deque(self.counters, maxlen=max_events)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events, self.counters = deque(maxlen=self.max_events), deque(maxlen=self.max_events)
+        self.threads = {}
+        self.totals = defaultdict(float)
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, **args):
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        key = (os.getpid(), thread.ident)
+        if key not in self.threads:
+            self.threads[key] = thread.name
+        self.events.append((name, start, end, key[0], key[1], args))
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.totals[name] += value
+            self.counters.append((name, time.perf_counter(), self.totals[name], os.getpid()))
+
+    def export(self, drain=True):
+        """給 worker 傳回主程序 (pickle 得起來的 dict); drain 時清掉自己的紀錄, 下一個工作不會重複送"""
+        state = {'events': self.events, 'counters': self.counters, 'threads': self.threads}
+        if drain:
+            self.clear()
+        return state
+
+    def merge(self, state):
+        if state:
+            self.events.extend(state['events'])
+            self.counters.extend(state['counters'])
+            self.threads.update(state['threads'])
+
+    def trace(self):
+        """Chrome trace (JSON Object Format) 的 dict, 時間從第一個事件算起, 單位 µs"""
+        times = [event[1] for event in self.events] + [counter[1] for counter in self.counters]
+        origin = min(times) if times else 0.0
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for (pid, tid), name in self.threads.items()]
+        events += [{'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': round((start - origin) * 1e6, 3),
+                    'dur': round((end - start) * 1e6, 3), 'pid': pid, 'tid': tid, 'args': args}
+                   for name, start, end, pid, tid, args in self.events]
+        events += [{'name': name, 'ph': 'C', 'ts': round((t - origin) * 1e6, 3), 'pid': pid, 'args': {name: total}}
+                   for name, t, total, pid in self.counters]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+PROFILER = Profiler()
+
+
+def span(name, **args):
+    """with span('render'): ... ; 關閉時不量時間"""
+    if not PROFILER.enabled:
+        return _NULL_SPAN
+    return _Span(PROFILER, name, args)
+
+
+def record(name, start, end, **args):
+    PROFILER.record(name, start, end, **args)
+
+
+def count(name, value=1):
+    PROFILER.count(name, value)
+
+
+def profiled(name):
+    """整個函式當作一個 span; 關閉時只多一次判斷"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.record(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+def summarize(events):
+    """
+    Chrome trace 的事件 -> (每個 span 一列的 list (依總時間排序), {counter: 最後的值 (各 process 加總)}, wall time 秒)
+    每列: name, calls, total (s), mean / p50 / max (ms), share (佔第一個事件到最後一個事件的比例)
+    """
+    durations = defaultdict(list)
+    counters = defaultdict(dict)
+    first, last = np.inf, -np.inf
+    for event in events:
+        if event['ph'] == 'X':
+            durations[event['name']].append(event['dur'])
+            first, last = min(first, event['ts']), max(last, event['ts'] + event['dur'])
+        elif event['ph'] == 'C':
+            counters[event['name']][event['pid']] = event['args'][event['name']]
+    wall = max(last - first, 1e-9)
+    rows = []
+    for name, values in durations.items():
+        values = np.asarray(values) / 1e3
+        rows.append({'name': name, 'calls': len(values), 'total': values.sum() / 1e3, 'mean': values.mean(),
+                     'p50': float(np.median(values)), 'max': values.max(), 'share': values.sum() * 1e3 / wall})
+    rows.sort(key=lambda row: -row['total'])
+    return rows, {name: sum(values.values()) for name, values in counters.items()}, wall / 1e6
+
+
+def print_summary(events):
+    rows, counters, wall = summarize(events)
+    if not rows and not counters:
+        return
+    print('{:<24}{:>8}{:>11}{:>11}{:>11}{:>11}{:>8}'.format('span', 'calls', 'total s', 'mean ms', 'p50 ms', 'max ms', 'wall'))
+    for row in rows:
+        print('{:<24}{:>8}{:>11.3f}{:>11.3f}{:>11.3f}{:>11.3f}{:>8.1%}'.format(
+            row['name'], row['calls'], row['total'], row['mean'], row['p50'], row['max'], row['share']))
+    for name, value in sorted(counters.items()):
+        print('{:<24}{:>8g}'.format(name, value))
+    print('wall time {:.3f}s, first to last span (nested spans are counted in both, parallel workers can add up past 100%)'.format(wall))
+
+
+def write_trace(path):
+    with open(path, 'w') as f:
+        json.dump(PROFILER.trace(), f, default=str)
+
+
+def finish_profile(path):
+    """--profile 的程式結束時: 印出表、存 Chrome trace"""
+    if not PROFILER.enabled:
+        return
+    print_summary(PROFILER.trace()['traceEvents'])
+    if path:
+        write_trace(path)
+        print('trace -> {} (chrome://tracing or ui.perfetto.dev)'.format(path))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Summary table of a --profile Chrome trace')
+    parser.add_argument('trace', nargs='?', default=PROFILE_PATH)
+    return parser.parse_args()
+
+
+def main(args):
+    with open(args.trace) as f:
+        print_summary(json.load(f)['traceEvents'])
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from angles import calculate_angles, NUM_ANGLES
+from keyframe import detect_key_frame
+from normalize import normalize_clip
+'''
+標準骨架資料庫: 把 standard/*.npy 全部接成一個連續的檔案, 角度與關鍵幀事先算好
+
+library_dir/
+    coordinates.npy   (總幀數, 17, 3) float32, 所有影片依序接在一起
+    angles.npy        (總幀數, 12)    float64, 每一幀的 12 個角度
+    normalized.npy    (總幀數, 17, 3) float32, normalize.normalize_clip 之後的座標 (打者座標系、四肢長度一致)
+    normalized_angles.npy (總幀數, 12) float64, 正規化座標的角度
+    manifest.json     每段影片的 player、position、offset、length、key_frame, 以及正規化用的 scale、rotation,
+                      與來源 .npy 的大小、修改時間 (size、mtime)
+
+評分時用 mmap 開啟, 查詢只是切一段 view, 不會讀整個檔案也不會複製,
+所以啟動時間不會隨著標準球員變多而增加
+standard/ 的影片新增、修改或刪除時 (與 manifest 的 size、mtime 不符) load_library 會重建;
+重建寫在旁邊的暫存目錄, 完成後才 os.replace 換上去, 中途失敗或同時讀取都不會看到寫一半的資料庫;
+重建時持有旁邊的 library_dir.lock (flock), 同時發現過期的幾個 process 只有一個會重建, 其他的等它完成後直接開啟
+'''
+STANDARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standard')
+LIBRARY_DIR = os.path.join(STANDARD_DIR, 'library')
+PLAYERS = {1: 'ohtani', 2: 'judge'}   # grade.py 的 standard 編號
+LIBRARY_VERSION = 3                   # 2: 加上 normalized*.npy, 3: 記錄來源影片的 size、mtime; 舊版的資料庫開啟時會重建
+
+# 手動標記的實際偵數(從 1 開始), 有標記的影片以標記為準, 其他的用 keyframe 自動偵測
+STANDARD_FRAME_NUM = {
+    'ohtani_1': 90, 'ohtani_2': 159, 'ohtani_3': 257, 'ohtani_4': 127, 'ohtani_5': 251,
+    'ohtani_6': 189, 'ohtani_7': 135, 'ohtani_8': 256, 'ohtani_9': 149,
+    'judge_1': 139, 'judge_2': 340, 'judge_3': 76, 'judge_4': 272, 'judge_5': 116,
+    'judge_6': 290, 'judge_7': 80, 'judge_8': 53, 'judge_9': 35,
+}
+
+
+def parse_clip_name(name):
+    """'ohtani_5' -> ('ohtani', 5); 不是九宮格位置的影片(例如 ohtani_angels) position 為 None"""
+    player, _, suffix = name.partition('_')
+    position = int(suffix) if suffix.isdigit() and 1 <= int(suffix) <= 9 else None
+    return player, position
+
+
+def clip_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def standard_signatures(standard_dir=STANDARD_DIR):
+    """{影片名稱: (size, mtime)}"""
+    return {os.path.splitext(os.path.basename(path))[0]: clip_signature(path)
+            for path in sorted(glob.glob(os.path.join(standard_dir, '*.npy')))}
+
+
+@contextlib.contextmanager
+def library_lock(library_dir):
+    """重建 library_dir 時的互斥鎖; 鎖檔在同一層 (library_dir 本身會被換掉)"""
+    library_dir = os.path.abspath(library_dir)
+    os.makedirs(os.path.dirname(library_dir), exist_ok=True)
+    with open(library_dir + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_library(standard_dir=STANDARD_DIR, library_dir=LIBRARY_DIR):
+    """
+    把 standard_dir 裡所有 .npy 打包成 library_dir, 回傳 manifest
+    先寫到同一層的暫存目錄, 再整個換掉 library_dir; library_dir 裡其他的檔案 (nearest_index.npz) 會搬過去
+    """
+    with library_lock(library_dir):
+        return _build_library(standard_dir, library_dir)
+
+
+def _build_library(standard_dir, library_dir):
+    """build_library 本體, 呼叫端要持有 library_lock"""
+    paths = sorted(glob.glob(os.path.join(standard_dir, '*.npy')))
+    if not paths:
+        raise FileNotFoundError('no .npy clips in {}'.format(standard_dir))
+    library_dir = os.path.abspath(library_dir)
+    os.makedirs(os.path.dirname(library_dir), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.library-', dir=os.path.dirname(library_dir))
+    try:
+        manifest = _write_library(paths, staging)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging, 0o755 & ~umask)   # mkdtemp 是 0700, 換上去之後其他帳號 (serve.py 等) 要能讀
+        if os.path.isdir(library_dir):
+            for name in os.listdir(library_dir):
+                if not os.path.exists(os.path.join(staging, name)):
+                    os.replace(os.path.join(library_dir, name), os.path.join(staging, name))
+            # 目錄不能直接蓋過非空的目錄: 舊的先移開, 已經 mmap 開啟舊檔案的 process 不受影響
+            retired = staging + '.old'
+            os.replace(library_dir, retired)
+            os.replace(staging, library_dir)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, library_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _write_library(paths, library_dir):
+    clips = [np.load(path) for path in paths]
+    total = sum(len(clip) for clip in clips)
+
+    coordinates = np.lib.format.open_memmap(os.path.join(library_dir, 'coordinates.npy'), mode='w+',
+                                            dtype=np.float32, shape=(total, 17, 3))
+    angles = np.lib.format.open_memmap(os.path.join(library_dir, 'angles.npy'), mode='w+',
+                                       dtype=np.float64, shape=(total, NUM_ANGLES))
+    normalized = np.lib.format.open_memmap(os.path.join(library_dir, 'normalized.npy'), mode='w+',
+                                           dtype=np.float32, shape=(total, 17, 3))
+    normalized_angles = np.lib.format.open_memmap(os.path.join(library_dir, 'normalized_angles.npy'), mode='w+',
+                                                  dtype=np.float64, shape=(total, NUM_ANGLES))
+    entries = []
+    offset = 0
+    for path, clip in zip(paths, clips):
+        name = os.path.splitext(os.path.basename(path))[0]
+        size, mtime = clip_signature(path)
+        player, position = parse_clip_name(name)
+        clip_angles = calculate_angles(clip)
+        if name in STANDARD_FRAME_NUM:
+            key_frame, source = STANDARD_FRAME_NUM[name] - 1, 'labelled'
+        else:
+            key_frame, _ = detect_key_frame(clip, clip_angles)
+            source = 'detected'
+        clip_normalized, transform = normalize_clip(clip)
+        coordinates[offset:offset + len(clip)] = clip
+        angles[offset:offset + len(clip)] = clip_angles
+        normalized[offset:offset + len(clip)] = clip_normalized
+        normalized_angles[offset:offset + len(clip)] = calculate_angles(clip_normalized)
+        entries.append({'name': name, 'player': player, 'position': position, 'offset': offset,
+                        'length': len(clip), 'key_frame': key_frame, 'key_frame_source': source,
+                        'scale': float(transform['scale']), 'rotation': transform['rotation'].tolist(),
+                        'size': size, 'mtime': mtime})
+        offset += len(clip)
+    for array in (coordinates, angles, normalized, normalized_angles):
+        array.flush()
+    del coordinates, angles, normalized, normalized_angles
+
+    manifest = {'version': LIBRARY_VERSION, 'frames': total, 'clips': entries}
+    with open(os.path.join(library_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def read_manifest(library_dir, standard_dir=STANDARD_DIR):
+    """library_dir 的 manifest; 不存在、版本不同或與 standard_dir 的影片對不上 (過期) 時回傳 None"""
+    manifest_path = os.path.join(library_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != LIBRARY_VERSION:
+        return None
+    if os.path.isdir(standard_dir) and standard_signatures(standard_dir) != {
+            entry['name']: (entry['size'], entry['mtime']) for entry in manifest['clips']}:
+        return None
+    return manifest
+
+
+def load_library(library_dir=LIBRARY_DIR, build=True, standard_dir=STANDARD_DIR):
+    """
+    以 mmap 開啟資料庫; 不存在、版本不同或與 standard_dir 的影片對不上時, build=True 就先重建
+    standard_dir 不存在 (只部署了 library_dir) 時不檢查
+    """
+    manifest = read_manifest(library_dir, standard_dir)
+    if manifest is None:
+        if not build:
+            raise FileNotFoundError('{} missing, not version {} or out of date with {}'.format(
+                os.path.join(library_dir, 'manifest.json'), LIBRARY_VERSION, standard_dir))
+        with library_lock(library_dir):
+            # 等鎖的時候別的 process 可能已經重建好了
+            manifest = read_manifest(library_dir, standard_dir) or _build_library(standard_dir, library_dir)
+    return {
+        'coordinates': np.load(os.path.join(library_dir, 'coordinates.npy'), mmap_mode='r'),
+        'angles': np.load(os.path.join(library_dir, 'angles.npy'), mmap_mode='r'),
+        'normalized': np.load(os.path.join(library_dir, 'normalized.npy'), mmap_mode='r'),
+        'normalized_angles': np.load(os.path.join(library_dir, 'normalized_angles.npy'), mmap_mode='r'),
+        'clips': {entry['name']: entry for entry in manifest['clips']},
+        'index': {(entry['player'], entry['position']): entry['name']
+                  for entry in manifest['clips'] if entry['position'] is not None},
+    }
+
+
+def get_clip(library, name, normalized=False):
+    """依影片名稱取出 (coordinates, angles, key_frame), 兩個 array 都是 mmap 的 view; normalized 時取正規化過的"""
+    entry = library['clips'][name]
+    frames = slice(entry['offset'], entry['offset'] + entry['length'])
+    if normalized:
+        return library['normalized'][frames], library['normalized_angles'][frames], entry['key_frame']
+    return library['coordinates'][frames], library['angles'][frames], entry['key_frame']
+
+
+def get_reference(library, player, position, normalized=False):
+    """依 (player, position) 取出標準骨架, player 可以是 'ohtani'/'judge' 或 grade.py 的 1/2"""
+    player = PLAYERS.get(player, player)
+    return get_clip(library, library['index'][(player, position)], normalized)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build the reference library from standard/*.npy')
+    parser.add_argument('--standard-dir', default=STANDARD_DIR, type=str)
+    parser.add_argument('--library-dir', default=LIBRARY_DIR, type=str)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    manifest = build_library(args.standard_dir, args.library_dir)
+    print('{} clips, {} frames -> {}'.format(len(manifest['clips']), manifest['frames'], args.library_dir))
@@ -0,0 +1,223 @@
+import io
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+from matplotlib.font_manager import FontProperties
+from matplotlib.gridspec import GridSpec
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from angles import ANGLE_NAMES
+from normalize import plot_limits
+from profiling import profiled
+'''
+不需要螢幕的評分報告: 取代 grade.draw_frame_double
+
+版面(兩個 3D 骨架、標題、成績、12 行評語)在建構時只建立一次, 之後每份報告只更新資料
+(骨架用 _offsets3d / set_segments, 文字用 set_text / set_color), 再用 Agg 輸出成 PNG 或 SVG bytes;
+直接建立 Figure + FigureCanvasAgg, 不經過 pyplot, 所以 headless 的 worker 也能跑
+
+PNG 用 blitting: 座標軸、格線、刻度這些不會變的部分只在建構時畫一次存起來,
+每份報告只把背景貼回去再畫會變的 artists; SVG 是向量圖, 每次都完整輸出
+'''
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '123.ttf')
+PLAYER_NAMES = {1: 'Shohei Ohtani', 2: 'Aaron Judge'}
+
+# 骨架連接關係, 17 以後是畫角度用的輔助點
+SKELETON = [
+    (0, 1), (1, 2), (2, 3),          # hip to right foot
+    (0, 4), (4, 5), (5, 6),          # hip to left foot
+    (0, 7), (7, 8), (8, 9), (9, 10), # hip to head
+    (8, 11), (11, 12), (12, 13),     # thorax to left wrist
+    (8, 14), (14, 15), (15, 16),     # thorax to right wrist
+    (1, 17), (14, 18),               # hip rotation and shoulder rotation 輔助 line
+    (0, 19), (0, 20)                 # body angle 輔助 line
+]
+# 輔助點: 每個軸分別取自哪個關節 (x, y, z), 與 angles.ANGLE_TABLE 的 C 相同
+AUXILIARY = [
+    (1, 4, 4),     # 17: x of right hip(1), y and z of left hip(4)            -> 髖旋轉
+    (14, 11, 11),  # 18: x of right shoulder(14), y and z of left shoulder(11) -> 肩旋轉
+    (8, 8, 0),     # 19: z of hip(0), x and y of thorax                        -> 身體向本壘倒
+    (0, 8, 8),     # 20: x of hip(0), y and z of thorax                        -> 身體前後倒
+]
+# 身體關節點黑色, 輔助點與輔助線金色
+COLORS = ['black'] * 17 + ['gold'] * len(AUXILIARY)
+BONE_COLORS = ['b'] * (len(SKELETON) - len(AUXILIARY)) + ['gold'] * len(AUXILIARY)
+
+# (最低分, 顏色, 評語), 由上往下找第一個符合的
+GRADE_REMARKS = [
+    (90, 'green', "Why not consider joining the professional baseball draft?"),
+    (75, 'black', "I think there’s still room for improvement."),
+    (60, 'orange', "It doesn’t seem to be that great."),
+    (-np.inf, 'red', "You might not be suited for playing baseball…"),
+]
+
+_SKELETON = np.array(SKELETON)
+_AUXILIARY = np.array(AUXILIARY)
+
+
+def skeleton_points(frame_coordinates):
+    """(17, 3) 相機座標 -> 加上輔助點的 (21, 3) 繪圖座標 (x, z, -y), 讓 y 軸朝上"""
+    frame_coordinates = np.asarray(frame_coordinates, dtype=np.float64)
+    auxiliary = frame_coordinates[_AUXILIARY, np.arange(3)]
+    points = np.concatenate([frame_coordinates, auxiliary])
+    return np.stack([points[:, 0], points[:, 2], -points[:, 1]], axis=1)
+
+
+def set_limits(ax, limit):
+    ax.set_xlim([-limit, limit])
+    ax.set_ylim([-limit, limit])
+    ax.set_zlim([-limit, limit])
+
+
+def add_skeleton_axes(figure, subplot_spec, title, limit=0.5):
+    """建立畫骨架用的 3D 座標軸(範圍 ±limit, 見 normalize.plot_limits), 回傳空的 (scatter, bones), 之後用 set_skeleton 更新"""
+    ax = figure.add_subplot(subplot_spec, projection='3d')
+    ax.set_title(title)
+    set_limits(ax, limit)
+    ax.set_xlabel('X axis')
+    ax.set_ylabel('Y axis')
+    ax.set_zlabel('Z axis')
+    ax.set_box_aspect([1, 1, 1])
+    empty = np.zeros((len(COLORS), 3))
+    scatter = ax.scatter(empty[:, 0], empty[:, 1], empty[:, 2], c=COLORS, marker='o', depthshade=False)
+    bones = Line3DCollection(np.zeros((len(SKELETON), 2, 3)), colors=BONE_COLORS)
+    ax.add_collection3d(bones)
+    return scatter, bones
+
+
+def set_skeleton(scatter, bones, frame_coordinates):
+    points = skeleton_points(frame_coordinates)
+    scatter._offsets3d = (points[:, 0], points[:, 1], points[:, 2])
+    bones.set_segments(points[_SKELETON])
+
+
+def blit(canvas, background, artists):
+    """把背景貼回去, 只畫 artists (set_animated(True) 的那些), 回傳 canvas 的 RGBA buffer"""
+    canvas.restore_region(background)
+    for artist in artists:
+        if hasattr(artist, 'do_3d_projection'):
+            artist.do_3d_projection()   # 視角固定, 用背景畫好時算出的投影矩陣
+        canvas.figure.draw_artist(artist)
+    return np.asarray(canvas.buffer_rgba())
+
+
+def grade_remark(grade_point):
+    for minimum, color, remark in GRADE_REMARKS:
+        if grade_point >= minimum:
+            return color, remark
+
+
+def comment_lines(comments):
+    """grade() 的 for_comments -> [(角度名稱, 評語, 顏色)], 依 delta_theta 的正負寫比標準大或小"""
+    lines = []
+    for name, comment in zip(ANGLE_NAMES, comments):
+        delta_theta = comment['delta_theta']
+        if delta_theta == 0:
+            lines.append((name, "Perfect.", 'green'))
+            continue
+        direction = 'smaller' if delta_theta > 0 else 'bigger'
+        lines.append((name, "{}  ==>  {:.1f} degree {} than Standard.".format(
+            comment['comment'].strip(), abs(delta_theta), direction), comment['color']))
+    return lines
+
+
+class ReportRenderer:
+    def __init__(self, figsize=(14.5, 7.3), dpi=100, font_path=FONT_PATH):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.font = FontProperties(fname=font_path) if os.path.exists(font_path) else FontProperties()
+        gs = GridSpec(3, 2, figure=self.figure)
+
+        self.limit = 0.5
+        self.scatters, self.bones, self.frame_texts = [], [], []
+        for column, (title, text_x) in enumerate((("STANDARD", 0.38), ("YOU", 0.82))):
+            scatter, bones = add_skeleton_axes(self.figure, gs[0:2, column], title)
+            self.scatters.append(scatter)
+            self.bones.append(bones)
+            self.frame_texts.append(self.figure.text(text_x, 0.85, "", fontsize=12, color='black'))
+
+        self.title = self.figure.suptitle("", fontsize=16)
+        self.grade_text = self.figure.text(0.405, 0.35, "", fontsize=16, fontproperties=self.font)
+        self.remark_text = self.figure.text(0.385, 0.31, "", fontsize=16, fontproperties=self.font)
+
+        # 評語區: 左右兩欄各 6 行, 每行分成角度名稱與評語兩個 text, 不用空白對齊
+        text_ax = self.figure.add_subplot(gs[2, :])
+        text_ax.axis('off')
+        text_ax.text(0.0, 0.9, "Comment", fontsize=16, fontproperties=self.font)
+        self.comment_texts = []
+        rows = (len(ANGLE_NAMES) + 1) // 2
+        for i in range(len(ANGLE_NAMES)):
+            x, y = 0.56 * (i // rows), 0.75 - 0.14 * (i % rows)
+            label = text_ax.text(x, y, "", fontsize=13, fontproperties=self.font)
+            comment = text_ax.text(x + 0.13, y, "", fontsize=13, fontproperties=self.font)
+            self.comment_texts.append((label, comment))
+        self.figure.tight_layout(rect=(0, 0, 1, 0.96))   # 留位置給 suptitle
+        self.figure.set_layout_engine('none')   # 版面固定了, savefig 時不用再多畫一次算版面
+
+        # 會變的 artists 設成 animated, 一般的 draw 不會畫到, 先畫出只有背景的畫面存起來
+        self.dynamic = self.bones + self.scatters + self.frame_texts + [self.title, self.grade_text, self.remark_text]
+        self.dynamic += [text for row in self.comment_texts for text in row]
+        for artist in self.dynamic:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def set_limit(self, limit):
+        """座標軸範圍是背景的一部分, 改變時重畫背景; plot_limits 以 0.1 為單位, 很少會變"""
+        if limit == self.limit:
+            return
+        self.limit = limit
+        for scatter in self.scatters:
+            set_limits(scatter.axes, limit)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def update(self, coordinates_1, frame_index_1, coordinates_2, frame_index_2, grade_point, comments, standard, position):
+        """參數與 grade.draw_frame_double 相同, 只更新資料不重建 artists"""
+        self.set_limit(plot_limits(coordinates_1[frame_index_1], coordinates_2[frame_index_2]))
+        for scatter, bones, frame_text, coordinates, frame_index in zip(
+                self.scatters, self.bones, self.frame_texts, (coordinates_1, coordinates_2), (frame_index_1, frame_index_2)):
+            set_skeleton(scatter, bones, coordinates[frame_index])
+            frame_text.set_text("frame : {}".format(frame_index + 1))   # 實際偵數
+
+        self.title.set_text("Swing Comparison: Your Swing vs. {} at position {}".format(
+            PLAYER_NAMES.get(standard, standard), position))
+        color, remark = grade_remark(grade_point)
+        self.grade_text.set_text("Grade : {:.3f}".format(grade_point))
+        self.remark_text.set_text(remark)
+        for text in (self.grade_text, self.remark_text):
+            text.set_color(color)
+        for (label, comment), (name, line, color) in zip(self.comment_texts, comment_lines(comments)):
+            label.set_text(name)
+            comment.set_text(": " + line)
+            label.set_color(color)
+            comment.set_color(color)
+
+    def draw_png(self, compress_level=1):
+        """背景貼回去, 只畫會變的 artists; compress_level 1 的檔案稍大, 但壓縮比預設的 6 快很多"""
+        image = blit(self.canvas, self.background, self.dynamic)
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format='png', compress_level=compress_level)
+        return buffer.getvalue()
+
+    def to_bytes(self, format='png'):
+        if format == 'png':
+            return self.draw_png()
+        for artist in self.dynamic:
+            artist.set_animated(False)
+        try:
+            buffer = io.BytesIO()
+            self.figure.savefig(buffer, format=format)
+        finally:
+            for artist in self.dynamic:
+                artist.set_animated(True)
+        return buffer.getvalue()
+
+    @profiled('render')
+    def render(self, *args, format='png'):
+        """update + to_bytes, 回傳 PNG/SVG 的 bytes"""
+        self.update(*args)
+        return self.to_bytes(format)
@@ -0,0 +1,248 @@
+import argparse
+import csv
+import functools
+import json
+import os
+
+import numpy as np
+
+from angles import ANGLE_NAMES, NUM_ANGLES
+'''
+評分規則 (rubric): 角度差 -> 每個角度的相似度 (kernel) -> 加權平均的 grade, 以及每個角度的評語等級
+
+規則是一個 dict (可以存成 JSON, 沒寫的欄位用 DEFAULT_RUBRIC):
+    kernel      gaussian: 100 exp(-(Δ/w)^2)   laplace: 100 exp(-|Δ|/w)   cauchy: 100 / (1 + (Δ/w)^2)
+                linear: 100 max(0, 1 - |Δ|/w)
+    width       w, 一個數字或 12 個角度各一個
+    weights     12 個角度的權重, 不用加總為 1
+    levels      評語等級, 由好到壞
+    thresholds  {群組: 由高到低的相似度門檻}, 相似度 > 第 i 個門檻就是第 i 級, 都不到是最後一級
+    groups      12 個角度各屬於哪個群組 (上半身角度容易大, 門檻較寬鬆)
+width、weights、groups 也可以寫成 {角度名稱 (angles.ANGLE_NAMES): 值}, 沒寫的角度用 DEFAULT_RUBRIC;
+不認得的欄位、角度名稱或群組在載入時就以 ValueError 指出是哪一個
+
+Rubric.score 一次評 (..., 12) 的角度差, 整批歷史資料重評只是一次矩陣運算;
+calibrate 由人工評分過的紀錄擬合權重 (限制在非負且加總為 1 的單體上的最小平方法), 可以順便從候選的 width 裡挑最好的
+
+    python scoring.py show                                      # 印出目前的規則, 改完存成 JSON
+    python scoring.py score grades.jsonl --rubric new.json      # 用新規則重評 batch_grade.py 的輸出
+    python scoring.py calibrate grades.jsonl --labels labels.csv --output fitted.json [--widths 15 20 25 30]
+    python scoring.py rescore --rubric new.json                 # 重評 analytics 資料庫裡所有紀錄
+'''
+DEFAULT_RUBRIC = {
+    'kernel': 'gaussian',
+    'width': 20,
+    # 右肩、右肘、左肩、左肘、右髖、左髖、右膝、左膝、髖旋轉、肩旋轉、側傾角度、後仰角度
+    'weights': [6, 10, 6, 10, 3, 3, 6, 6, 7, 7, 8, 8],
+    'levels': [
+        {'comment': 'VERY GOOD', 'color': 'green'},
+        {'comment': 'GOOD', 'color': 'black'},
+        {'comment': 'OK', 'color': 'black'},
+        {'comment': 'NOT GOOD', 'color': 'orange'},
+        {'comment': 'BAD', 'color': 'red'},
+    ],
+    'thresholds': {'upper': [92, 82, 72, 60], 'lower': [95, 90, 85, 75]},
+    'groups': ['upper'] * 4 + ['lower'] * 8,
+}
+
+KERNELS = {
+    'gaussian': lambda delta, width: 100 * np.exp(-(delta / width) ** 2),
+    'laplace': lambda delta, width: 100 * np.exp(-np.abs(delta) / width),
+    'cauchy': lambda delta, width: 100 / (1 + (delta / width) ** 2),
+    'linear': lambda delta, width: 100 * np.maximum(0, 1 - np.abs(delta) / width),
+}
+
+
+def _per_angle(config, key):
+    """config[key] 為每個角度一個值的 list (width 也可以是一個數字), 或 {角度名稱: 值}"""
+    value = config[key]
+    if not isinstance(value, dict):
+        return value
+    unknown = sorted(set(value) - set(ANGLE_NAMES))
+    if unknown:
+        raise ValueError('{}: unknown angle {} (expected one of {})'.format(
+            key, ', '.join(map(repr, unknown)), ', '.join(ANGLE_NAMES)))
+    default = DEFAULT_RUBRIC[key] if isinstance(DEFAULT_RUBRIC[key], list) else [DEFAULT_RUBRIC[key]] * NUM_ANGLES
+    return [value.get(name, default[i]) for i, name in enumerate(ANGLE_NAMES)]
+
+
+class Rubric:
+    def __init__(self, config=None):
+        config = config or {}
+        unknown = sorted(set(config) - set(DEFAULT_RUBRIC))
+        if unknown:
+            raise ValueError('unknown rubric key {} (expected one of {})'.format(
+                ', '.join(map(repr, unknown)), ', '.join(DEFAULT_RUBRIC)))
+        config = dict(DEFAULT_RUBRIC, **config)
+        config.update({key: _per_angle(config, key) for key in ('width', 'weights', 'groups')})
+        if config['kernel'] not in KERNELS:
+            raise ValueError('kernel must be one of {}'.format(sorted(KERNELS)))
+        for i, level in enumerate(config['levels']):
+            missing = [key for key in ('comment', 'color') if key not in level]
+            if missing:
+                raise ValueError('levels[{}] is missing {}'.format(i, ', '.join(map(repr, missing))))
+        if len(config['groups']) != NUM_ANGLES:
+            raise ValueError('groups must name a group for each of the {} angles'.format(NUM_ANGLES))
+        unknown = sorted(set(config['groups']) - set(config['thresholds']))
+        if unknown:
+            raise ValueError('groups: unknown group {} (thresholds has {})'.format(
+                ', '.join(map(repr, unknown)), ', '.join(map(repr, config['thresholds']))))
+        self.config = config
+        self.kernel = KERNELS[config['kernel']]
+        self.width = np.broadcast_to(np.asarray(config['width'], dtype=np.float64), (NUM_ANGLES,))
+        weights = np.asarray(config['weights'], dtype=np.float64)
+        if weights.shape != (NUM_ANGLES,) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError('weights must be {} non-negative numbers'.format(NUM_ANGLES))
+        self.weights = weights / weights.sum()
+        self.thresholds = np.array([config['thresholds'][group] for group in config['groups']], dtype=np.float64)
+        if self.thresholds.shape != (NUM_ANGLES, len(config['levels']) - 1):
+            raise ValueError('every group needs {} thresholds'.format(len(config['levels']) - 1))
+
+    def similarities(self, deltas):
+        """(..., 12) 的角度差 (度) -> (..., 12) 的相似度 (0~100)"""
+        return self.kernel(np.asarray(deltas, dtype=np.float64), self.width)
+
+    def score(self, deltas):
+        """
+        (..., 12) 的角度差 -> {'similarities': (..., 12), 'similarity': (...,) 平均相似度,
+                               'grade': (...,) 加權平均, 'levels': (..., 12) 評語等級的 index}
+        """
+        similarities = self.similarities(deltas)
+        return {
+            'similarities': similarities,
+            'similarity': similarities.mean(axis=-1),
+            'grade': similarities @ self.weights,
+            'levels': (similarities[..., None] <= self.thresholds).sum(axis=-1),
+        }
+
+    def comments(self, deltas, levels):
+        """單次評分 (12,) -> grade.grade 的 for_comments 格式"""
+        return [{'comment': self.config['levels'][level]['comment'], 'delta_theta': float(delta),
+                 'color': self.config['levels'][level]['color']} for delta, level in zip(deltas, levels)]
+
+
+@functools.lru_cache(maxsize=16)
+def load_rubric(path=None):
+    """path 為 JSON 檔, None 時為 DEFAULT_RUBRIC; 同一個檔案只讀一次"""
+    if path is None:
+        return Rubric()
+    with open(path) as f:
+        return Rubric(json.load(f))
+
+
+def result_deltas(results):
+    """batch_grade / analytics 的結果 dict (有 comments) -> (N, 12) 的角度差"""
+    return np.array([[comment['delta_theta'] for comment in result['comments']] for result in results], dtype=np.float64)
+
+
+def project_simplex(v):
+    """把 v 投影到 {w >= 0, sum(w) = 1} (Duchi et al. 2008)"""
+    u = np.sort(v)[::-1]
+    cumulative = np.cumsum(u) - 1
+    rho = np.nonzero(u - cumulative / np.arange(1, len(v) + 1) > 0)[0][-1]
+    return np.maximum(v - cumulative[rho] / (rho + 1), 0)
+
+
+def fit_weights(similarities, labels, iterations=2000):
+    """min ||S w - y||^2, w 在單體上; projected gradient, 步長 1 / S^T S 的最大特徵值"""
+    gram = similarities.T @ similarities
+    target = similarities.T @ labels
+    step = 1 / np.linalg.eigvalsh(gram)[-1]
+    weights = np.full(similarities.shape[1], 1 / similarities.shape[1])
+    for _ in range(iterations):
+        weights = project_simplex(weights - step * (gram @ weights - target))
+    return weights
+
+
+def calibrate(deltas, labels, rubric=None, widths=None):
+    """
+    由人工評分 labels (N,) 擬合權重 (和 width, 有給候選 widths 時), 回傳 (新的規則 dict, 擬合前後的誤差)
+    門檻與評語等級沿用原本的規則
+    """
+    rubric = rubric or Rubric()
+    deltas, labels = np.asarray(deltas, dtype=np.float64), np.asarray(labels, dtype=np.float64)
+    rmse = lambda grades: float(np.sqrt(np.mean((grades - labels) ** 2)))
+    best = None
+    for width in (widths or [rubric.config['width']]):
+        candidate = Rubric(dict(rubric.config, width=width))
+        similarities = candidate.similarities(deltas)
+        weights = fit_weights(similarities, labels)
+        error = rmse(similarities @ weights)
+        if best is None or error < best[0]:
+            best = (error, width, weights)
+    error, width, weights = best
+    config = dict(rubric.config, width=width, weights=[round(float(w) * 100, 3) for w in weights])
+    grades = Rubric(config).score(deltas)['grade']
+    return config, {'sessions': len(labels), 'rmse_before': rmse(rubric.score(deltas)['grade']), 'rmse_after': rmse(grades),
+                    'correlation': float(np.corrcoef(grades, labels)[0, 1])}
+
+
+def read_results(path):
+    """batch_grade.py 的 .jsonl 輸出, 只留評分成功的"""
+    with open(path) as f:
+        return [result for result in map(json.loads, filter(str.strip, f)) if 'error' not in result and 'comments' in result]
+
+
+def read_labels(path):
+    """CSV / JSONL, 每一列 file、label (人工給的 0~100 分) -> {檔名: label}"""
+    with open(path, newline='') as f:
+        rows = [json.loads(line) for line in f if line.strip()] if path.endswith('.jsonl') else list(csv.DictReader(f))
+    return {os.path.basename(row['file']): float(row['label']) for row in rows}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scoring rubric tools')
+    parser.add_argument('--rubric', default=None, type=str, help='rubric JSON (default: the built-in rubric)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('show', help='print the rubric as JSON')
+    score = subparsers.add_parser('score', help='re-score batch_grade.py .jsonl results with --rubric')
+    score.add_argument('results')
+    score.add_argument('--output', default=None, type=str, help='write the re-scored .jsonl here')
+    fit = subparsers.add_parser('calibrate', help='fit weights (and width) to hand-labelled sessions')
+    fit.add_argument('results', help='batch_grade.py .jsonl; rows may carry a "label" field')
+    fit.add_argument('--labels', default=None, type=str, help='CSV / JSONL with file, label')
+    fit.add_argument('--widths', default=None, type=float, nargs='+', help='kernel widths to try')
+    fit.add_argument('--output', default='rubric.json', type=str)
+    rescore = subparsers.add_parser('rescore', help='re-score every session in the analytics store with --rubric')
+    rescore.add_argument('--db', default=None, type=str)
+    return parser.parse_args()
+
+
+def main(args):
+    rubric = load_rubric(args.rubric)
+    if args.command == 'show':
+        print(json.dumps(rubric.config, indent=1))
+    elif args.command == 'score':
+        results = read_results(args.results)
+        deltas = result_deltas(results)
+        scores = rubric.score(deltas)
+        for result, delta, similarity, grade_point, levels in zip(
+                results, deltas, scores['similarity'], scores['grade'], scores['levels']):
+            print('{:<40}{:>10.3f} -> {:.3f}'.format(os.path.basename(result['file']), result['grade'], grade_point))
+            result.update(similarity=float(similarity), grade=float(grade_point), comments=rubric.comments(delta, levels))
+        if args.output:
+            with open(args.output, 'w') as f:
+                for result in results:
+                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    elif args.command == 'calibrate':
+        results = read_results(args.results)
+        labels = read_labels(args.labels) if args.labels else {}
+        labelled = [(result, labels.get(os.path.basename(result['file']), result.get('label'))) for result in results]
+        labelled = [(result, label) for result, label in labelled if label is not None]
+        if len(labelled) < NUM_ANGLES:
+            raise SystemExit('need at least {} labelled sessions, got {}'.format(NUM_ANGLES, len(labelled)))
+        config, metrics = calibrate(result_deltas([result for result, _ in labelled]), [label for _, label in labelled],
+                                    rubric, args.widths)
+        with open(args.output, 'w') as f:
+            json.dump(config, f, indent=1)
+        print(json.dumps(metrics))
+        print('width {} weights {} -> {}'.format(config['width'], config['weights'], args.output))
+    else:
+        from analytics import ANALYTICS_PATH, AnalyticsStore
+        with AnalyticsStore(args.db or ANALYTICS_PATH) as store:
+            print('re-scored {} sessions'.format(store.rescore(rubric)))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
@@ -0,0 +1,130 @@
+import numpy as np
+
+from grade import ANGLE_WEIGHTS, grade
+from profiling import profiled
+from scoring import load_rubric
+'''
+整段揮棒的比較: 用 DTW 把使用者的角度序列對齊到標準的角度序列, 不再只看單一幀
+
+只取關鍵幀(擊球)前後一段揮棒視窗做對齊, 影片裡的慢動作重播不會混進來.
+DTW 只算對角線附近 band 寬度內的格子(Sakoe-Chiba band), 每一列用 cumsum +
+minimum.accumulate 一次算完, 成本是 O(T * band); 只要某一列的最小值已經超過
+abandon, 後面不可能更好, 直接放棄(early abandoning). batch_grade.py --best-match --sequence
+依序比對幾個候選標準影片, 以目前最小的平均成本 (dtw_distance, 總成本 / path 長度) 當下一個候選的 abandon;
+關鍵幀靠近影片頭尾的候選視窗會被切短, 總成本自然比較小, 所以排序與 abandon 都用平均成本
+'''
+# 揮棒階段, 以標準影片的關鍵幀為 0 的幀數範圍 [start, end), 以 30 fps 估計
+PHASES = [
+    ("load",           -60, -35),
+    ("stride",         -35, -15),
+    ("launch",         -15,  -3),
+    ("contact",         -3,   3),
+    ("follow-through",   3,  31),
+]
+SWING_BEFORE = -PHASES[0][1]   # 關鍵幀前取幾幀
+SWING_AFTER = PHASES[-1][2]    # 關鍵幀後取幾幀(含關鍵幀)
+
+_WEIGHTS = np.asarray(ANGLE_WEIGHTS, dtype=np.float64) / np.sum(ANGLE_WEIGHTS)
+
+
+def angle_similarity(delta_theta, rubric=None):
+    """與 grade.grade 相同的評分 (rubric 的 kernel, 預設 scoring.DEFAULT_RUBRIC)"""
+    return (rubric or load_rubric()).similarities(delta_theta)
+
+
+def swing_window(angles, key_frame, before=SWING_BEFORE, after=SWING_AFTER):
+    """取出關鍵幀前後的揮棒視窗, 回傳 (視窗內的角度, 關鍵幀在視窗裡的 index)"""
+    start = max(0, key_frame - before)
+    end = min(len(angles), key_frame + after)
+    return np.asarray(angles[start:end], dtype=np.float64), key_frame - start
+
+
+def band_limits(n, m, band):
+    """第 i 列可以走的欄位 [lo, hi], 以 n x m 的對角線為中心、左右各 band 格"""
+    center = np.arange(n) * (m - 1) / max(n - 1, 1)
+    lo = np.clip(np.floor(center - band), 0, m - 1).astype(int)
+    hi = np.clip(np.ceil(center + band), 0, m - 1).astype(int)
+    lo[0], hi[-1] = 0, m - 1
+    return lo, hi
+
+
+def banded_dtw(angles_1, angles_2, band=15, abandon=np.inf):
+    """
+    對齊兩個 (T, 12) 的角度序列, 每一對幀的成本為加權平均的角度差(度)
+    回傳 (總成本, path); 被 early abandon 時回傳 (inf, None)
+    """
+    n, m = len(angles_1), len(angles_2)
+    band = max(band, abs(n - m))
+    lo, hi = band_limits(n, m, band)
+    rows = []
+    prev, prev_lo = np.array([0.0]), -1   # 虛擬的第 -1 列, 讓 (0, 0) 可以當起點
+    for i in range(n):
+        cols = np.arange(lo[i], hi[i] + 1)
+        cost = np.abs(angles_2[cols] - angles_1[i]) @ _WEIGHTS
+        # 從上一列過來: min(D[i-1, j-1], D[i-1, j])
+        diag = _lookup(prev, prev_lo, cols - 1)
+        up = _lookup(prev, prev_lo, cols)
+        from_prev = np.minimum(diag, up)
+        # 同一列往右: D[i, j] = cost[j] + min(from_prev[j], D[i, j-1])
+        cumulative = np.cumsum(cost)
+        row = cumulative + np.minimum.accumulate(from_prev - (cumulative - cost))
+        if row.min() > abandon:
+            return np.inf, None
+        rows.append(row)
+        prev, prev_lo = row, lo[i]
+    return rows[-1][-1], _backtrack(rows, lo)
+
+
+def _lookup(row, row_lo, cols):
+    """取 row 在 cols 的值, 超出 band 的部分是 inf"""
+    index = cols - row_lo
+    valid = (index >= 0) & (index < len(row))
+    values = np.full(len(cols), np.inf)
+    values[valid] = row[index[valid]]
+    return values
+
+
+def _backtrack(rows, lo):
+    i, j = len(rows) - 1, len(rows[-1]) - 1 + lo[-1]
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        candidates = []
+        if i > 0:
+            candidates.append((_lookup(rows[i - 1], lo[i - 1], np.array([j - 1]))[0] if j > 0 else np.inf, i - 1, j - 1))
+            candidates.append((_lookup(rows[i - 1], lo[i - 1], np.array([j]))[0], i - 1, j))
+        if j > lo[i]:
+            candidates.append((rows[i][j - 1 - lo[i]], i, j - 1))
+        _, i, j = min(candidates)
+        path.append((i, j))
+    return np.array(path[::-1])
+
+
+@profiled('score.sequence')
+def grade_sequence(angles_1, key_frame_1, angles_2, key_frame_2, band=15, abandon=np.inf, rubric=None):
+    """
+    angles_1/key_frame_1 為標準, angles_2/key_frame_2 為使用者, 都是整段影片的 (T, 12) 角度
+    回傳 dict: 原本單幀的 similarity/grade, DTW 對齊後整段的 sequence_grade 與各階段的相似度,
+    dtw_distance 為每一對幀的平均成本; 超過 abandon 時 sequence_grade 為 None
+    (DTW 時以 abandon x 最長可能的 path 長度當總成本的上限, 超過就不可能比 abandon 好)
+    rubric 同 grade.grade (單幀與整段都用它的 kernel 與權重); DTW 對齊一律用預設的角度權重
+    """
+    rubric = rubric or load_rubric()
+    similarity, grade_point, comments = grade(list(angles_1[key_frame_1]), list(angles_2[key_frame_2]), rubric)
+    result = {'similarity': similarity, 'grade': grade_point, 'comments': comments}
+
+    window_1, key_1 = swing_window(angles_1, key_frame_1)
+    window_2, _ = swing_window(angles_2, key_frame_2)
+    distance, path = banded_dtw(window_1, window_2, band, abandon * (len(window_1) + len(window_2) - 1))
+    if path is None or distance / len(path) > abandon:
+        result.update(dtw_distance=np.inf if path is None else distance / len(path), sequence_grade=None, phases={})
+        return result
+
+    # 對齊後每一對幀的加權相似度, 再依標準那一邊的幀分到各階段
+    pair_similarity = angle_similarity(window_1[path[:, 0]] - window_2[path[:, 1]], rubric) @ rubric.weights
+    relative = path[:, 0] - key_1
+    phases = {}
+    for name, start, end in PHASES:
+        in_phase = (relative >= start) & (relative < end)
+        phases[name] = float(pair_similarity[in_phase].mean()) if in_phase.any() else None
+    result.update(dtw_distance=distance / len(path), sequence_grade=float(pair_similarity.mean()), phases=phases)
+    return result
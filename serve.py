@@ -0,0 +1,431 @@
+import argparse
+import base64
+import collections
+import io
+import json
+import os
+import queue
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from analytics import ANALYTICS_PATH, AnalyticsStore
+from batch_grade import grade_coordinates
+from normalize import normalize_clip
+from grade_client import DEFAULT_HOST, DEFAULT_PORT
+from keypoint_store import save_npz
+from nearest import INDEX_PATH, build_index
+from pose_clip import MAGIC, parse_clip
+from reference import LIBRARY_DIR, PLAYERS, get_clip, load_library
+from report import ReportRenderer
+from smoothing import METHODS
+'''
+常駐的評分服務: reference 資料庫、報告的 renderer (以及可選的 Detectron2 predictor) 只載入一次,
+每次評分不用再付 Python 啟動、import matplotlib、建模型與開資料庫的成本
+
+    POST /grade?position=5&standard=1&frame=&report=png|svg|none&sequence=1&best_match=1
+        body: .npy 或 .pose 檔案的 bytes, 或 JSON {"coordinates": (T, 17, 3) 的 list, "position": 5, ...}
+        回傳 JSON: batch_grade 的結果欄位, report (base64), latency_ms / wait_ms
+    POST /detect?stride=2&max_size=720&motion_window=1.5    (需要 --detector)
+        body: 影片檔, 回傳 infer_video_new 格式的 .npz (給 VideoPose3D)
+    GET /stats    佇列長度、處理中、完成/失敗/拒絕數、最近 LATENCY_WINDOW 個工作的延遲 p50/p99
+    GET /health
+
+工作放進有上限的佇列, 由 --workers 個執行緒處理, 每個執行緒有自己的 ReportRenderer;
+佇列滿了直接回 503 + Retry-After, 讓 client 退避, 而不是在服務裡無限堆積
+上傳的內容在 HTTP 執行緒先解析檢查, 格式錯誤的請求不會占用佇列
+
+    python serve.py [--port 8765 | --socket /tmp/swing.sock] [--workers 1] [--queue-size 16] [--detector]
+'''
+LATENCY_WINDOW = 1000          # /stats 的百分位數用最近幾個工作
+MAX_UPLOAD = 256 << 20         # 256 MB
+STANDARDS = {player: standard for standard, player in PLAYERS.items()}   # 'ohtani' -> 1
+REPORT_FORMATS = ('png', 'svg', 'none')
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Job:
+    def __init__(self, kind, request):
+        self.kind = kind
+        self.request = request
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancelled = False      # client 等太久已經放棄, 還沒開始的話就不做
+        self.done = threading.Event()
+
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _int(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest('{} must be an integer, got {!r}'.format(name, value))
+
+
+def _float(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BadRequest('{} must be a number, got {!r}'.format(name, value))
+
+
+def parse_grade_request(body, content_type, params):
+    """上傳的骨架與參數 -> (coordinates, header, job, report 格式), job 的欄位同 batch_grade.make_jobs"""
+    try:
+        if content_type.startswith('application/json'):
+            data = json.loads(body)
+            params = dict(params, **{name: value for name, value in data.items() if name != 'coordinates'})
+            coordinates, header = np.asarray(data['coordinates'], dtype=np.float32), {}
+        elif body[:len(MAGIC)] == MAGIC:
+            clip = parse_clip(body)
+            coordinates, header = clip['coordinates'], clip['header']
+        else:
+            coordinates, header = np.load(io.BytesIO(body), allow_pickle=False), {}
+    except (KeyError, ValueError, TypeError, EOFError) as e:
+        raise BadRequest('cannot read the pose upload ({}: {})'.format(type(e).__name__, e))
+    if coordinates.ndim != 3 or coordinates.shape[1:] != (17, 3) or len(coordinates) == 0:
+        raise BadRequest('coordinates must have shape (T, 17, 3), got {}'.format(coordinates.shape))
+
+    job = {
+        'standard': _int(params, 'standard', 1),
+        'position': _int(params, 'position'),
+        'frame': _int(params, 'frame'),   # 實際偵數, 從 1 開始
+        'sequence': _flag(params.get('sequence', False)),
+        'best_match': _flag(params.get('best_match', False)),
+        'smooth': params.get('smooth') or None,
+        'normalize': _flag(params.get('normalize', False)),
+        'player': params.get('player') or None,   # --analytics 時記在這個打者底下
+    }
+    if not job['best_match']:
+        if job['standard'] not in PLAYERS:
+            raise BadRequest('standard must be one of {}'.format(sorted(PLAYERS)))
+        if job['position'] not in range(1, 10):
+            raise BadRequest('position must be 1-9')
+    if job['frame'] is not None and not 1 <= job['frame'] <= len(coordinates):
+        raise BadRequest('frame must be between 1 and {}'.format(len(coordinates)))
+    key_frames = header.get('key_frames', {})
+    if not isinstance(key_frames, dict):
+        raise BadRequest('key_frames in the .pose header must be an object, got {!r}'.format(key_frames))
+    if job['frame'] is None and 'contact' in key_frames:   # 0-based, grade_coordinates 直接拿來當 index
+        contact = key_frames['contact']
+        if not isinstance(contact, int) or not 0 <= contact < len(coordinates):
+            raise BadRequest('key_frames.contact in the .pose header must be between 0 and {}, got {!r}'.format(
+                len(coordinates) - 1, contact))
+    if job['smooth'] is not None and job['smooth'] not in METHODS:
+        raise BadRequest('smooth must be one of {}'.format(METHODS))
+    report = params.get('report', 'png')
+    if report not in REPORT_FORMATS:
+        raise BadRequest('report must be one of {}'.format(REPORT_FORMATS))
+    return coordinates, header, job, report
+
+
+def parse_detect_params(params):
+    """/detect 可以覆蓋的 infer_video_new 參數, 沒給的是 None"""
+    return {'stride': _int(params, 'stride'), 'max_size': _int(params, 'max_size'),
+            'motion_window': _float(params, 'motion_window')}
+
+
+class GradingService:
+    def __init__(self, library_dir=LIBRARY_DIR, workers=1, queue_size=16, index_path=None, detector_args=None,
+                 max_upload=MAX_UPLOAD, analytics_path=None, rubric_path=None):
+        self.library = load_library(library_dir)
+        self.index = build_index(index_path=index_path)[0] if index_path else None
+        self.detector_args = detector_args
+        self.predictor = None
+        if detector_args is not None:
+            from infer_video_new import make_predictor   # detectron2 只有 --detector 時才需要
+            self.predictor = make_predictor(detector_args)
+        self.detector_lock = threading.Lock()
+        self.max_upload = max_upload
+        self.analytics = AnalyticsStore(analytics_path) if analytics_path else None
+        self.rubric_path = rubric_path
+        self.started = time.time()
+
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)   # (wait, service, total) 秒
+        # renderer 在啟動時就建好(畫好背景), 第一個請求不用等
+        self.workers = [threading.Thread(target=self._work, args=(ReportRenderer(),), name='grade-worker-{}'.format(i),
+                                         daemon=True) for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind, request, timeout=None):
+        """放進佇列並等待完成; 佇列滿了丟出 queue.Full, 超過 timeout 丟出 TimeoutError"""
+        job = Job(kind, request)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self._count('rejected')
+            raise
+        self._count('submitted')
+        if not job.done.wait(timeout):
+            job.cancelled = True
+            self._count('timed_out')
+            raise TimeoutError('job not finished after {}s'.format(timeout))
+        return job
+
+    def _work(self, renderer):
+        handlers = {'grade': self._grade, 'detect': self._detect}
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+            job.started = time.perf_counter()
+            with self.lock:
+                self.in_flight += 1
+            try:
+                job.result = handlers[job.kind](job.request, renderer)
+            except Exception as e:
+                job.error = '{}: {}'.format(type(e).__name__, e)
+            job.finished = time.perf_counter()
+            with self.lock:
+                self.in_flight -= 1
+                self.counts['failed' if job.error else 'completed'] += 1
+                self.latencies.append((job.started - job.submitted, job.finished - job.started, job.finished - job.submitted))
+            job.done.set()
+
+    def _grade(self, request, renderer):
+        coordinates, header, job, report = request
+        job['rubric'] = self.rubric_path
+        result, comments = grade_coordinates(coordinates, header, job, self.library, self.index)
+        if self.analytics is not None:
+            self.analytics.record([dict(job, **result)])
+        if report != 'none':
+            coordinates_1 = get_clip(self.library, result['reference'], job['normalize'])[0]
+            if job['normalize']:
+                coordinates = normalize_clip(coordinates)[0]   # 報告畫的是實際比較的座標
+            entry = self.library['clips'][result['reference']]
+            image = renderer.render(coordinates_1, result['reference_frame'] - 1, coordinates, result['frame'] - 1,
+                                    result['grade'], comments, STANDARDS.get(entry['player'], entry['player']),
+                                    entry['position'], format=report)
+            result.update(report=base64.b64encode(image).decode('ascii'), report_format=report)
+        return result
+
+    def _detect(self, request, renderer):
+        from infer_video_new import make_plan, run_inference, sampling_metadata
+        data, options = request
+        args = argparse.Namespace(**vars(self.detector_args))
+        for name, value in options.items():
+            if value is not None:
+                setattr(args, name, value)
+        # ffprobe / ffmpeg 要能 seek, 先寫成暫存檔
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as video:
+            video.write(data)
+            video.flush()
+            info, plan = make_plan(video.name, args)
+            boxes, keypoints = [], []
+            with self.detector_lock:
+                for frame_i, bbox_tensor, kps in run_inference(self.predictor, video.name, args, plan=plan):
+                    boxes.append(bbox_tensor[0])
+                    keypoints.append(kps[0])
+        buffer = io.BytesIO()
+        save_npz(buffer, boxes, keypoints, sampling_metadata(info, plan))
+        return buffer.getvalue()
+
+    def stats(self):
+        with self.lock:
+            records = np.array(self.latencies).reshape(-1, 3)
+            counts = dict(self.counts)
+            in_flight = self.in_flight
+        stats = {
+            'queue_depth': self.jobs.qsize(),
+            'queue_size': self.jobs.maxsize,
+            'workers': len(self.workers),
+            'in_flight': in_flight,
+            'detector': self.predictor is not None,
+            'uptime': round(time.time() - self.started, 1),
+        }
+        for name in ('submitted', 'completed', 'failed', 'rejected', 'timed_out'):
+            stats[name] = counts.get(name, 0)
+        for column, name in enumerate(('wait_ms', 'service_ms', 'latency_ms')):
+            if len(records):
+                p50, p99 = 1000 * np.percentile(records[:, column], [50, 99])
+                stats[name] = {'p50': round(float(p50), 2), 'p99': round(float(p99), 2)}
+        return stats
+
+    def close(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.analytics is not None:
+            self.analytics.close()
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, client 可以重複使用同一條連線
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix socket 的 client_address 是空字串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False, default=lambda value: value.item()).encode('utf-8')
+        self.send_body(status, body, 'application/json', headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self.send_json(200, self.service.stats())
+        elif path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'not found: {}'.format(path)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.service.max_upload:
+            self.close_connection = True   # 沒讀的 body 還在連線上, 不能再用
+            self.send_json(413, {'error': 'upload larger than {} bytes'.format(self.service.max_upload)})
+            return
+        body = self.rfile.read(length)
+
+        try:
+            if url.path == '/grade':
+                kind, request = 'grade', parse_grade_request(body, self.headers.get('Content-Type', ''), params)
+                if request[2]['best_match'] and self.service.index is None:
+                    raise BadRequest('best_match needs the service to be started with --best-match')
+            elif url.path == '/detect':
+                if self.service.predictor is None:
+                    raise BadRequest('the service was started without --detector')
+                kind, request = 'detect', (body, parse_detect_params(params))
+            else:
+                self.send_json(404, {'error': 'not found: {}'.format(url.path)})
+                return
+        except BadRequest as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        try:
+            job = self.service.submit(kind, request, self.server.request_timeout)
+        except queue.Full:
+            self.send_json(503, {'error': 'queue full', 'queue_depth': self.service.jobs.qsize()}, {'Retry-After': '1'})
+            return
+        except TimeoutError as e:
+            self.send_json(504, {'error': str(e)})
+            return
+        if job.error:
+            self.send_json(500, {'error': job.error})
+        elif kind == 'detect':
+            self.send_body(200, job.result, 'application/octet-stream')
+        else:
+            self.send_json(200, dict(job.result, wait_ms=1000 * (job.started - job.submitted),
+                                     latency_ms=1000 * (job.finished - job.submitted)))
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):   # 上次沒有正常關閉留下的 socket
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=60, quiet=False):
+    if socket_path:
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+    server.service = service
+    server.request_timeout = timeout    # 每個請求最多等多久
+    server.quiet = quiet
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Long-running swing grading service')
+    parser.add_argument('--host', default=DEFAULT_HOST, type=str)
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int)
+    parser.add_argument('--socket', default=None, type=str, help='listen on a Unix socket instead of host/port')
+    parser.add_argument('--workers', default=1, type=int, help='jobs processed concurrently')
+    parser.add_argument('--queue-size', default=16, type=int, help='queued jobs before requests get 503')
+    parser.add_argument('--timeout', default=60, type=float, help='seconds a request waits for its job (504 after)')
+    parser.add_argument('--library-dir', default=LIBRARY_DIR, type=str)
+    parser.add_argument('--best-match', action='store_true', help='load the nearest-reference index for best_match=1')
+    parser.add_argument('--index', default=INDEX_PATH, type=str)
+    parser.add_argument('--detector', action='store_true', help='load the Detectron2 predictor and enable /detect')
+    parser.add_argument('--cfg', default='COCO-Keypoints/keypoint_rcnn_R_101_FPN_3x.yaml', type=str,
+                        help='Detectron2 config for --detector')
+    parser.add_argument('--max-upload', default=MAX_UPLOAD >> 20, type=int, help='upload size limit in MB')
+    parser.add_argument('--quiet', action='store_true', help='no per-request log lines')
+    parser.add_argument('--analytics', nargs='?', default=None, const=ANALYTICS_PATH, type=str,
+                        help='record every grade in the analytics store (analytics.py)')
+    parser.add_argument('--rubric', default=None, type=str, help='scoring rubric JSON (scoring.py, default: built-in)')
+    return parser.parse_args()
+
+
+def main(args):
+    detector_args = None
+    if args.detector:
+        from infer_video_new import parse_args as parse_infer_args
+        detector_args = parse_infer_args(['--cfg', args.cfg, '-'])
+    t = time.perf_counter()
+    service = GradingService(args.library_dir, args.workers, args.queue_size, args.index if args.best_match else None,
+                             detector_args, args.max_upload << 20, args.analytics, args.rubric)
+    server = make_server(service, args.host, args.port, args.socket, args.timeout, args.quiet)
+    print('Ready in {:.2f}s, listening on {} ({} workers, queue {})'.format(
+        time.perf_counter() - t, args.socket or 'http://{}:{}'.format(args.host, args.port), args.workers, args.queue_size))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
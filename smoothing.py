@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+'''
+關鍵點的時間平滑與補洞, 2D (Detectron1 格式) 與 3D (VideoPose3D 的 (T, 17, 3)) 共用, 整個 (T, J, C) 一次處理
+
+    1. 找出缺的關節: 2D 為沒偵測到人(框的分數 0)或關鍵點分數太低; 3D 為 NaN/inf、整幀全為 0,
+       或骨頭長度與整段的中位數差太多 (VideoPose3D 在沒偵測到人的幀會輸出變形的骨架)
+    2. fill_gaps: 每個關節在前後有效幀之間線性內插, 開頭/結尾沿用最近的有效幀, 不用逐幀迴圈
+    3. 濾波: savgol 為零相位的 Savitzky-Golay (離線用, 不會延遲); one_euro 為因果的 One-Euro filter
+       (只用過去的幀, 即時模式也能用 OneEuroFilter 一幀一幀做)
+
+沒偵測到人時 infer_video_new 寫出全 0 的框與關鍵點, 角度會除以 0 變成 NaN, 補洞後這些幀也能評分
+'''
+MIN_SCORE = 0.05      # detectron2 Visualizer 畫關鍵點的門檻
+BONE_TOLERANCE = 1.5  # 骨頭長度超過中位數 2.5 倍視為壞掉; VideoPose3D 的手臂長度本來就會隨角度差到 1.4 倍
+H36M_PARENTS = [-1, 0, 1, 2, 0, 4, 5, 0, 7, 8, 9, 8, 11, 12, 8, 14, 15]
+METHODS = ('savgol', 'one_euro', 'none')
+
+
+def missing_2d(keypoints, boxes=None, min_score=MIN_SCORE):
+    """(T, 4, 17) 的 Detectron1 關鍵點 -> (T, 17) bool, True 為缺少"""
+    keypoints = np.asarray(keypoints)
+    missing = ~(keypoints[:, 3] > min_score)   # NaN 也算缺
+    if boxes is not None:
+        missing |= ~(np.asarray(boxes)[:, 4] > 0)[:, None]
+    return missing
+
+
+def missing_3d(coordinates, bone_tolerance=BONE_TOLERANCE, parents=H36M_PARENTS):
+    """(T, J, 3) 的 3D 關節 -> (T, J) bool; 骨頭長度異常時標記子關節"""
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    missing = ~np.isfinite(coordinates).all(axis=-1)
+    missing |= (coordinates == 0).all(axis=(1, 2))[:, None]
+    children = np.array([j for j, parent in enumerate(parents) if parent >= 0])
+    lengths = np.linalg.norm(coordinates[:, children] - coordinates[:, np.array(parents)[children]], axis=-1)
+    usable = ~missing[:, children] & np.isfinite(lengths)
+    if usable.any():
+        median = np.nanmedian(np.where(usable, lengths, np.nan), axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bad = np.abs(lengths / median - 1) > bone_tolerance
+        missing[:, children] |= bad & np.isfinite(median)
+    return missing
+
+
+def fill_gaps(x, missing, max_gap=None):
+    """
+    x (T, J, C), missing (T, J) -> (補好的 x, 補上的 (T, J) mask)
+    兩個有效幀之間線性內插, 開頭/結尾複製最近的有效幀; 超過 max_gap 幀的洞與從來沒有效過的關節維持原值
+    """
+    x = np.asarray(x, dtype=np.float64)
+    T = len(x)
+    valid = ~np.asarray(missing, dtype=bool)
+    t = np.arange(T)[:, None]
+    prev = np.maximum.accumulate(np.where(valid, t, -1), axis=0)                  # 前一個有效幀, 沒有為 -1
+    next = np.minimum.accumulate(np.where(valid, t, T)[::-1], axis=0)[::-1]      # 下一個有效幀, 沒有為 T
+    has_prev, has_next = prev >= 0, next < T
+
+    before = np.take_along_axis(x, np.clip(prev, 0, T - 1)[..., None], axis=0)
+    after = np.take_along_axis(x, np.clip(next, 0, T - 1)[..., None], axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(has_prev & has_next, (t - prev) / (next - prev), np.where(has_prev, 0.0, 1.0))[..., None]
+    # 沒有前一幀時 weight 為 1 只用 after, 避免 0 * NaN
+    filled = np.where(weight < 1, before * (1 - weight), 0) + np.where(weight > 0, after * weight, 0)
+
+    fill = ~valid & (has_prev | has_next)
+    if max_gap is not None:
+        gap = np.where(has_prev & has_next, next - prev - 1, np.where(has_prev, t - prev, next - t))
+        fill &= gap <= max_gap
+    return np.where(fill[..., None], filled, x), fill
+
+
+def savgol_matrix(window, order):
+    """(window, window) 的投影矩陣: 第 i 列是用整個視窗擬合 order 次多項式後, 在第 i 個位置的值"""
+    positions = np.arange(window) - window // 2
+    V = np.vander(positions, order + 1, increasing=True).astype(np.float64)
+    return V @ np.linalg.pinv(V)
+
+
+def savgol(x, window=9, order=2):
+    """
+    沿第 0 維的 Savitzky-Golay 平滑, 零相位; 頭尾各 window // 2 幀用第一個/最後一個視窗的多項式 (同 scipy 的 mode='interp')
+    其他維度一次用矩陣乘法算完
+    """
+    x = np.asarray(x, dtype=np.float64)
+    T = len(x)
+    window = min(window, T if T % 2 else T - 1)
+    if window <= order:
+        return x.copy()
+    h = window // 2
+    P = savgol_matrix(window, order)
+    flat = x.reshape(T, -1)
+    y = np.empty_like(flat)
+    y[h:T - h] = sliding_window_view(flat, window, axis=0) @ P[h]    # (T - window + 1, N, window) @ (window,)
+    y[:h] = P[:h] @ flat[:window]
+    y[T - h:] = P[h + 1:] @ flat[T - window:]
+    return y.reshape(x.shape)
+
+
+class OneEuroFilter:
+    """
+    One-Euro filter (Casiez et al. 2012), 一次處理一幀的整個 (J, C) array
+    移動慢時截止頻率接近 min_cutoff (去抖動), 移動快時隨速度提高 (減少延遲)
+    """
+    def __init__(self, fps=30.0, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.fps = fps
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.x = None
+        self.dx = None
+
+    def _alpha(self, cutoff):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau * self.fps)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if self.x is None:
+            self.x, self.dx = x.copy(), np.zeros_like(x)
+            return self.x.copy()
+        a_d = self._alpha(self.d_cutoff)
+        self.dx = a_d * (x - self.x) * self.fps + (1 - a_d) * self.dx
+        a = self._alpha(self.min_cutoff + self.beta * np.abs(self.dx))
+        self.x = a * x + (1 - a) * self.x
+        return self.x.copy()
+
+
+def one_euro(x, fps=30.0, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+    """整段套用 OneEuroFilter, 因果的(第 t 幀只用到 0..t 幀)"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.empty_like(x)
+    f = OneEuroFilter(fps, min_cutoff, beta, d_cutoff)
+    for t in range(len(x)):
+        y[t] = f(x[t])
+    return y
+
+
+def filter_runs(x, unfilled, smooth):
+    """
+    smooth((t, j, C)) 分別套用在每一段連續可用的幀上, 補不了的幀 (unfilled (T, J)) 不進濾波也維持原值:
+    NaN 或 2D 的 0 不會被 savgol 的視窗抹到旁邊, One-Euro 的狀態也在洞之後重新開始
+    缺的樣子相同的關節 (通常是整幀沒偵測到人) 一起處理, 都沒有洞時就是整段一次
+    """
+    y = x.copy()
+    patterns, groups = np.unique(unfilled.T, axis=0, return_inverse=True)
+    for pattern, joints in zip(patterns, (np.flatnonzero(groups.ravel() == k) for k in range(len(patterns)))):
+        edges = np.flatnonzero(np.diff(np.concatenate([[True], pattern, [True]]).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            y[start:end, joints] = smooth(x[start:end, joints])
+    return y
+
+
+def repair(x, missing, method='savgol', max_gap=None, window=9, order=2, fps=30.0, min_cutoff=1.0, beta=0.05):
+    """
+    x (T, J, C) 補洞後平滑, 回傳 (float64 的結果, 報告)
+    補不了的關節(超過 max_gap 或從來沒有效過)維持原值, 濾波只在它們之間的每一段分別做, 報告裡記為 unfilled_joints
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, got {!r}'.format(METHODS, method))
+    missing = np.asarray(missing, dtype=bool)
+    filled, fill = fill_gaps(x, missing, max_gap)
+    unfilled = missing & ~fill
+    if method == 'savgol':
+        smoothed = filter_runs(filled, unfilled, lambda run: savgol(run, window, order))
+    elif method == 'one_euro':
+        smoothed = filter_runs(filled, unfilled, lambda run: one_euro(run, fps, min_cutoff, beta))
+    else:
+        smoothed = filled
+    report = {
+        'method': method,
+        'frames': int(len(missing)),
+        'missing_frames': int(missing.any(axis=1).sum()),
+        'repaired_frames': int(fill.any(axis=1).sum()),
+        'repaired_joints': int(fill.sum()),
+        'unfilled_joints': int(unfilled.sum()),
+    }
+    return smoothed, report
+
+
+def repair_keypoints_2d(keypoints, boxes=None, min_score=MIN_SCORE, **options):
+    """
+    (T, 4, 17) 的 Detectron1 關鍵點: 只處理 x, y, 分數維持原值 (補上的點分數仍低, 下游可以自行判斷)
+    回傳 (float32 的 (T, 4, 17), 報告)
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    xy, report = repair(keypoints[:, :2].transpose(0, 2, 1), missing_2d(keypoints, boxes, min_score), **options)
+    repaired = keypoints.copy()
+    repaired[:, :2] = xy.transpose(0, 2, 1)
+    return repaired, report
+
+
+def repair_coordinates(coordinates, bone_tolerance=BONE_TOLERANCE, **options):
+    """(T, 17, 3) 的 3D 骨架, 回傳 (float32 的結果, 報告)"""
+    smoothed, report = repair(coordinates, missing_3d(coordinates, bone_tolerance), **options)
+    return smoothed.astype(np.float32), report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fill gaps in and smooth 2D (.npz) or 3D (.npy / .pose) pose files')
+    parser.add_argument('input', help='infer_video_new .npz, VideoPose3D .npy or .pose')
+    parser.add_argument('--output', default=None, type=str, help='default: <name>_smooth.<ext>')
+    parser.add_argument('--method', default='savgol', choices=METHODS)
+    parser.add_argument('--window', default=9, type=int, help='savgol window (odd, frames)')
+    parser.add_argument('--order', default=2, type=int, help='savgol polynomial order')
+    parser.add_argument('--max-gap', default=None, type=int, help='longest gap to interpolate (frames)')
+    parser.add_argument('--min-score', default=MIN_SCORE, type=float, help='2D keypoint score below which a joint is missing')
+    parser.add_argument('--min-cutoff', default=1.0, type=float, help='one_euro minimum cutoff (Hz)')
+    parser.add_argument('--beta', default=0.05, type=float, help='one_euro speed coefficient')
+    return parser.parse_args()
+
+
+def main(args):
+    from keypoint_store import save_npz
+    from pose_clip import read_clip, write_clip
+    name, ext = os.path.splitext(args.input)
+    output = args.output or name + '_smooth' + ext
+    options = dict(method=args.method, max_gap=args.max_gap, window=args.window, order=args.order,
+                   min_cutoff=args.min_cutoff, beta=args.beta)
+    if ext == '.npz':
+        data = np.load(args.input, allow_pickle=True)   # infer_video_new 的舊格式
+        metadata = data['metadata'].item()
+        boxes = np.stack([np.asarray(cls_boxes[1]).reshape(5) for cls_boxes in data['boxes']])
+        keypoints = np.stack([np.asarray(cls_keyps[1]).reshape(4, 17) for cls_keyps in data['keypoints']])
+        keypoints, report = repair_keypoints_2d(keypoints, boxes, args.min_score, fps=metadata.get('fps', 30.0), **options)
+        save_npz(output, boxes, keypoints, dict(metadata, smoothing=report))
+    elif ext == '.pose':
+        clip = read_clip(args.input)
+        header = clip['header']
+        coordinates, report = repair_coordinates(clip['coordinates'], fps=header.get('fps') or 30.0, **options)
+        header = {key: value for key, value in header.items() if key not in ('version', 'frames', 'arrays')}
+        write_clip(output, {'coordinates': coordinates.astype(clip['coordinates'].dtype)}, **dict(header, smoothing=report))
+    else:
+        coordinates, report = repair_coordinates(np.load(args.input), **options)
+        np.save(output, coordinates)
+    print(json.dumps(report))
+    print('-> {}'.format(output))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
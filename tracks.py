@@ -0,0 +1,200 @@
+import argparse
+import os
+import warnings
+
+import numpy as np
+'''
+多人模式 (infer_video_new --people): 每一幀所有偵測到的人連成 track, 一次解碼 + 推論就有每個人的關鍵點
+
+    配對: 現有的 track (上一次出現的框與關鍵點) 與這一幀的 N 個偵測, 一次算出 (K, N) 的 IoU 與關鍵點距離矩陣,
+          cost = (1 - IoU) + 關鍵點距離 (除以框高); IoU >= MIN_IOU 或關鍵點距離 <= MAX_KEYPOINT_DISTANCE 才能配對,
+          cost 由小到大貪婪地配 (一幀頂多十幾個人, 不需要匈牙利法)
+    沒配到的偵測開新的 track; 超過 MAX_AGE 幀沒出現的 track 結束, 之後同一個人回來會是新的 track
+
+每個 track 輸出成與單人模式相同的逐幀格式: boxes (T, 5)、keypoints (T, 4, 17), 沒出現的幀全為 0 (分數 0)
+
+打者的 track 由 batter_scores 決定: 出現的比例、框的大小 (離鏡頭近)、離畫面中央多近、手腕的最大速度 (揮棒),
+每一項除以所有 track 裡的最大值後依 BATTER_WEIGHTS 加權; 捕手/裁判通常也大也在中間, 但不會揮棒
+'''
+MIN_IOU = 0.3                   # 與 infer_video_new.MIN_TRACK_IOU 相同
+MAX_KEYPOINT_DISTANCE = 0.25    # 17 個關鍵點的平均距離 / 框高
+MAX_AGE = 15                    # 幾幀沒配到就結束 track
+MIN_FRAMES = 5                  # 出現不到幾幀的 track 視為誤判, 不輸出
+BATTER_WEIGHTS = {'coverage': 1.0, 'size': 1.0, 'center': 0.5, 'swing': 1.5}
+WRISTS = [9, 10]                # COCO 的左右手腕
+
+
+def iou_matrix(a, b):
+    """(K, 4+) 與 (N, 4+) 的框 -> (K, N) 的 IoU"""
+    a, b = np.asarray(a, dtype=np.float64)[:, None, :4], np.asarray(b, dtype=np.float64)[None, :, :4]
+    inter = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None) * \
+        np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+def keypoint_distance(a, boxes_a, b):
+    """
+    (K, 4, 17) 與 (N, 4, 17) 的 Detectron 格式關鍵點 -> (K, N) 的平均關節距離, 以 a 的框高 (boxes_a (K, 4+)) 正規化
+    """
+    a, b = np.asarray(a, dtype=np.float64)[:, None, :2], np.asarray(b, dtype=np.float64)[None, :, :2]
+    distance = np.linalg.norm(a - b, axis=2).mean(axis=-1)
+    heights = np.asarray(boxes_a, dtype=np.float64)[:, 3] - np.asarray(boxes_a, dtype=np.float64)[:, 1]
+    return distance / np.maximum(heights, 1.0)[:, None]
+
+
+def match_cost(boxes_a, keypoints_a, boxes_b, keypoints_b, min_iou=MIN_IOU, max_distance=MAX_KEYPOINT_DISTANCE):
+    """(K, N) 的配對 cost, 不能配對的為 inf"""
+    iou = iou_matrix(boxes_a, boxes_b)
+    distance = keypoint_distance(keypoints_a, boxes_a, keypoints_b)
+    cost = (1 - iou) + distance
+    cost[(iou < min_iou) & (distance > max_distance)] = np.inf
+    return cost
+
+
+def assign(cost):
+    """cost (K, N) 由小到大貪婪配對 -> [(row, col)], 每個 row/col 最多用一次, inf 的不配"""
+    used_rows, used_cols, pairs = set(), set(), []
+    for flat in np.argsort(cost, axis=None):
+        row, col = divmod(int(flat), cost.shape[1])
+        if not np.isfinite(cost[row, col]):
+            break
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            pairs.append((row, col))
+    return pairs
+
+
+class Tracker:
+    def __init__(self, max_age=MAX_AGE, min_iou=MIN_IOU, max_distance=MAX_KEYPOINT_DISTANCE):
+        self.max_age = max_age
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.frames = 0
+        self.next_id = 0
+        self.active = []     # 進行中的 track id
+        self.last = {}       # track id -> (最後一次的框 (5,), 關鍵點 (4, 17), 幀)
+        self.history = {}    # track id -> [(幀, 框, 關鍵點)]
+
+    def update(self, boxes, keypoints):
+        """
+        一幀的所有偵測: boxes (N, 5)、keypoints (N, 4, 17), 座標系要與之前的幀相同
+        回傳每個偵測的 track id (N,)
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+        keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, 4, 17)
+        frame = self.frames
+        self.frames += 1
+        self.active = [track for track in self.active if frame - self.last[track][2] <= self.max_age]
+        ids = np.full(len(boxes), -1, dtype=np.int64)
+        if self.active and len(boxes):
+            cost = match_cost(np.stack([self.last[track][0] for track in self.active]),
+                              np.stack([self.last[track][1] for track in self.active]),
+                              boxes, keypoints, self.min_iou, self.max_distance)
+            for row, col in assign(cost):
+                ids[col] = self.active[row]
+        for col in np.nonzero(ids < 0)[0]:
+            ids[col] = self.next_id
+            self.active.append(self.next_id)
+            self.history[self.next_id] = []
+            self.next_id += 1
+        for box, kps, track in zip(boxes, keypoints, ids):
+            self.last[track] = (box, kps, frame)
+            self.history[track].append((frame, box, kps))
+        return ids
+
+    def stack(self, min_frames=MIN_FRAMES):
+        """
+        -> (track ids, boxes (K, T, 5), keypoints (K, T, 4, 17)), 依第一次出現的順序;
+        沒出現的幀全為 0, 出現不到 min_frames 幀的 track 不輸出
+        """
+        ids = [track for track, rows in self.history.items() if len(rows) >= min_frames]
+        boxes = np.zeros((len(ids), self.frames, 5), dtype=np.float32)
+        keypoints = np.zeros((len(ids), self.frames, 4, 17), dtype=np.float32)
+        for i, track in enumerate(ids):
+            frames, track_boxes, track_keypoints = zip(*self.history[track])
+            boxes[i, list(frames)] = track_boxes
+            keypoints[i, list(frames)] = track_keypoints
+        return ids, boxes, keypoints
+
+
+def batter_features(boxes, keypoints, w, h):
+    """
+    boxes (K, T, 5)、keypoints (K, T, 4, 17) -> {特徵: (K,)}, 整批一次算
+    coverage 出現的幀比例, size 框高中位數 / 畫面高, center 1 - 框中心離畫面中央的水平距離 (中位數) / 半寬,
+    swing 相鄰兩幀都出現時手腕速度 (除以框高) 的 95 百分位
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    present = boxes[..., 4] > 0
+    heights = np.where(present, boxes[..., 3] - boxes[..., 1], np.nan)
+    centers = np.where(present, (boxes[..., 0] + boxes[..., 2]) / 2, np.nan)
+    wrists = keypoints[..., :2, WRISTS]                                         # (K, T, 2, 2)
+    speed = np.linalg.norm(np.diff(wrists, axis=1), axis=2).max(axis=-1) / heights[:, 1:]
+    speed = np.where(present[:, 1:] & present[:, :-1], speed, np.nan)
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)   # 只出現一幀的 track 全為 NaN
+        features = {
+            'coverage': present.mean(axis=1),
+            'size': np.nanmedian(heights, axis=1) / h,
+            'center': 1 - np.nanmedian(np.abs(centers - w / 2), axis=1) / (w / 2),
+            'swing': np.nanpercentile(speed, 95, axis=1),
+        }
+    return {name: np.nan_to_num(np.clip(value, 0, None)) for name, value in features.items()}
+
+
+def batter_scores(boxes, keypoints, w, h, weights=None):
+    """(K,) 的打者分數, 每個特徵除以所有 track 的最大值後加權"""
+    weights = dict(BATTER_WEIGHTS, **(weights or {}))
+    features = batter_features(boxes, keypoints, w, h)
+    score = np.zeros(len(boxes))
+    for name, value in features.items():
+        top = value.max() if len(value) else 0
+        if top > 0:
+            score += weights[name] * value / top
+    return score, features
+
+
+def choose_batter(boxes, keypoints, w, h, weights=None):
+    """打者 track 的 index (不是 track id), 沒有 track 時為 None"""
+    if len(boxes) == 0:
+        return None
+    return int(np.argmax(batter_scores(boxes, keypoints, w, h, weights)[0]))
+
+
+def track_path(npz_path, track):
+    """<video>.npz -> 第 track 個 track 的 <video>.track<track>.npz"""
+    return '{}.track{}.npz'.format(os.path.splitext(npz_path)[0], track)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Tracks of an infer_video_new.py --people run')
+    parser.add_argument('npz', help='<video>.npz written by infer_video_new.py --people')
+    parser.add_argument('--batter', default=None, type=int,
+                        help='track id to use as the batter when the heuristic picked the wrong person (rewrites <video>.npz)')
+    return parser.parse_args()
+
+
+def main(args):
+    data = dict(np.load(args.npz, allow_pickle=True))
+    metadata = data['metadata'].item()
+    if 'tracks' not in metadata:
+        raise SystemExit('{} was not written with --people'.format(args.npz))
+    if args.batter is not None:
+        if args.batter not in [track['id'] for track in metadata['tracks']]:
+            raise SystemExit('no track {} in {}'.format(args.batter, args.npz))
+        data = dict(np.load(track_path(args.npz, args.batter), allow_pickle=True))
+        data['metadata'] = dict(metadata, batter=args.batter)
+        np.savez_compressed(args.npz, **data)
+        metadata = data['metadata']
+    for track in metadata['tracks']:
+        print('{} track {:>3}: {:>5} frames, batter score {:.3f}  {}'.format(
+            '*' if track['id'] == metadata['batter'] else ' ', track['id'], track['frames'], track['score'],
+            track_path(args.npz, track['id'])))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(args)
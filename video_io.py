@@ -0,0 +1,289 @@
+import asyncio
+import json
+import math
+import os
+import subprocess as sp
+
+import numpy as np
+
+from profiling import profiled, span
+'''
+影片讀取: 一次 ffprobe 取得解析度/fps/幀數, 時間區段、抽幀、裁切、縮放都交給 ffmpeg,
+pipe 裡只有真正要分析的幀
+
+60/120 fps 的手機影片通常只有揮棒前後 1.5 秒有用:
+    start_time/end_time   -ss 放在 -i 前面, 從最近的關鍵幀開始解碼, 區段外的幀不解碼
+    stride                select 濾鏡每 stride 幀留一幀, 其餘的幀不做色彩轉換也不經過 pipe
+    crop/max_size         在 ffmpeg 裡裁切/縮小, pipe 與之後 resize 的資料量跟著變小
+    motion_window         先解碼 64 px 寬的灰階小圖, 找出畫面變化最大的區段當作 start/end
+輸出的第 i 幀是原始影片的第 start_frame + i * stride 幀, 座標用 to_source 換回原始影片的像素
+
+read_live 讀攝影機或還在寫入的檔案 (live.py), 沒有長度也不能 seek, 只能一直讀到來源結束
+寫影片用 open_writer: raw 幀直接從 stdin 餵給 ffmpeg 編碼, 不經過暫存的圖檔
+probe_video_async / read_video_async / motion_window_async 是 asyncio 版本 (infer_video_new.py --decoders 的 ingest_videos 同時處理多支影片用),
+指令與解析和同步版本共用
+'''
+MOTION_WIDTH = 64   # motion_window 用的小圖寬度
+
+
+def _fraction(value):
+    """ffprobe 的 '30000/1001' -> 29.97, '0/0' -> 0"""
+    num, _, den = str(value).partition('/')
+    den = float(den or 1)
+    return float(num) / den if den else 0.0
+
+
+def probe_command(filename):
+    return ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_streams', '-show_format', '-of', 'json', filename]
+
+
+def parse_probe(output):
+    """ffprobe 的 JSON 輸出 -> {'w', 'h', 'fps', 'frames', 'duration'}"""
+    output = json.loads(output)
+    stream = output['streams'][0]
+    w, h = int(stream['width']), int(stream['height'])
+    rotation = stream.get('tags', {}).get('rotate', 0)
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    if int(float(rotation)) % 180 != 0:   # 手機直拍, ffmpeg 解碼時會自動轉正
+        w, h = h, w
+    fps = _fraction(stream.get('avg_frame_rate', '0/0')) or _fraction(stream.get('r_frame_rate', '0/0'))
+    duration = float(stream.get('duration') or output.get('format', {}).get('duration') or 0)
+    if str(stream.get('nb_frames', '0')).isdigit() and int(stream.get('nb_frames', 0)) > 0:
+        frames = int(stream['nb_frames'])
+    else:
+        frames = int(round(duration * fps))
+    return {'w': w, 'h': h, 'fps': fps, 'frames': frames, 'duration': duration}
+
+
+def probe_video(filename):
+    """一次 ffprobe: 回傳 {'w', 'h', 'fps', 'frames', 'duration'}, w/h 為轉正後(實際解碼出來)的大小"""
+    return parse_probe(sp.run(probe_command(filename), stdout=sp.PIPE, check=True).stdout)
+
+
+async def _run_async(command):
+    """asyncio 版的 sp.run(check=True), 回傳 stdout"""
+    process = await asyncio.create_subprocess_exec(*command, stdout=sp.PIPE)
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        raise sp.CalledProcessError(process.returncode, command)
+    return stdout
+
+
+async def probe_video_async(filename):
+    return parse_probe(await _run_async(probe_command(filename)))
+
+
+def plan_sampling(info, stride=1, start_time=None, end_time=None, crop=None, max_size=None):
+    """
+    決定要讀哪些幀與輸出大小, 回傳給 read_video / to_source 用的 dict
+    crop = (x, y, w, h) 為原始影片的像素; max_size 為輸出長邊的上限
+    """
+    fps = info['fps'] or 30.0
+    start_frame = max(0, int(round((start_time or 0) * fps)))
+    end_frame = info['frames'] or None
+    if end_time is not None:
+        end_frame = int(round(end_time * fps)) if end_frame is None else min(end_frame, int(round(end_time * fps)))
+    if crop is None:
+        crop = (0, 0, info['w'], info['h'])
+    x, y = max(0, int(crop[0])), max(0, int(crop[1]))
+    w, h = min(int(crop[2]), info['w'] - x), min(int(crop[3]), info['h'] - y)
+    scale = min(1.0, max_size / max(w, h)) if max_size else 1.0
+    return {
+        'fps': fps,
+        'start_frame': start_frame,
+        'end_frame': end_frame,
+        'stride': max(1, int(stride)),
+        'crop': (x, y, w, h),
+        'scale': scale,
+        'w': int(round(w * scale)) if scale < 1 else w,
+        'h': int(round(h * scale)) if scale < 1 else h,
+        'source_w': info['w'],
+        'source_h': info['h'],
+    }
+
+
+def sample_count(plan):
+    """read_video 會產生的幀數, 不知道影片長度時為 None"""
+    if plan['end_frame'] is None:
+        return None
+    return max(0, math.ceil((plan['end_frame'] - plan['start_frame']) / plan['stride']))
+
+
+def skip_samples(plan, n):
+    """跳過前 n 個輸出幀(續跑時用), 用 seek 跳過而不是解碼後丟掉"""
+    plan = dict(plan)
+    plan['start_frame'] += n * plan['stride']
+    return plan
+
+
+def source_frames(plan, count):
+    """輸出的前 count 幀在原始影片裡的幀號"""
+    return plan['start_frame'] + plan['stride'] * np.arange(count)
+
+
+def ffmpeg_command(filename, plan):
+    command = ['ffmpeg', '-v', 'error']
+    if plan['start_frame'] > 0:
+        command += ['-ss', '{:.6f}'.format(plan['start_frame'] / plan['fps'])]
+    command += ['-i', filename, '-an']
+    filters = []
+    if plan['stride'] > 1:
+        filters.append(r'select=not(mod(n\,{}))'.format(plan['stride']))
+    if plan['crop'] != (0, 0, plan['source_w'], plan['source_h']):
+        filters.append('crop={2}:{3}:{0}:{1}'.format(*plan['crop']))
+    if plan['scale'] < 1:
+        filters.append('scale={}:{}'.format(plan['w'], plan['h']))
+    if filters:
+        command += ['-vf', ','.join(filters)]
+    count = sample_count(plan)
+    if count is not None:
+        command += ['-frames:v', str(count)]   # 讀到區段結尾就停止解碼
+    return command + ['-f', 'image2pipe', '-pix_fmt', 'bgr24', '-vsync', '0', '-vcodec', 'rawvideo', '-']
+
+
+def read_video(filename, plan=None):
+    """產生 (h, w, 3) BGR 幀; plan 為 None 時逐幀讀完整段原始大小的影片"""
+    if plan is None:
+        plan = plan_sampling(probe_video(filename))
+    yield from _read_pipe(ffmpeg_command(filename, plan), plan['w'], plan['h'])
+
+
+def live_command(source, w, h, fps=None, timeout=5.0):
+    """
+    live.py 的輸入: /dev/videoN 為 v4l2 攝影機, 其他當作還在寫入的檔案 (錄影中的 .ts / fragmented mp4),
+    讀到結尾時等新的資料 (-follow), timeout 秒都沒有新資料才結束 (ffmpeg 會印一行 Input/output error);
+    -seekable 0: 不然 mp4 的 demuxer 只讀到開檔時的檔案大小為止; 輸出縮放成 w x h
+    """
+    command = ['ffmpeg', '-v', 'error']
+    if source.startswith('/dev/video'):
+        command += ['-f', 'v4l2'] + (['-framerate', str(fps)] if fps else []) + ['-i', source]
+    else:
+        command += ['-follow', '1', '-seekable', '0', '-rw_timeout', str(int(timeout * 1e6)), '-i', 'file:' + os.path.abspath(source)]
+    return command + ['-an', '-vf', 'scale={}:{}'.format(w, h), '-f', 'image2pipe', '-pix_fmt', 'bgr24',
+                      '-vsync', '0', '-vcodec', 'rawvideo', '-']
+
+
+def read_live(source, w, h, fps=None, timeout=5.0):
+    """攝影機或還在寫入的檔案, 一直產生 (h, w, 3) BGR 幀到來源結束為止"""
+    return _read_pipe(live_command(source, w, h, fps, timeout), w, h)
+
+
+def _read_pipe(command, w, h):
+    pipe = sp.Popen(command, stdout=sp.PIPE, bufsize=-1)
+    try:
+        while True:
+            with span('decode'):
+                data = pipe.stdout.read(w*h*3)
+            if len(data) < w*h*3:
+                break
+            yield np.frombuffer(data, dtype='uint8').reshape((h, w, 3))
+    finally:
+        # 提早停止讀取(例如只要前幾幀)時不要留下還在解碼的 ffmpeg
+        pipe.stdout.close()
+        if pipe.poll() is None:
+            pipe.kill()
+        pipe.wait()
+
+
+@profiled('decode')
+def _read_full(pipe, buffer):
+    """把 buffer 讀滿, 回傳實際讀到的 bytes 數 (pipe 結束時會少於 buffer 大小)"""
+    view, total = memoryview(buffer).cast('B'), 0
+    while total < len(view):
+        n = pipe.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+async def read_video_async(filename, plan):
+    """
+    read_video 的 asyncio 版本 (async generator): ffmpeg 由 asyncio 啟動/等待, 讀 pipe 時不佔住 event loop
+    幀直接 readinto 到 numpy 的 buffer (在預設的 thread pool 裡, 讀取時會放開 GIL);
+    用 StreamReader 的話一幀要經過多次 256 KB 的讀取與複製, 1 CPU 上解碼反而比同步版本慢約 30%
+    """
+    w, h = plan['w'], plan['h']
+    loop = asyncio.get_running_loop()
+    read_fd, write_fd = os.pipe()
+    try:
+        process = await asyncio.create_subprocess_exec(*ffmpeg_command(filename, plan), stdout=write_fd)
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    pipe = open(read_fd, 'rb', buffering=0)
+    finished = False
+    try:
+        while True:
+            frame = np.empty((h, w, 3), dtype=np.uint8)
+            if await loop.run_in_executor(None, _read_full, pipe, frame) < frame.nbytes:
+                finished = True
+                break
+            yield frame
+    finally:
+        pipe.close()
+        # 讀到結尾時 ffmpeg 已經結束, 這時 kill 會先 poll 把它回收掉, asyncio 的 child watcher 就等不到了
+        if not finished and process.returncode is None:
+            process.kill()
+        await process.wait()
+
+
+def to_source(xy, plan):
+    """把輸出幀上的 (..., 2) 像素座標換回原始影片的像素座標"""
+    xy = np.array(xy, dtype=np.float64)
+    x, y = plan['crop'][:2]
+    xy[..., 0] = xy[..., 0] / plan['scale'] + x
+    xy[..., 1] = xy[..., 1] / plan['scale'] + y
+    return xy
+
+
+def _motion_command(filename, info):
+    w = MOTION_WIDTH
+    h = max(2, int(round(info['h'] * w / info['w'])))
+    command = ['ffmpeg', '-v', 'error', '-i', filename, '-an', '-vf', 'scale={}:{}'.format(w, h),
+               '-sws_flags', 'fast_bilinear', '-f', 'rawvideo', '-pix_fmt', 'gray', '-vsync', '0', '-']
+    return command, w, h
+
+
+def _motion_range(data, w, h, info, duration, pad):
+    frames = np.frombuffer(data, dtype=np.uint8)[:len(data) // (w*h) * w*h].reshape(-1, h, w)
+    fps = info['fps'] or 30.0
+    if len(frames) < 2:
+        return 0.0, info['duration']
+    # motion[i]: 第 i 幀到第 i + 1 幀的平均亮度變化
+    motion = np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=(1, 2))
+    window = min(len(motion), max(1, int(round(duration * fps))))
+    totals = np.convolve(motion, np.ones(window), mode='valid')
+    start = int(np.argmax(totals))
+    return max(0.0, start / fps - pad), (start + window + 1) / fps + pad
+
+
+def motion_window(filename, info, duration=1.5, pad=0.25):
+    """
+    找出連續 duration 秒內畫面變化量最大的區段(揮棒), 回傳前後各多留 pad 秒的 (start_time, end_time)
+    只解碼成 64 px 寬的灰階小圖, 比讀原始大小的 BGR 幀便宜很多
+    """
+    command, w, h = _motion_command(filename, info)
+    return _motion_range(sp.run(command, stdout=sp.PIPE, check=True).stdout, w, h, info, duration, pad)
+
+
+async def motion_window_async(filename, info, duration=1.5, pad=0.25):
+    command, w, h = _motion_command(filename, info)
+    return _motion_range(await _run_async(command), w, h, info, duration, pad)
+
+
+def open_writer(filename, w, h, fps, pix_fmt='rgb24', crf=20):
+    """開一個把 stdin 的 raw 幀編成 H.264 mp4 的 ffmpeg, 用 pipe.stdin.write 寫入, 最後呼叫 close_writer"""
+    command = ['ffmpeg', '-v', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', '{}x{}'.format(w, h),
+               '-r', str(fps), '-i', '-', '-an', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(crf),
+               '-pix_fmt', 'yuv420p', '-movflags', '+faststart', filename]
+    return sp.Popen(command, stdin=sp.PIPE)
+
+
+def close_writer(pipe):
+    pipe.stdin.close()
+    if pipe.wait() != 0:
+        raise sp.CalledProcessError(pipe.returncode, pipe.args)